@@ -1,3 +1,4 @@
 from cp2kdata.output import Cp2kOutput
 from cp2kdata.pdos.pdos import Cp2kPdos
-from cp2kdata.cube.cube import Cp2kCube
+from cp2kdata.cube.cube import Cp2kCube, Cp2kCubeTraj
+from cp2kdata.trajectory.trajectory import Cp2kXYZTrajectory
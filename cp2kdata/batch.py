@@ -0,0 +1,165 @@
+"""
+Parse many single point (ENERGY_FORCE) cp2k outputs in parallel.
+
+parse_many parses the outputs in a process pool and stacks the results column
+by column. Files which fail to parse or whose SCF did not converge are
+recorded in the per-file status and do not abort the batch.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from cp2kdata.output import Cp2kOutput
+from cp2kdata.block_parser.converge import parse_tail_info
+from cp2kdata.block_parser.header_info import parse_global_info
+from cp2kdata.log import get_logger
+
+logger = get_logger(__name__)
+
+STATUS_OK = "ok"
+STATUS_NOT_CONVERGED = "not_converged"
+STATUS_FAILED = "failed"
+
+# quantities parsed from each output, in a single pass
+BATCH_FIELDS = ["energies", "forces", "stress", "cells", "coordinates", "symbols"]
+
+
+@dataclass
+class BatchResult:
+    """
+    stacked results of parse_many, in the units of Cp2kOutput
+    (energies and forces in a.u., coordinates and cells in angstrom, stresses in GPa).
+
+    paths, status, errors, natoms: one entry per file, errors is None for parsed files
+    energies: (nfiles,), cells, stresses: (nfiles, 3, 3), nan for files not
+        parsed, stresses are also nan for outputs without stress tensor
+    coords, forces: (total_natoms, 3), chemical_symbols: (total_natoms,).
+        The atoms of all parsed files are concatenated, the rows of file i
+        are atom_offsets[i]:atom_offsets[i+1]
+    """
+    paths: List[str]
+    status: np.ndarray
+    errors: List[Optional[str]]
+    natoms: np.ndarray
+    energies: np.ndarray
+    cells: np.ndarray
+    stresses: np.ndarray
+    coords: np.ndarray
+    forces: np.ndarray
+    chemical_symbols: np.ndarray
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def atom_offsets(self) -> np.ndarray:
+        return np.concatenate([[0], np.cumsum(self.natoms)])
+
+    @property
+    def ok(self) -> np.ndarray:
+        """mask of the files parsed successfully"""
+        return self.status == STATUS_OK
+
+    def get_atoms_slice(self, idx: int) -> slice:
+        atom_offsets = self.atom_offsets
+        return slice(atom_offsets[idx], atom_offsets[idx+1])
+
+
+def parse_e_f_output(path) -> Dict:
+    """parse one output into a dict of arrays, errors are returned as the status"""
+    try:
+        run_type = parse_global_info(path).run_type
+        if run_type != "ENERGY_FORCE":
+            raise ValueError(f"Run type {run_type} is not supported, only ENERGY_FORCE outputs are.")
+        converge_info = parse_tail_info(path)
+        if not converge_info.converge:
+            error = "SCF run not converged"
+            if converge_info.exceed_wall_time:
+                error += ", exceeded requested execution time"
+            return {"status": STATUS_NOT_CONVERGED, "error": error}
+        # the memory map of the output is released before the next output is parsed
+        with Cp2kOutput(path, fields=BATCH_FIELDS, converge_info=converge_info) as cp2k_output:
+            if cp2k_output.atomic_forces_list is None:
+                raise ValueError("No atomic forces found in the output.")
+            if cp2k_output.stress_tensor_list is not None:
+                stress = cp2k_output.stress_tensor_list[-1]
+            else:
+                stress = np.full((3, 3), np.nan)
+            return {
+                "status": STATUS_OK,
+                "error": None,
+                "energy": cp2k_output.energies_list[-1],
+                "cell": cp2k_output.get_init_cell(),
+                "stress": stress,
+                "coords": cp2k_output.init_atomic_coordinates,
+                "forces": cp2k_output.atomic_forces_list[-1],
+                "chemical_symbols": cp2k_output.get_chemical_symbols()
+            }
+    except Exception as e:
+        return {"status": STATUS_FAILED, "error": f"{type(e).__name__}: {e}"}
+
+
+def stack_batch_results(paths: List[str], results: List[Dict]) -> BatchResult:
+    nfiles = len(paths)
+    natoms = np.zeros(nfiles, dtype=int)
+    energies = np.full(nfiles, np.nan)
+    cells = np.full((nfiles, 3, 3), np.nan)
+    stresses = np.full((nfiles, 3, 3), np.nan)
+    coords = []
+    forces = []
+    chemical_symbols = []
+    for idx, result in enumerate(results):
+        if result["status"] != STATUS_OK:
+            continue
+        natoms[idx] = len(result["coords"])
+        energies[idx] = result["energy"]
+        cells[idx] = result["cell"]
+        stresses[idx] = result["stress"]
+        coords.append(result["coords"])
+        forces.append(result["forces"])
+        chemical_symbols.extend(result["chemical_symbols"])
+
+    return BatchResult(
+        paths=paths,
+        status=np.array([result["status"] for result in results], dtype=str),
+        errors=[result["error"] for result in results],
+        natoms=natoms,
+        energies=energies,
+        cells=cells,
+        stresses=stresses,
+        coords=np.concatenate(coords) if coords else np.empty((0, 3)),
+        forces=np.concatenate(forces) if forces else np.empty((0, 3)),
+        chemical_symbols=np.array(chemical_symbols, dtype=str)
+    )
+
+
+def parse_many(paths, n_workers: int = 1, max_pending: int = None) -> BatchResult:
+    """
+    parse the ENERGY_FORCE outputs in paths, with n_workers processes.
+    At most max_pending outputs (4 * n_workers by default) are submitted to
+    the workers at a time, so the memory is bounded by the stacked result.
+    """
+    paths = [str(path) for path in paths]
+    results = []
+    if n_workers <= 1:
+        results = [parse_e_f_output(path) for path in paths]
+    else:
+        max_pending = max_pending or 4 * n_workers
+        futures = deque()
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            for path in paths:
+                if len(futures) >= max_pending:
+                    results.append(futures.popleft().result())
+                futures.append(executor.submit(parse_e_f_output, path))
+            while futures:
+                results.append(futures.popleft().result())
+
+    batch_result = stack_batch_results(paths, results)
+    num_ok = int(batch_result.ok.sum())
+    if num_ok < len(paths):
+        logger.warning(f"{len(paths) - num_ok} of {len(paths)} outputs were not parsed, "
+                       "see the status and errors of the result.")
+    return batch_result
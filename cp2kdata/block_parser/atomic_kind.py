@@ -1,6 +1,8 @@
 import regex as re
 import numpy as np
 
+from .scanner import BlockHandler, scan_blocks
+
 
 NUM_ATOMIC_KINDS_RE = re.compile(
     r"""
@@ -16,6 +18,34 @@ ATOMIC_KINDS_RE = re.compile(
 )
 
 
+def collect_atomic_kind(match):
+    if match.re is NUM_ATOMIC_KINDS_RE:
+        return int(match["num_atomic_kind"])
+    else:
+        return match["atomic_kind"]
+
+
+def finalize_atomic_kinds(items):
+    num_atomic_kinds_list = [item for item in items if isinstance(item, int)]
+    atomic_kinds = [item for item in items if isinstance(item, str)]
+    if atomic_kinds:
+        # only return the last atomic kinds
+        return np.array(atomic_kinds[-num_atomic_kinds_list[-1]:], dtype=str)
+    else:
+        return None
+
+
+ATOMIC_KINDS_HANDLER = BlockHandler(
+    name="atomic_kinds",
+    patterns=[
+        ("- Atomic kinds:", NUM_ATOMIC_KINDS_RE),
+        ("Atomic kind:", ATOMIC_KINDS_RE)
+    ],
+    collect=collect_atomic_kind,
+    finalize=finalize_atomic_kinds
+)
+
+
 def parse_num_atomic_kinds(output_file):
     num_atomic_kinds_list = []
 
@@ -25,12 +55,4 @@ def parse_num_atomic_kinds(output_file):
 
 
 def parse_atomic_kinds(output_file):
-    num_atomic_kinds_list = parse_num_atomic_kinds(output_file)
-    atomic_kinds = []
-    for match in ATOMIC_KINDS_RE.finditer(output_file):
-        atomic_kinds.append(match["atomic_kind"])
-    if atomic_kinds:
-        # only return the last atomic kinds
-        return np.array(atomic_kinds[-num_atomic_kinds_list[-1]:], dtype=str)
-    else:
-        return None
+    return scan_blocks(output_file, [ATOMIC_KINDS_HANDLER])["atomic_kinds"]
@@ -1,10 +1,10 @@
 import regex as re
 import numpy as np
-from ase.geometry.cell import cellpar_to_cell
-from ase.geometry.cell import cell_to_cellpar
 from typing import List
 from .header_info import Cp2kInfo
+from .scanner import BlockHandler, scan_blocks
 from ..units import au2A
+from ..cell import cellpars_to_cells, cells_to_cellpars
 
 ALL_CELL_RE = re.compile(
     r"""
@@ -31,21 +31,23 @@ ALL_CELL_RE = re.compile(
 )
 
 
+def collect_cell(match):
+    # the nine components are converted in one call
+    return np.array(
+        match.group("xx", "xy", "xz", "yx", "yy", "yz", "zx", "zy", "zz"),
+        dtype=float
+    ).reshape(3, 3)
+
+
+ALL_CELLS_HANDLER = BlockHandler(
+    name="all_cells",
+    patterns=[("CELL| Vector a [angstrom]:", ALL_CELL_RE)],
+    collect=collect_cell
+)
+
+
 def parse_all_cells(output_file):
-    all_cells = []
-    for match in ALL_CELL_RE.finditer(output_file):
-        # print(match)
-        cell = [
-            [match["xx"], match["xy"], match["xz"]],
-            [match["yx"], match["yy"], match["yz"]],
-            [match["zx"], match["zy"], match["zz"]]
-        ]
-        all_cells.append(cell)
-
-    if all_cells:
-        return np.array(all_cells, dtype=float)
-    else:
-        return None
+    return scan_blocks(output_file, [ALL_CELLS_HANDLER])["all_cells"]
 
 
 ALL_MD_CELL_RE_V7 = re.compile(
@@ -86,56 +88,58 @@ ALL_MD_CELL_RE_V2023 = re.compile(
 )
 
 
-def parse_all_md_cells(output_file: List[str],
-                       cp2k_info: Cp2kInfo,
-                       init_cell_info=None):
-    # init_cell_info are used for npt_I parse.
-    # because npt_I doesn't include angle info in MD| block
+MD_CELL_HEADER_V7 = "CELL LNTHS[bohr]"
+MD_CELL_HEADER_V2023 = "MD| Cell lengths [bohr]"
+MD_CELL_HEADERS = [MD_CELL_HEADER_V7, MD_CELL_HEADER_V2023]
 
-    # notice that the cell of step 0 is excluded from MD| block
 
+def collect_md_cell_param(match):
+    return [match["a"], match["b"], match["c"],
+            match["alpha"], match["beta"], match["gamma"]]
+
+
+def get_md_cell_params_handler(cp2k_info: Cp2kInfo) -> BlockHandler:
     # choose parser according to cp2k_info.version
     if cp2k_info.version in ['9.1', '2022.2', '2023.1', '2023.2', '2024.1']:
-        ALL_MD_CELL_RE = ALL_MD_CELL_RE_V2023
+        patterns = [(MD_CELL_HEADER_V2023, ALL_MD_CELL_RE_V2023)]
     elif cp2k_info.version in ['7.1']:
-        ALL_MD_CELL_RE = ALL_MD_CELL_RE_V7
+        patterns = [(MD_CELL_HEADER_V7, ALL_MD_CELL_RE_V7)]
     else:
         WARNING = f"cp2k version={cp2k_info.version} is not supported yet \
                     for parsing MD cell from cp2k log files."
         raise NotImplementedError(WARNING)
 
-    all_md_cells = []
-    if init_cell_info is None:
-        # for NPT_F parser, cell info is complete in MD| block
-        for match in ALL_MD_CELL_RE.finditer(output_file):
-            # print(match)
-            cell = [match["a"], match["b"], match["c"],
-                    match["alpha"], match["beta"], match["gamma"]]
-            cell = np.array(cell, dtype=float)
-            # convert bohr to angstrom
-            cell[:3] = cell[:3] * au2A
-            # make sure cell length are in angstrom and cell angles are in degree before sent to cellpar_to_cell
-            #TODO: replace this cellpar_to_cell with more accurate functions in the future
-            cell = cellpar_to_cell(cell)
-            all_md_cells.append(cell)
-    else:
-        # for NPT_I parser, cell angle info is lost in MD| block
-        init_cell_param = cell_to_cellpar(init_cell_info)
-        init_cell_angles = init_cell_param[3:]
-        for match in ALL_MD_CELL_RE.finditer(output_file):
-            # print(match)
-            cell = [match["a"], match["b"], match["c"],
-                    match["alpha"], match["beta"], match["gamma"]]
-            cell = np.array(cell, dtype=float)
-            cell[3:] = init_cell_angles
-            # convert bohr to angstrom
-            cell[:3] = cell[:3] * au2A
-            # make sure cell length are in angstrom and cell angles are in degree before sent to cellpar_to_cell
-            #TODO: replace this cellpar_to_cell with more accurate functions in the future
-            cell = cellpar_to_cell(cell)
-            all_md_cells.append(cell)
-
-    if all_md_cells:
-        return np.array(all_md_cells, dtype=float)
-    else:
+    # the angles are missing for NPT_I and parsed as nan
+    return BlockHandler(
+        name="md_cell_params",
+        patterns=patterns,
+        collect=collect_md_cell_param
+    )
+
+
+def md_cell_params_to_cells(md_cell_params, init_cell_info=None):
+    # init_cell_info are used for npt_I parse.
+    # because npt_I doesn't include angle info in MD| block
+    if md_cell_params is None:
         return None
+
+    md_cell_params = np.array(md_cell_params, dtype=float).reshape(-1, 6)
+    if init_cell_info is not None:
+        # for NPT_I parser, cell angle info is lost in MD| block
+        md_cell_params[:, 3:] = cells_to_cellpars(init_cell_info)[3:]
+    # convert bohr to angstrom, cell angles are in degree
+    md_cell_params[:, :3] *= au2A
+    # all steps are converted at once
+    return cellpars_to_cells(md_cell_params)
+
+
+def parse_all_md_cells(output_file: List[str],
+                       cp2k_info: Cp2kInfo,
+                       init_cell_info=None):
+    # init_cell_info are used for npt_I parse.
+    # because npt_I doesn't include angle info in MD| block
+
+    # notice that the cell of step 0 is excluded from MD| block
+    handler = get_md_cell_params_handler(cp2k_info)
+    md_cell_params = scan_blocks(output_file, [handler])["md_cell_params"]
+    return md_cell_params_to_cells(md_cell_params, init_cell_info=init_cell_info)
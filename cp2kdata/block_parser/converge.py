@@ -1,11 +1,23 @@
 import regex as re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from monty.re import regrep
 
+from cp2kdata.compression import read_tail
+from .errors_handle import EXCEED_WALL_TIME_RE
+from .header_info import CP2K_INFO_TERMINATED_BY_REQUEST, TAIL_SIZE
+from .output_index import PROGRAM_END
+
 
 @dataclass
 class ConvergeInfo:
     converge: bool = False
+    # the fields below are only filled by parse_tail_info
+    program_ended: bool = None
+    exceed_wall_time: bool = None
+    terminated_by_request: bool = None
+    # the bytes read by parse_tail_info, the whole output if whole_file is True
+    tail: bytes = field(default=None, repr=False, compare=False)
+    whole_file: bool = False
 
 
 CONVERGE_PATTERN = \
@@ -13,6 +25,11 @@ CONVERGE_PATTERN = \
     ^\s{1,2}\*\*\*\sSCF\srun\sconverged\sin
     """
 
+NOT_CONVERGE_PATTERN = \
+    r"""(?xm)
+    \*\*\*\sSCF\srun\sNOT\sconverged\s\*\*\*
+    """
+
 
 def parse_e_f_converge(filename) -> ConvergeInfo:
 
@@ -30,6 +47,45 @@ def parse_e_f_converge(filename) -> ConvergeInfo:
     return converge_info
 
 
+def find_last(pattern, text) -> int:
+    # start of the last match, -1 if there is none
+    last = -1
+    for match in re.finditer(pattern, text):
+        last = match.start()
+    return last
+
+
+def parse_tail_info(filename, tail_size: int = TAIL_SIZE) -> ConvergeInfo:
+    """
+    converge, normal end, wall time and external request of a single point
+    from one read of the last tail_size bytes of filename. The last SCF
+    message of the tail decides the convergence, the whole file is only
+    searched if the tail has none.
+    """
+    tail = read_tail(filename, tail_size)
+    whole_file = len(tail) < tail_size
+    text = tail.decode(errors="replace")
+    if not whole_file:
+        # the first line may be cut
+        text = text[text.find("\n") + 1:]
+
+    last_converge = find_last(CONVERGE_PATTERN, text)
+    last_not_converge = find_last(NOT_CONVERGE_PATTERN, text)
+    if (last_converge < 0) and (last_not_converge < 0) and not whole_file:
+        converge = parse_e_f_converge(filename).converge
+    else:
+        converge = last_converge > last_not_converge
+
+    return ConvergeInfo(
+        converge=converge,
+        program_ended=PROGRAM_END in text,
+        exceed_wall_time=EXCEED_WALL_TIME_RE.search(text) is not None,
+        terminated_by_request=re.search(CP2K_INFO_TERMINATED_BY_REQUEST, text) is not None,
+        tail=tail,
+        whole_file=whole_file
+    )
+
+
 def parse_md_converge(filename):
 
     info_dict = regrep(
@@ -1,41 +1,59 @@
 import regex as re
 import numpy as np
 
+from .scanner import BlockHandler, scan_blocks
+from .text_rows import load_rows
+
 INIT_ATOMIC_COORDINATES_RE = re.compile(
     r"""
     \sMODULE\sQUICKSTEP:\s+ATOMIC\sCOORDINATES\sIN\sangstrom\s*\n
     \n
     \s+Atom\s+Kind\s+Element\s+X\s+Y\s+Z\s+Z\(eff\)\s+Mass\s*\n
     (\n)?
-    (
-        \s+(?P<atom>\d+)
-        \s+(?P<kind>\d+)
-        \s+(?P<element>\w+)
-        \s+\d+
-        \s+(?P<x>[-]?\d+\.\d+)
-        \s+(?P<y>[-]?\d+\.\d+)
-        \s+(?P<z>[-]?\d+\.\d+)
-        \s+[-]?\d+\.\d+
-        \s+[-]?\d+\.\d+
-        \n
-    )+
+    # rows of atom, kind, element, Z, x, y, z, Z(eff), mass
+    (?P<rows>
+        (?:[\x20]+\d+[\x20]+\d+[\x20]+\w+[^\n]*\n)+
+    )
     """,
     re.VERBOSE | re.IGNORECASE,
 )
 
+# columns of the coordinates table decoded in one structured array
+INIT_ATOMIC_COORDINATES_DTYPE = [
+    ("kind", int),
+    ("element", "U16"),
+    ("x", float),
+    ("y", float),
+    ("z", float)
+]
 
-def parse_init_atomic_coordinates(output_file):
 
-    match = INIT_ATOMIC_COORDINATES_RE.search(output_file)
+def collect_init_atomic_coordinates(match):
+    rows = load_rows(match["rows"], usecols=(1, 2, 4, 5, 6),
+                     dtype=INIT_ATOMIC_COORDINATES_DTYPE, ndmin=1)
+    init_atomic_coordinates = np.column_stack([rows["x"], rows["y"], rows["z"]])
+    atom_kind_list = rows["kind"]
+    chemical_symbols = rows["element"].tolist()
+    return init_atomic_coordinates, atom_kind_list, chemical_symbols
+
+
+def finalize_init_atomic_coordinates(items):
     # only get the first match
-    init_atomic_coordinates = []
-    chemical_symbols = []
-    for x, y, z in zip(*match.captures("x", "y", "z")):
-        init_atomic_coordinates.append([x, y, z])
-    atom_kind_list = [int(kind) for kind in match.captures("kind")]
-    chemical_symbols = match.captures("element")
-
-    if init_atomic_coordinates:
+    if items:
+        init_atomic_coordinates, atom_kind_list, chemical_symbols = items[0]
         return np.array(init_atomic_coordinates, dtype=float), np.array(atom_kind_list, dtype=int), chemical_symbols
     else:
         return None
+
+
+INIT_ATOMIC_COORDINATES_HANDLER = BlockHandler(
+    name="init_atomic_coordinates",
+    patterns=[("ATOMIC COORDINATES IN", INIT_ATOMIC_COORDINATES_RE)],
+    collect=collect_init_atomic_coordinates,
+    finalize=finalize_init_atomic_coordinates,
+    first_only=True
+)
+
+
+def parse_init_atomic_coordinates(output_file):
+    return scan_blocks(output_file, [INIT_ATOMIC_COORDINATES_HANDLER])["init_atomic_coordinates"]
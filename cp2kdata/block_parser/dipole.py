@@ -1,6 +1,8 @@
 import regex as re
 import numpy as np
 
+from .scanner import BlockHandler, scan_blocks
+
 DIPOLE_RE = re.compile(
     r"""
     \s{2}Dipole\smoment\s\[Debye\]\n
@@ -16,16 +18,21 @@ DIPOLE_RE = re.compile(
 # TODO write a pytest for this
 
 
+def collect_dipole(match):
+    for x, y, z, total in zip(*match.captures("x", "y", "z", "total")):
+        dipole = [x, y, z, total]
+    return dipole
+
+
+DIPOLE_HANDLER = BlockHandler(
+    name="dipole_list",
+    patterns=[("Dipole moment [Debye]", DIPOLE_RE)],
+    collect=collect_dipole
+)
+
+
 def parse_dipole_list(output_file):
-    dipole_list = []
-    for match in DIPOLE_RE.finditer(output_file):
-        for x, y, z, total in zip(*match.captures("x", "y", "z", "total")):
-            dipole = [x, y, z, total]
-        dipole_list.append(dipole)
-    if dipole_list:
-        return np.array(dipole_list, dtype=float)
-    else:
-        return None
+    return scan_blocks(output_file, [DIPOLE_HANDLER])["dipole_list"]
 
 
 """
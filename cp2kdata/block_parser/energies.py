@@ -1,6 +1,8 @@
 import regex as re
 import numpy as np
 
+from .scanner import BlockHandler, scan_blocks
+
 ENERGIES_RE = re.compile(
     r"""
     \sENERGY\|\sTotal\sFORCE_EVAL\s\(\sQS\s\)\senergy\s\S{6}:\s+(?P<energy>[\s-]\d+\.\d+)
@@ -9,12 +11,16 @@ ENERGIES_RE = re.compile(
 )
 
 
-def parse_energies_list(output_file):
+def collect_energy(match):
+    return match["energy"]
 
-    energies_list = []
-    for match in ENERGIES_RE.finditer(output_file):
-        energies_list.append(match["energy"])
-    if energies_list:
-        return np.array(energies_list, dtype=float)
-    else:
-        return None
+
+ENERGIES_HANDLER = BlockHandler(
+    name="energies_list",
+    patterns=[("ENERGY| Total FORCE_EVAL", ENERGIES_RE)],
+    collect=collect_energy
+)
+
+
+def parse_energies_list(output_file):
+    return scan_blocks(output_file, [ENERGIES_HANDLER])["energies_list"]
@@ -1,8 +1,10 @@
 import numpy as np
 
+from .md_xyz import load_md_table
+
 
 def parse_vertical_gap(mix_ener_file, r_col=3, p_col=4):
-    r_ener = np.loadtxt(mix_ener_file, usecols=r_col)
-    p_ener = np.loadtxt(mix_ener_file, usecols=p_col)
+    # both energies are read in the same pass over the file
+    r_ener, p_ener = load_md_table(mix_ener_file, usecols=(r_col, p_col)).T
     v_gap = p_ener - r_ener
     return v_gap
@@ -1,33 +1,34 @@
 import regex as re
 import numpy as np
 
+from .scanner import BlockHandler, scan_blocks
+from .text_rows import load_rows
+
 ATOMIC_FORCES_RE = re.compile(
     r"""
     \sATOMIC\sFORCES\sin\s\[a\.u\.\]\s*\n
     \n
     \s\#.+\n
-    (
-        \s+(?P<atom>\d+)
-        \s+(?P<kind>\d+)
-        \s+(?P<element>\w+)
-        \s+(?P<x>[\s-]\d+\.\d+)
-        \s+(?P<y>[\s-]\d+\.\d+)
-        \s+(?P<z>[\s-]\d+\.\d+)
-        \n
-    )+
+    # rows of atom, kind, element, x, y, z
+    (?P<rows>
+        (?:[\x20]+\d+[\x20]+\d+[\x20]+\w+[^\n]*\n)+
+    )
     """,
     re.VERBOSE
 )
 
 
+def collect_atomic_forces(match):
+    # all rows are decoded at once, without a str object per value
+    return load_rows(match["rows"], usecols=(3, 4, 5), dtype=float, ndmin=2)
+
+
+ATOMIC_FORCES_HANDLER = BlockHandler(
+    name="atomic_forces_list",
+    patterns=[("ATOMIC FORCES in [a.u.]", ATOMIC_FORCES_RE)],
+    collect=collect_atomic_forces
+)
+
+
 def parse_atomic_forces_list(output_file):
-    atomic_forces_list = []
-    for match in ATOMIC_FORCES_RE.finditer(output_file):
-        atomic_forces = []
-        for x, y, z in zip(*match.captures("x", "y", "z")):
-            atomic_forces.append([x, y, z])
-        atomic_forces_list.append(atomic_forces)
-    if atomic_forces_list:
-        return np.array(atomic_forces_list, dtype=float)
-    else:
-        return None
+    return scan_blocks(output_file, [ATOMIC_FORCES_HANDLER])["atomic_forces_list"]
@@ -1,4 +1,6 @@
 import regex as re
+
+from .scanner import BlockHandler, scan_blocks
 GEO_OPT_INFO_FIRST_RE = re.compile(
     r"""
     \s+-+\s+Informations\sat\sstep\s=\s+0\s+-+\n
@@ -50,35 +52,49 @@ GEO_OPT_INFO_REST_RE = re.compile(
 )
 
 
-def parse_geo_opt_info(output_file) -> float:
-    geo_opt_info = []
+def collect_geo_opt_info(match):
+    if match.re is GEO_OPT_INFO_FIRST_RE:
+        return {
+            "step": 0,
+            "total_energy": float(match["total_energy"]),
+            "used_time": float(match["used_time"])
+        }
+    else:
+        return {
+            "step": int(match["step"]),
+            "total_energy": float(match["total_energy"]),
+            "used_time": float(match["used_time"]),
+            "max_step_size": float(match["max_step_size"]),
+            "limit_step_size": float(match["limit_step_size"]),
+            "rms_step_size": float(match["rms_step_size"]),
+            "limit_rms_step": float(match["limit_rms_step"]),
+            "max_gradient": float(match["max_gradient"]),
+            "limit_gradient": float(match["limit_gradient"]),
+            "rms_gradient": float(match["rms_gradient"]),
+            "limit_rms_gradient": float(match["limit_rms_gradient"])
+        }
 
-    for match in GEO_OPT_INFO_FIRST_RE.finditer(output_file):
-        geo_opt_info.append(
-            {
-                "step": 0,
-                "total_energy": float(match["total_energy"]),
-                "used_time": float(match["used_time"])
-            }
-        )
-    for match in GEO_OPT_INFO_REST_RE.finditer(output_file):
 
-        geo_opt_info.append(
-            {
-                "step": int(match["step"]),
-                "total_energy": float(match["total_energy"]),
-                "used_time": float(match["used_time"]),
-                "max_step_size": float(match["max_step_size"]),
-                "limit_step_size": float(match["limit_step_size"]),
-                "rms_step_size": float(match["rms_step_size"]),
-                "limit_rms_step": float(match["limit_rms_step"]),
-                "max_gradient": float(match["max_gradient"]),
-                "limit_gradient": float(match["limit_gradient"]),
-                "rms_gradient": float(match["rms_gradient"]),
-                "limit_rms_gradient": float(match["limit_rms_gradient"])
-            }
-        )
+def finalize_geo_opt_info(items):
+    # the information of first steps are placed before the rest steps
+    geo_opt_info = [info for info in items if "max_step_size" not in info]
+    geo_opt_info += [info for info in items if "max_step_size" in info]
     if geo_opt_info:
         return geo_opt_info
     else:
         return None
+
+
+GEO_OPT_INFO_HANDLER = BlockHandler(
+    name="geo_opt_info",
+    patterns=[
+        ("Informations at step =", GEO_OPT_INFO_FIRST_RE),
+        ("Informations at step =", GEO_OPT_INFO_REST_RE)
+    ],
+    collect=collect_geo_opt_info,
+    finalize=finalize_geo_opt_info
+)
+
+
+def parse_geo_opt_info(output_file) -> float:
+    return scan_blocks(output_file, [GEO_OPT_INFO_HANDLER])["geo_opt_info"]
@@ -1,11 +1,16 @@
 import regex as re
 from dataclasses import dataclass
-# use monty.re because it can terminate on match
-from monty.re import regrep
+from typing import Dict
 from cp2kdata.log import get_logger
+from cp2kdata.compression import zopen, read_tail
 
 logger = get_logger(__name__)
 
+# the header ends where the first SCF step starts
+HEADER_END = "SCF WAVEFUNCTION OPTIMIZATION"
+# the termination message is searched in the last bytes of the output only
+TAIL_SIZE = 1024 * 1024
+
 @dataclass
 class Cp2kInfo:
     version: str = None
@@ -29,52 +34,32 @@ CP2K_INFO_TERMINATED_BY_REQUEST = \
     ^\s\*{3}\sMD\srun\sterminated\sby\sexternal\srequest\s\*{3}
     """
 
-def parse_cp2k_info(filename) -> Cp2kInfo:
-
-    cp2k_info = regrep(
-        filename=filename,
-        patterns={
-            "version": CP2K_INFO_VERSION_PATTERN,
-            "restart": CP2K_INFO_RESTART_PATTERN
-            },
-        terminate_on_match=True
-    )
+def parse_cp2k_info(filename, header: Dict = None, terminated_by_request: bool = None) -> Cp2kInfo:
+    if header is None:
+        header = scan_header(filename)
 
-    num_match_restart = len(cp2k_info['restart'])
-    if num_match_restart > 1:
-        raise ValueError(f"More than one restart information found in {filename}")
-    elif num_match_restart == 1:
+    if "restart" in header:
         cp2k_restart = True
         logger.debug(f"Found restart information in the output header")
-
-    elif num_match_restart == 0:
+    else:
         cp2k_restart = False
 
-
-    tmp_info = regrep(
-        filename=filename,
-        patterns={
-            "terminated_by_request": CP2K_INFO_TERMINATED_BY_REQUEST
-            },
-        reverse=True,
-        terminate_on_match=True
-    )
-
-    # parse the termination information
-    num_match_terminated_by_request = len(tmp_info['terminated_by_request'])
-    if num_match_terminated_by_request > 1:
-        raise ValueError(f"More than one termination information found in {filename}")
-    elif num_match_terminated_by_request == 1:
-        cp2k_terminated_by_request = True
-    elif num_match_terminated_by_request == 0:
-        cp2k_terminated_by_request = False
+    # the tail may be searched already, e.g. by parse_tail_info
+    if terminated_by_request is None:
+        terminated_by_request = parse_terminated_by_request(filename)
 
     return Cp2kInfo(
-        version=cp2k_info["version"][0][0][0],
+        version=header["version"][0],
         restart=cp2k_restart,
-        terminated_by_request=cp2k_terminated_by_request
+        terminated_by_request=terminated_by_request
         )
 
+
+def parse_terminated_by_request(filename, tail_size: int = TAIL_SIZE) -> bool:
+    # the message is printed close to the end, only read the tail of the file
+    tail = read_tail(filename, tail_size).decode(errors="replace")
+    return re.search(CP2K_INFO_TERMINATED_BY_REQUEST, tail) is not None
+
 @dataclass
 class GlobalInfo:
     run_type: str = None
@@ -92,19 +77,12 @@ GLOBAL_INFO_PRINT_LEVEL_PATTERN = \
     """
 
 
-def parse_global_info(filename) -> GlobalInfo:
-    global_info = {}
+def parse_global_info(filename, header: Dict = None) -> GlobalInfo:
+    if header is None:
+        header = scan_header(filename)
 
-    global_info = regrep(
-        filename=filename,
-        patterns={"run_type": GLOBAL_INFO_RUN_TYPE_PATTERN,
-                  "print_level": GLOBAL_INFO_PRINT_LEVEL_PATTERN
-                  },
-        terminate_on_match=True
-    )
-
-    return GlobalInfo(run_type=global_info["run_type"][0][0][0],
-                      print_level=global_info["print_level"][0][0][0]
+    return GlobalInfo(run_type=header["run_type"][0],
+                      print_level=header["print_level"][0]
                       )
 
 
@@ -129,20 +107,12 @@ DFT_INFO_MULTIPLICITY_PATTERN = \
     """
 
 
-def parse_dft_info(filename) -> DFTInfo:
-    dft_info = {}
+def parse_dft_info(filename, header: Dict = None) -> DFTInfo:
+    if header is None:
+        header = scan_header(filename)
 
-    dft_info = regrep(
-        filename=filename,
-        patterns={
-            "ks_type": DFT_INFO_KS_TYPE_PATTERN,
-            "multiplicity": DFT_INFO_MULTIPLICITY_PATTERN
-        },
-        terminate_on_match=True
-    )
-
-    if dft_info:
-        return DFTInfo(ks_type=dft_info["ks_type"][0][0][0], multiplicity=dft_info["multiplicity"][0][0][0])
+    if ("ks_type" in header) or ("multiplicity" in header):
+        return DFTInfo(ks_type=header["ks_type"][0], multiplicity=header["multiplicity"][0])
     else:
         return None
 
@@ -159,15 +129,44 @@ MD_INFO_ENSEMBLE_TYPE_PATTERN = \
     """
 
 
-def parse_md_info(filename):
-    md_info = {}
+def parse_md_info(filename, header: Dict = None):
+    if header is None:
+        header = scan_header(filename)
 
-    md_info = regrep(
-        filename=filename,
-        patterns={
-            "ensemble_type": MD_INFO_ENSEMBLE_TYPE_PATTERN
-        },
-        terminate_on_match=True
-    )
+    return MDInfo(ensemble_type=header["ensemble_type"][0])
 
-    return MDInfo(ensemble_type=md_info["ensemble_type"][0][0][0])
+
+# key: (literal on the line, pattern) of the information in the output header
+HEADER_PATTERNS = {
+    "version": ("CP2K|", CP2K_INFO_VERSION_PATTERN),
+    "restart": ("RESTART INFORMATION", CP2K_INFO_RESTART_PATTERN),
+    "run_type": ("GLOBAL|", GLOBAL_INFO_RUN_TYPE_PATTERN),
+    "print_level": ("GLOBAL|", GLOBAL_INFO_PRINT_LEVEL_PATTERN),
+    "ks_type": ("DFT|", DFT_INFO_KS_TYPE_PATTERN),
+    "multiplicity": ("DFT|", DFT_INFO_MULTIPLICITY_PATTERN),
+    "ensemble_type": ("MD", MD_INFO_ENSEMBLE_TYPE_PATTERN)
+}
+
+
+def scan_header(filename) -> Dict:
+    """
+    groups of the first match of every header pattern, collected in one pass
+    over the lines. The pass stops at the first SCF step, or as soon as all
+    information is found, so the size of the output doesn't matter.
+    """
+    patterns = {key: (literal, re.compile(pattern))
+                for key, (literal, pattern) in HEADER_PATTERNS.items()}
+    header = {}
+    with zopen(filename, 'r', errors="replace") as fp:
+        for line in fp:
+            if HEADER_END in line:
+                break
+            for key, (literal, pattern) in patterns.items():
+                if (key in header) or (literal not in line):
+                    continue
+                match = pattern.search(line)
+                if match:
+                    header[key] = match.groups()
+            if len(header) == len(patterns):
+                break
+    return header
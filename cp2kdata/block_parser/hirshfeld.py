@@ -1,43 +1,42 @@
 import regex as re
 import numpy as np
 
+from .scanner import BlockHandler, scan_blocks
+from .population import load_population_rows, stack_population_rows
+
 HIRSHFELD_RE = re.compile(
     r"""
     \s+Hirshfeld\sCharges\s*\n
     \n
-    \s\#.+\n
-    (
-        \s+(?P<atom>\d+)
-        \s+(?P<element>\w+)
-        \s+(?P<kind>\d+)
-        \s+(?P<ref_charge>[\s-]\d+\.\d+)
-        \s+(?P<alpha>[\s-]\d+\.\d+)
-        \s+(?P<beta>[\s-]\d+\.\d+)
-        \s+(?P<spin_moment>[\s-]\d+\.\d+)
-        \s+(?P<net_charge>[\s-]\d+\.\d+)
-        \n
-    )+
+    \s+\#.+\n
+    # rows of atom, element, kind, ref charge, populations, (spin moment,) net charge
+    (?P<rows>
+        (?:[\x20]+\d+[\x20]+\w+[\x20]+\d+[^\n]*\n)+
+    )
     """,
     re.VERBOSE
 )
 
+HIRSHFELD_UKS_COLUMNS = ["ref_charge", "alpha", "beta", "spin_moment", "net_charge"]
+HIRSHFELD_RKS_COLUMNS = ["ref_charge", "alpha", "net_charge"]
 
-def parse_hirshfeld_pop_list(output_file):
-    hirshfeld_pop_list = []
-    for match in HIRSHFELD_RE.finditer(output_file):
-        hirshfeld_pop = []
-        for element, alpha, beta, net_charge, spin_moment in zip(*match.captures("element", "alpha", "beta", "net_charge", "spin_moment")):
-            hirshfeld_pop.append(
-                {
-                    "element": element,
-                    "alpha": float(alpha),
-                    "beta": float(beta),
-                    "net_charge": float(net_charge),
-                    "spin_moment": float(spin_moment)
-                }
-            )
-        hirshfeld_pop_list.append(hirshfeld_pop)
-    if hirshfeld_pop_list:
-        return hirshfeld_pop_list[:-1]
+
+def collect_hirshfeld_pop(match):
+    rows = match["rows"]
+    # spin restricted tables have a single population column
+    if len(rows[:rows.index("\n")].split()) == 3 + len(HIRSHFELD_UKS_COLUMNS):
+        return load_population_rows(rows, HIRSHFELD_UKS_COLUMNS)
     else:
-        return None
+        return load_population_rows(rows, HIRSHFELD_RKS_COLUMNS)
+
+
+HIRSHFELD_POP_HANDLER = BlockHandler(
+    name="hirshfeld_pop_list",
+    patterns=[("Hirshfeld Charges", HIRSHFELD_RE)],
+    collect=collect_hirshfeld_pop,
+    finalize=stack_population_rows
+)
+
+
+def parse_hirshfeld_pop_list(output_file):
+    return scan_blocks(output_file, [HIRSHFELD_POP_HANDLER])["hirshfeld_pop_list"]
@@ -0,0 +1,98 @@
+"""
+Binary cache of the parsed quantities of an MD directory.
+
+Parsing the text of pos, frc, ener and cell files is slow for long runs.
+The parsed arrays are saved once to ``.cp2kdata_cache/`` as npy files,
+together with a manifest recording the size and mtime of every source
+file. Later loads memory-map the npy files instead of parsing the text
+again, as long as none of the source files has changed.
+"""
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from cp2kdata.log import get_logger
+
+logger = get_logger(__name__)
+
+CACHE_DIR = ".cp2kdata_cache"
+MANIFEST_FILE = "manifest.json"
+# bump the version whenever the layout of the cache changes
+CACHE_VERSION = 1
+
+# cache file name, Cp2kOutput attribute and field of the cached quantities
+CACHED_QUANTITIES = [
+    ("coords", "atomic_frames_list", "coordinates"),
+    ("forces", "atomic_forces_list", "forces"),
+    ("energies", "energies_list", "energies"),
+    ("cells", "all_cells", "cells")
+]
+
+
+def get_cache_dir(path_prefix: str) -> str:
+    return os.path.join(path_prefix, CACHE_DIR)
+
+
+def get_md_cache_key(source_files: List[str], **options) -> Dict:
+    """size and mtime of the source files, and the options used for parsing"""
+    sources = {}
+    for source_file in source_files:
+        if source_file:
+            stat = os.stat(source_file)
+            sources[os.path.basename(source_file)] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns
+            }
+    return {"version": CACHE_VERSION, "sources": sources, "options": options}
+
+
+def load_md_cache(cache_dir: str, key: Dict):
+    """
+    memory-mapped arrays and chemical symbols stored in the cache,
+    None if the cache doesn't exist or doesn't match the key.
+    Quantities which were not found on parsing are stored as None.
+    """
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_FILE), "r") as fp:
+            manifest = json.load(fp)
+    except (OSError, ValueError) as err:
+        logger.debug(f"Cannot load the md cache {cache_dir}: {err}")
+        return None
+    if manifest.get("key", None) != key:
+        return None
+
+    quantities = {}
+    try:
+        for name, stored in manifest["quantities"].items():
+            if stored:
+                quantities[name] = np.load(
+                    os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+            else:
+                quantities[name] = None
+    except (OSError, ValueError) as err:
+        logger.debug(f"Cannot load the md cache {cache_dir}: {err}")
+        return None
+    return quantities, manifest["chemical_symbols"]
+
+
+def save_md_cache(cache_dir: str, key: Dict, quantities: Dict, chemical_symbols=None):
+    manifest_file = os.path.join(cache_dir, MANIFEST_FILE)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+        for name, array in quantities.items():
+            if array is not None:
+                np.save(os.path.join(cache_dir, f"{name}.npy"), np.asarray(array))
+        manifest = {
+            "key": key,
+            "quantities": {name: array is not None for name, array in quantities.items()},
+            "chemical_symbols": None if chemical_symbols is None else list(chemical_symbols)
+        }
+        # the manifest is written last, an interrupted write leaves no valid cache
+        with open(manifest_file, "w") as fp:
+            json.dump(manifest, fp)
+    except OSError as err:
+        logger.warning(f"Cannot write the md cache {cache_dir}: {err}")
@@ -1,68 +1,363 @@
-# from monty.io import zopen
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List
+
 import regex as re
 import numpy as np
+from cp2kdata.log import get_logger
 from cp2kdata.utils import format_logger
+from cp2kdata.compression import zopen, is_compressed
+from cp2kdata.block_parser.text_rows import C_LOADTXT, load_rows
+
+logger = get_logger(__name__)
+
 ENERGY_RE = re.compile(
     r"""(?x)
     \sE\s=\s+(?P<energy>[\s-]\d+\.\d+)
     """
 )
 
+STEP_RE = re.compile(
+    r"""(?x)
+    \si\s=\s+(?P<step>\d+)
+    """
+)
+
+
+def split_md_table(text: str, usecols=None) -> np.ndarray:
+    """decode the rows of a table by splitting the whole text at once"""
+    rows = [line for line in text.splitlines()
+            if line.strip() and not line.lstrip().startswith("#")]
+    if not rows:
+        return np.empty((0, len(usecols) if usecols is not None else 0))
+    values = np.array(" ".join(rows).split(), dtype=np.float64).reshape(len(rows), -1)
+    if usecols is not None:
+        values = values[:, list(usecols)]
+    return values
+
+
+def load_md_table(table_file, usecols=None) -> np.ndarray:
+    """
+    columns of .ener, .cell, .stress or other cp2k table files as a
+    (nrows, ncols) float array. All columns in usecols, or all columns by
+    default, are read in a single pass, comment lines are skipped.
+    """
+    with zopen(table_file, "r") as fp:
+        if C_LOADTXT:
+            return np.loadtxt(fp, usecols=usecols, ndmin=2, dtype=np.float64)
+        return split_md_table(fp.read(), usecols=usecols)
 
 
 def parse_md_ener(ener_file):
     format_logger(info="Energies", filename=ener_file)
     #print(f"Parsing Energies from {ener_file}")
-    energies_list = np.loadtxt(ener_file, usecols=4, ndmin=1, dtype=np.float64)
+    energies_list = load_md_table(ener_file, usecols=(4,))[:, 0]
     return energies_list
 
 
-def parse_pos_xyz(posxyz_file):
+# bytes read at once when the frame offsets are scanned
+SCAN_CHUNK_SIZE = 64 * 1024 * 1024
+# lines decoded at once when xyz files are read sequentially
+XYZ_CHUNK_LINES = 1000000
+
+
+def scan_frame_offsets(xyz_file: str, natoms: int) -> np.ndarray:
+    """
+    byte offsets where the frames of xyz_file start, followed by the end
+    of the last complete frame. Every frame has natoms + 2 lines.
+    """
+    stride = natoms + 2
+    offsets = [np.zeros(1, dtype=np.int64)]
+    num_lines = 0
+    chunk_start = 0
+    with open(xyz_file, "rb") as fp:
+        while True:
+            chunk = fp.read(SCAN_CHUNK_SIZE)
+            if not chunk:
+                break
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord("\n"))
+            line_numbers = np.arange(num_lines + 1, num_lines + len(newlines) + 1)
+            # a frame ends at every stride-th line
+            offsets.append(chunk_start + newlines[line_numbers % stride == 0] + 1)
+            num_lines += len(newlines)
+            chunk_start += len(chunk)
+    return np.concatenate(offsets)
+
+
+def parse_xyz_lines(lines, natoms, nframes):
+    """
+    convert the lines of nframes complete frames into a (nframes, natoms, 3)
+    array and the comment lines
+    """
+    stride = natoms + 2
+    for frame_idx in range(nframes):
+        if int(lines[frame_idx*stride]) != natoms:
+            raise ValueError(
+                f"The number of atoms changes at frame {frame_idx}, which is not supported.")
+    comments = lines[1:nframes*stride:stride]
+    atom_lines = itertools.chain.from_iterable(
+        lines[frame_idx*stride+2:(frame_idx+1)*stride] for frame_idx in range(nframes))
+    values = load_rows(atom_lines, usecols=(1, 2, 3), dtype=np.float64, ndmin=2)
+    return values.reshape(nframes, natoms, 3), comments
+
+
+def read_xyz_chunk(xyz_file, start, end, natoms):
+    """parse the complete frames between the byte offsets start and end"""
+    with open(xyz_file, "rb") as fp:
+        fp.seek(start)
+        lines = fp.read(end - start).decode().splitlines()
+    return parse_xyz_lines(lines, natoms, len(lines) // (natoms + 2))
+
+
+def iter_xyz_line_chunks(xyz_file, chunk_lines: int = XYZ_CHUNK_LINES):
+    """
+    yield (lines, natoms, nframes) for chunks of complete frames read in
+    order, so the text of the whole file is never kept in memory.
+    An incomplete last frame is ignored.
+    """
+    with zopen(xyz_file, "r") as fp:
+        first_line = fp.readline()
+        if not first_line.strip():
+            return
+        natoms = int(first_line)
+        stride = natoms + 2
+        chunk_lines = max(1, chunk_lines // stride) * stride
+        lines = [first_line] + list(itertools.islice(fp, chunk_lines - 1))
+        while lines:
+            if len(lines) < chunk_lines:
+                # the last chunk, drop trailing blank lines
+                while lines and not lines[-1].strip():
+                    lines.pop()
+                if len(lines) % stride:
+                    logger.warning(f"The last frame of {xyz_file} is incomplete, omitted.")
+            nframes = len(lines) // stride
+            if nframes:
+                yield lines, natoms, nframes
+            lines = list(itertools.islice(fp, chunk_lines))
+
+
+def read_xyz_frames(xyz_file, n_workers: int = 1):
+    """
+    read all frames of a cp2k xyz file with a constant number of atoms,
+    return (values, comments, chemical_symbols) where values is a
+    (nframes, natoms, 3) array. An incomplete last frame is ignored.
+
+    With n_workers > 1, the file is split at frame boundaries and the
+    chunks are decoded in parallel processes.
+    """
+    if n_workers > 1:
+        if is_compressed(xyz_file):
+            return read_compressed_xyz_frames_parallel(xyz_file, n_workers)
+        return read_xyz_frames_parallel(xyz_file, n_workers)
+
+    values_list = []
+    comments = []
+    chemical_symbols = []
+    for lines, natoms, nframes in iter_xyz_line_chunks(xyz_file):
+        if not chemical_symbols:
+            chemical_symbols = [line.split()[0].lower().capitalize() for line in lines[2:natoms+2]]
+        values, chunk_comments = parse_xyz_lines(lines, natoms, nframes)
+        values_list.append(values)
+        comments.extend(comment.rstrip("\r\n") for comment in chunk_comments)
+    return stack_xyz_chunks(values_list), comments, chemical_symbols
+
+
+def stack_xyz_chunks(values_list):
+    if not values_list:
+        return np.empty((0, 0, 3), dtype=np.float64)
+    elif len(values_list) == 1:
+        return values_list[0]
+    return np.concatenate(values_list)
+
+
+def read_compressed_xyz_frames_parallel(xyz_file, n_workers: int):
+    # compressed files cannot be split at byte offsets, the chunks are
+    # decompressed in order and decoded by the workers
+    values_list = []
+    comments = []
+    chemical_symbols = []
+    futures = deque()
+
+    def collect_oldest():
+        values, chunk_comments = futures.popleft().result()
+        values_list.append(values)
+        comments.extend(comment.rstrip("\r\n") for comment in chunk_comments)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        for lines, natoms, nframes in iter_xyz_line_chunks(xyz_file):
+            if not chemical_symbols:
+                chemical_symbols = [line.split()[0].lower().capitalize() for line in lines[2:natoms+2]]
+            # bound the decompressed text waiting for the workers
+            if len(futures) >= 2 * n_workers:
+                collect_oldest()
+            futures.append(executor.submit(parse_xyz_lines, lines, natoms, nframes))
+        while futures:
+            collect_oldest()
+    return stack_xyz_chunks(values_list), comments, chemical_symbols
+
+
+def read_xyz_frames_parallel(xyz_file, n_workers: int):
+    with open(xyz_file, "r") as fp:
+        first_line = fp.readline()
+        if not first_line.strip():
+            return np.empty((0, 0, 3), dtype=np.float64), [], []
+        natoms = int(first_line)
+        fp.readline()
+        chemical_symbols = [fp.readline().split()[0].lower().capitalize()
+                            for _ in range(natoms)]
+
+    frame_offsets = scan_frame_offsets(xyz_file, natoms)
+    nframes = len(frame_offsets) - 1
+    with open(xyz_file, "rb") as fp:
+        fp.seek(frame_offsets[-1])
+        if fp.read().strip():
+            logger.warning(f"The last frame of {xyz_file} is incomplete, omitted.")
+
+    # a few chunks per worker keep the workers busy until the end
+    chunk_bounds = np.unique(np.linspace(0, nframes, 4*n_workers + 1, dtype=int))
+    values = np.empty((nframes, natoms, 3), dtype=np.float64)
+    comments = []
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(read_xyz_chunk, xyz_file,
+                            int(frame_offsets[start]), int(frame_offsets[end]), natoms)
+            for start, end in zip(chunk_bounds[:-1], chunk_bounds[1:])
+        ]
+        for start, end, future in zip(chunk_bounds[:-1], chunk_bounds[1:], futures):
+            values[start:end], chunk_comments = future.result()
+            comments.extend(chunk_comments)
+    return values, comments, chemical_symbols
+
+
+def parse_pos_xyz(posxyz_file, n_workers: int = 1):
     format_logger(info="Structures", filename=posxyz_file)
     #print(f"Parsing Structures from {posxyz_file}")
-    fp = open(posxyz_file, "r")
-    lines = fp.readlines()
-    energies_list = []
-    pos_list = []
-    while len(lines) > 0:
-        chemical_symbols = []
-        positions = []
-        natoms = int(lines.pop(0))
-        match = ENERGY_RE.search(lines.pop(0))
-        energies_list.append(match["energy"])
-        for _ in range(natoms):
-            line = lines.pop(0)
-            symbol, x, y, z = line.split()[:4]
-            symbol = symbol.lower().capitalize()
-            chemical_symbols.append(symbol)
-            positions.append([float(x), float(y), float(z)])
-        pos_list.append(positions)
-    energies_list = np.array(energies_list, dtype=np.float64)
-    pos_list = np.array(pos_list, dtype=np.float64)
+    pos_list, comments, chemical_symbols = read_xyz_frames(posxyz_file, n_workers=n_workers)
+    energies_list = np.array(
+        [ENERGY_RE.search(comment)["energy"] for comment in comments], dtype=np.float64)
     return pos_list, energies_list, chemical_symbols
 
 
-def parse_frc_xyz(frcxyz_file):
+def parse_frc_xyz(frcxyz_file, n_workers: int = 1):
     format_logger(info="Forces", filename=frcxyz_file)
     #print(f"Parsing Froces from {frcxyz_file}")
-    fp = open(frcxyz_file, "r")
-    lines = fp.readlines()
-    force_list = []
-    while len(lines) > 0:
-        symbols = []
-        positions = []
-        natoms = int(lines.pop(0))
-        lines.pop(0)
-        for _ in range(natoms):
-            line = lines.pop(0)
-            symbol, x, y, z = line.split()[:4]
-            symbol = symbol.lower().capitalize()
-            symbols.append(symbol)
-            positions.append([float(x), float(y), float(z)])
-        force_list.append(positions)
-    force_list = np.array(force_list, dtype=np.float64)
+    force_list, _, _ = read_xyz_frames(frcxyz_file, n_workers=n_workers)
     return force_list
 
+
+def read_new_xyz_frames(xyz_file, offset: int = 0):
+    """
+    parse the complete frames written to xyz_file after the byte offset,
+    return (values, comments, chemical_symbols, end) where end is the byte
+    offset after the last complete frame. A frame which is still being
+    written is left to the next call.
+    """
+    with open(xyz_file, "rb") as fp:
+        fp.seek(offset)
+        buffer = fp.read()
+    newlines = np.flatnonzero(np.frombuffer(buffer, dtype=np.uint8) == ord("\n"))
+    if len(newlines) == 0:
+        return np.empty((0, 0, 3), dtype=np.float64), [], [], offset
+    lines = buffer[:newlines[-1] + 1].decode().split("\n")[:-1]
+    if not lines[0].strip():
+        return np.empty((0, 0, 3), dtype=np.float64), [], [], offset
+
+    natoms = int(lines[0])
+    stride = natoms + 2
+    nframes = len(lines) // stride
+    if nframes == 0:
+        return np.empty((0, natoms, 3), dtype=np.float64), [], [], offset
+    values, comments = parse_xyz_lines(lines, natoms, nframes)
+    chemical_symbols = [line.split()[0].lower().capitalize() for line in lines[2:stride]]
+    return values, comments, chemical_symbols, offset + int(newlines[nframes*stride - 1]) + 1
+
+
+def read_new_md_table(table_file, usecols, offset: int = 0):
+    """
+    rows of .ener, .cell or .stress files written after the byte offset,
+    return (steps, values, end). Only complete lines are parsed.
+    """
+    with open(table_file, "rb") as fp:
+        fp.seek(offset)
+        buffer = fp.read()
+    end = buffer.rfind(b"\n") + 1
+    rows = [line.split() for line in buffer[:end].decode().splitlines()]
+    rows = [fields for fields in rows if fields and not fields[0].startswith("#")]
+    steps = np.array([int(fields[0]) for fields in rows], dtype=int)
+    values = np.array([[fields[col] for col in usecols] for fields in rows],
+                      dtype=np.float64).reshape(len(rows), len(usecols))
+    return steps, values, offset + end
+
+
+@dataclass
+class MDFrame:
+    """one md step, quantities not available are None"""
+    step: int
+    chemical_symbols: List[str] = None
+    positions: np.ndarray = None
+    forces: np.ndarray = None
+    energy: float = None
+    cell: np.ndarray = None
+    stress: np.ndarray = None
+
+
+def iter_xyz_frames(xyz_file):
+    """
+    yield (step, chemical_symbols, values, energy) frame by frame,
+    only one frame is kept in memory. An incomplete last frame is ignored.
+    """
+    with zopen(xyz_file, "r") as fp:
+        frame_idx = 0
+        while True:
+            line = fp.readline()
+            if not line.strip():
+                return
+            natoms = int(line)
+            comment = fp.readline()
+            step_match = STEP_RE.search(comment)
+            energy_match = ENERGY_RE.search(comment)
+            step = int(step_match["step"]) if step_match else frame_idx
+            energy = float(energy_match["energy"]) if energy_match else None
+
+            chemical_symbols = []
+            values = np.empty((natoms, 3), dtype=np.float64)
+            for atom_idx in range(natoms):
+                fields = fp.readline().split()
+                if len(fields) < 4:
+                    return
+                chemical_symbols.append(fields[0].lower().capitalize())
+                values[atom_idx] = fields[1:4]
+            yield step, chemical_symbols, values, energy
+            frame_idx += 1
+
+
+def iter_md_table(table_file, usecols):
+    """yield (step, values) for each row of .ener, .cell or .stress files"""
+    with zopen(table_file, "r") as fp:
+        for line in fp:
+            fields = line.split()
+            if (not fields) or fields[0].startswith("#"):
+                continue
+            yield int(fields[0]), np.array([fields[col] for col in usecols], dtype=np.float64)
+
+
+class StepCursor:
+    """look up the values of (step, values) rows in increasing step order"""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.current = next(self.rows, None)
+
+    def get(self, step):
+        while (self.current is not None) and (self.current[0] < step):
+            self.current = next(self.rows, None)
+        if (self.current is not None) and (self.current[0] == step):
+            return self.current[1]
+        return None
+
+
 # NOTE: incomplete function, do not release!
 
 
@@ -93,12 +388,7 @@ def parse_pos_xyz_from_wannier(wannier_xyz_fiel):
 def parse_md_stress(stress_file):
     format_logger(info="Stresses", filename=stress_file)
     #print(f"Parsing Stresses from {stress_file}")
-    stresses_list = np.loadtxt(
-        stress_file,
-        usecols=(2, 3, 4, 5, 6, 7, 8, 9, 10),
-        ndmin=2,
-        dtype=np.float64
-    )
+    stresses_list = load_md_table(stress_file, usecols=(2, 3, 4, 5, 6, 7, 8, 9, 10))
 
     numb_frames = stresses_list.shape[0]
 
@@ -108,12 +398,7 @@ def parse_md_stress(stress_file):
 def parse_md_cell(cell_file):
     format_logger(info="Cells", filename=cell_file)
     #print(f"Parsing Cells from {cell_file}")
-    cells_list = np.loadtxt(
-        cell_file,
-        usecols=(2, 3, 4, 5, 6, 7, 8, 9, 10),
-        ndmin=2,
-        dtype=np.float64
-    )
+    cells_list = load_md_table(cell_file, usecols=(2, 3, 4, 5, 6, 7, 8, 9, 10))
     numb_frames = cells_list.shape[0]
 
     return cells_list.reshape(numb_frames, 3, 3)
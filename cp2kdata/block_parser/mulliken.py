@@ -1,76 +1,60 @@
 import regex as re
 import numpy as np
 
-MULLIKEN_UKS_RE = re.compile(
+from .scanner import BlockHandler, scan_blocks
+from .population import load_population_rows, stack_population_rows
+
+MULLIKEN_RE = re.compile(
     r"""
-    \s{21}Mulliken\sPopulation\sAnalysis\s{1}
-    \n
-    \s\#\s{2}Atom\s{2}Element\s{2}Kind\s{2}Atomic\spopulation\s\(alpha,beta\)\sNet\scharge\s{2}Spin\smoment\n
-    (
-        \s{,7}(?P<atom>\d+)
-        \s+(?P<element>\w+)
-        \s+(?P<kind>\d+)
-        \s+(?P<alpha>[\s-]\d+\.\d+)
-        \s+(?P<beta>[\s-]\d+\.\d+)
-        \s+(?P<net_charge>[\s-]\d+\.\d+)
-        \s+(?P<spin_moment>[\s-]\d+\.\d+)
-        \n
-    )+
+    \s+Mulliken\sPopulation\sAnalysis\s*\n
+    \s*\#\s+Atom\s+Element\s+Kind\s+Atomic\spopulation.*\n
+    # rows of atom, element, kind, populations, net charge (and spin moment)
+    (?P<rows>
+        (?:[\x20]+\d+[\x20]+\w+[\x20]+\d+[^\n]*\n)+
+    )
     """,
     re.VERBOSE
 )
-MULLIKEN_RKS_RE = re.compile(
-    r"""
-    \s+Mulliken\sPopulation\sAnalysis\s*\n
-    \n
-    \s\#.+\n
-    (
-        \s+(?P<atom>\d+)
-        \s+(?P<element>\w+)
-        \s+(?P<kind>\d+)
-        \s+(?P<alpha>[\s-]\d+\.\d+)
-        \s+(?P<net_charge>[\s-]\d+\.\d+)
 
-    )+
-    """,
-    re.VERBOSE
+# float columns of the table, alpha is the total population for RKS
+MULLIKEN_UKS_COLUMNS = ["alpha", "beta", "net_charge", "spin_moment"]
+MULLIKEN_RKS_COLUMNS = ["alpha", "net_charge"]
+
+
+def collect_mulliken_uks_pop(match):
+    return load_population_rows(match["rows"], MULLIKEN_UKS_COLUMNS)
+
+
+def collect_mulliken_rks_pop(match):
+    return load_population_rows(match["rows"], MULLIKEN_RKS_COLUMNS)
+
+
+MULLIKEN_UKS_POP_HANDLER = BlockHandler(
+    name="mulliken_pop_list",
+    patterns=[("Mulliken Population Analysis", MULLIKEN_RE)],
+    collect=collect_mulliken_uks_pop,
+    finalize=stack_population_rows
 )
 
+MULLIKEN_RKS_POP_HANDLER = BlockHandler(
+    name="mulliken_pop_list",
+    patterns=[("Mulliken Population Analysis", MULLIKEN_RE)],
+    collect=collect_mulliken_rks_pop,
+    finalize=stack_population_rows
+)
 
-def parse_mulliken_pop_list(output_file, DFTInfo):
-    mulliken_pop_list = []
+
+def get_mulliken_pop_handler(DFTInfo) -> BlockHandler:
     if DFTInfo.ks_type == 'UKS':
-        for match in MULLIKEN_UKS_RE.finditer(output_file):
-            # print(match)
-            mulliken_pop = []
-            for element, alpha, beta, net_charge, spin_moment in zip(*match.captures("element", "alpha", "beta", "net_charge", "spin_moment")):
-                # print(match.captures("element", "alpha", "beta", "net_charge", "spin_moment"))
-                mulliken_pop.append(
-                    {
-                        "element": element,
-                        "alpha": float(alpha),
-                        "beta": float(beta),
-                        "net_charge": float(net_charge),
-                        "spin_moment": float(spin_moment)
-                    }
-                )
-            mulliken_pop_list.append(mulliken_pop)
+        return MULLIKEN_UKS_POP_HANDLER
     elif DFTInfo.ks_type == "RKS":
-        raise NotImplementedError(
-            "RKS Mulliken population analysis not implemented")
-        for match in MULLIKEN_RKS_RE.finditer(output_file):
-            mulliken_pop = []
-            for element, alpha, net_charge in zip(*match.captures("element", "alpha", "net_charge")):
-                mulliken_pop.append(
-                    {
-                        "element": element,
-                        "alpha": float(alpha),
-                        "net_charge": float(net_charge),
-                    }
-                )
-            mulliken_pop_list.append(mulliken_pop)
-
-    if mulliken_pop_list:
-        return mulliken_pop_list
+        return MULLIKEN_RKS_POP_HANDLER
     else:
         return None
+
+
+def parse_mulliken_pop_list(output_file, DFTInfo):
+    handler = get_mulliken_pop_handler(DFTInfo)
+    if handler is None:
+        return None
+    return scan_blocks(output_file, [handler])["mulliken_pop_list"]
@@ -0,0 +1,211 @@
+"""
+Persistent byte-offset index of the blocks in a cp2k output file.
+
+The index records where every block header (SCF steps, MD steps, ATOMIC FORCES,
+STRESS TENSOR, Mulliken, Hirshfeld, ...) starts in the file. It is saved next
+to the output as a small sidecar file (``output.cp2kdata-idx``) keyed on the
+file size, mtime and a hash of the file head and tail. Reopening the same
+output reuses the index, and the block scanner seeks straight to the blocks
+instead of searching the whole file again.
+"""
+import hashlib
+import mmap
+import os
+from typing import Dict, List
+
+import numpy as np
+import regex as re
+
+from cp2kdata.log import get_logger
+from .scanner import open_output_mmap
+from .energies import ENERGIES_HANDLER
+from .forces import ATOMIC_FORCES_HANDLER
+from .stress import STRESS_TENSOR_HANDLER
+from .cells import ALL_CELLS_HANDLER, MD_CELL_HEADERS
+from .coordinates import INIT_ATOMIC_COORDINATES_HANDLER
+from .atomic_kind import ATOMIC_KINDS_HANDLER
+from .geo_opt import GEO_OPT_INFO_HANDLER
+from .mulliken import MULLIKEN_UKS_POP_HANDLER, MULLIKEN_RKS_POP_HANDLER
+from .hirshfeld import HIRSHFELD_POP_HANDLER
+from .vibration import VIB_FREQ_HANDLER
+from .dipole import DIPOLE_HANDLER
+
+logger = get_logger(__name__)
+
+INDEX_SUFFIX = ".cp2kdata-idx"
+# bump the version whenever the set of indexed headers changes
+INDEX_VERSION = 1
+# size of the head and tail chunks used for hashing the output file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCF_STEP_HEADER = "SCF WAVEFUNCTION OPTIMIZATION"
+MD_STEP_HEADERS = ["MD| Step number", "STEP NUMBER"]
+PROGRAM_END = "PROGRAM ENDED AT"
+
+INDEXED_HANDLERS = [
+    ENERGIES_HANDLER,
+    ATOMIC_FORCES_HANDLER,
+    STRESS_TENSOR_HANDLER,
+    ALL_CELLS_HANDLER,
+    INIT_ATOMIC_COORDINATES_HANDLER,
+    ATOMIC_KINDS_HANDLER,
+    GEO_OPT_INFO_HANDLER,
+    MULLIKEN_UKS_POP_HANDLER,
+    MULLIKEN_RKS_POP_HANDLER,
+    HIRSHFELD_POP_HANDLER,
+    VIB_FREQ_HANDLER,
+    DIPOLE_HANDLER
+]
+
+
+def get_indexed_headers() -> List[str]:
+    headers = {SCF_STEP_HEADER, *MD_STEP_HEADERS, *MD_CELL_HEADERS}
+    for handler in INDEXED_HANDLERS:
+        for header, _ in handler.patterns:
+            headers.add(header)
+    return sorted(headers)
+
+
+def find_complete_steps_end(buffer: bytes) -> int:
+    """
+    byte offset up to which the steps written to buffer are complete:
+    the start of the line of the last SCF step, since the blocks of a step
+    are all printed before the next SCF step begins, or the end of buffer
+    once the program has ended.
+    """
+    scf_start = buffer.rfind(SCF_STEP_HEADER.encode())
+    if buffer.rfind(PROGRAM_END.encode()) > scf_start:
+        return len(buffer)
+    if scf_start < 0:
+        return 0
+    return buffer.rfind(b"\n", 0, scf_start) + 1
+
+
+def get_index_key(filename: str) -> Dict:
+    """file size, mtime and a hash of the head and tail of the file"""
+    stat = os.stat(filename)
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        digest.update(fp.read(HASH_CHUNK_SIZE))
+        if stat.st_size > HASH_CHUNK_SIZE:
+            fp.seek(max(HASH_CHUNK_SIZE, stat.st_size - HASH_CHUNK_SIZE))
+            digest.update(fp.read(HASH_CHUNK_SIZE))
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "digest": digest.hexdigest()
+    }
+
+
+class OutputIndex:
+    """Byte offsets of the block headers in a cp2k output file"""
+
+    def __init__(self, offsets: Dict[str, np.ndarray], key: Dict = None):
+        self.offsets = offsets
+        self.key = key
+
+    def get_offsets(self, header: str):
+        """byte offsets where the header appears, None if it is not indexed"""
+        return self.offsets.get(header, None)
+
+    def get_num_blocks(self, header: str) -> int:
+        offsets = self.get_offsets(header)
+        if offsets is None:
+            return 0
+        return len(offsets)
+
+    @classmethod
+    def build(cls, output_file, headers: List[str] = None, key: Dict = None):
+        """scan the output buffer once and record the offsets of all headers"""
+        if headers is None:
+            headers = get_indexed_headers()
+        # longer headers first, so that a header is never shadowed by its prefix
+        headers = sorted(headers, key=len, reverse=True)
+        header_re = re.compile(
+            b"|".join(re.escape(header.encode()) for header in headers))
+        offsets = {header: [] for header in headers}
+        for hit in header_re.finditer(output_file):
+            offsets[hit.group().decode()].append(hit.start())
+        offsets = {header: np.array(offset, dtype=np.int64)
+                   for header, offset in offsets.items()}
+        return cls(offsets, key=key)
+
+    def save(self, index_file: str):
+        headers = list(self.offsets)
+        counts = [len(self.offsets[header]) for header in headers]
+        if headers:
+            all_offsets = np.concatenate([self.offsets[header] for header in headers])
+        else:
+            all_offsets = np.array([], dtype=np.int64)
+        # write through a file object, otherwise numpy appends .npz
+        with open(index_file, 'wb') as fp:
+            np.savez(
+                fp,
+                version=INDEX_VERSION,
+                size=self.key["size"],
+                mtime=self.key["mtime"],
+                digest=self.key["digest"],
+                headers=np.array(headers, dtype=str),
+                counts=np.array(counts, dtype=np.int64),
+                offsets=all_offsets
+            )
+
+    @classmethod
+    def load(cls, index_file: str, key: Dict = None):
+        """load the index, return None if it doesn't match the key"""
+        try:
+            with np.load(index_file, allow_pickle=False) as data:
+                stored_key = {
+                    "size": int(data["size"]),
+                    "mtime": int(data["mtime"]),
+                    "digest": str(data["digest"])
+                }
+                if int(data["version"]) != INDEX_VERSION:
+                    return None
+                if (key is not None) and (stored_key != key):
+                    return None
+                headers = data["headers"]
+                counts = data["counts"]
+                all_offsets = data["offsets"]
+        except (OSError, ValueError, KeyError) as err:
+            logger.debug(f"Cannot load the output index {index_file}: {err}")
+            return None
+
+        offsets = {}
+        for header, offset in zip(headers, np.split(all_offsets, np.cumsum(counts)[:-1])):
+            offsets[str(header)] = offset
+        return cls(offsets, key=stored_key)
+
+
+def get_index_file(filename: str) -> str:
+    return filename + INDEX_SUFFIX
+
+
+def load_or_build_output_index(filename: str, output_file=None, save: bool = True) -> OutputIndex:
+    """
+    reuse the sidecar index of filename if it is up to date,
+    otherwise build the index and save it next to the output file.
+    """
+    index_file = get_index_file(filename)
+    key = get_index_key(filename)
+    index = OutputIndex.load(index_file, key=key)
+    if index is not None:
+        logger.debug(f"Reuse the output index {index_file}")
+        return index
+
+    logger.debug(f"Build the output index for {filename}")
+    if output_file is None:
+        output_file = open_output_mmap(filename)
+        try:
+            index = OutputIndex.build(output_file, key=key)
+        finally:
+            if isinstance(output_file, mmap.mmap):
+                output_file.close()
+    else:
+        index = OutputIndex.build(output_file, key=key)
+    if save:
+        try:
+            index.save(index_file)
+        except OSError as err:
+            logger.warning(f"Cannot write the output index {index_file}: {err}")
+    return index
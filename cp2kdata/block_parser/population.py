@@ -0,0 +1,72 @@
+"""
+Columnar storage of atomic population analyses (Mulliken, Hirshfeld).
+
+The rows of every population table are decoded in one load_rows call into a
+structured array, and the frames are stacked column by column, so a long run
+gives a few (nframes, natoms) arrays instead of one dict per atom and frame.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .text_rows import load_rows
+
+
+@dataclass
+class PopulationList:
+    """
+    atomic populations of all frames
+
+    element, kind: (natoms,) arrays
+    alpha, beta, net_charge, spin_moment, ref_charge: (nframes, natoms) arrays.
+    For spin restricted (RKS) calculations, alpha is the total population,
+    and beta and spin_moment are None. ref_charge is only printed for Hirshfeld
+    populations.
+    """
+    element: np.ndarray
+    kind: np.ndarray
+    alpha: np.ndarray
+    net_charge: np.ndarray
+    beta: Optional[np.ndarray] = None
+    spin_moment: Optional[np.ndarray] = None
+    ref_charge: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.alpha)
+
+    def __getitem__(self, frame: int) -> List[Dict]:
+        # one dict per atom, the layout of earlier versions
+        columns = [name for name in ["alpha", "beta", "net_charge", "spin_moment"]
+                   if getattr(self, name) is not None]
+        return [
+            {"element": str(element), **{name: float(getattr(self, name)[frame, atom]) for name in columns}}
+            for atom, element in enumerate(self.element)
+        ]
+
+    def __iter__(self):
+        for frame in range(len(self)):
+            yield self[frame]
+
+
+def load_population_rows(rows: str, columns: List[Optional[str]]) -> np.ndarray:
+    """
+    decode the rows of a population table into a structured array. columns
+    names the float columns after atom, element and kind, None skips a column.
+    """
+    usecols = [1, 2] + [idx + 3 for idx, name in enumerate(columns) if name]
+    dtype = [("element", "U16"), ("kind", int)] + [(name, float) for name in columns if name]
+    return load_rows(rows, usecols=usecols, dtype=dtype, ndmin=1)
+
+
+def stack_population_rows(items: List[np.ndarray]) -> Optional[PopulationList]:
+    """finalizer, stack the structured arrays of all frames column by column"""
+    if not items:
+        return None
+    frames = np.stack(items)
+    return PopulationList(
+        element=frames["element"][0],
+        kind=frames["kind"][0],
+        **{name: np.ascontiguousarray(frames[name])
+           for name in frames.dtype.names if name not in ["element", "kind"]}
+    )
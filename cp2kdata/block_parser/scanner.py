@@ -0,0 +1,251 @@
+"""
+Single-pass block scanner for cp2k output files.
+
+Instead of running one full-text ``finditer`` per quantity, the scanner
+searches the output once for the header lines of every registered block
+(" ATOMIC FORCES in [a.u.]", " STRESS TENSOR [GPa]", "ENERGY| Total FORCE_EVAL",
+"CELL| Vector a", ...) and only runs the block regular expression of a
+handler at the line where its header was found.
+
+The output can be a decoded string or a bytes-like buffer such as a
+``mmap.mmap`` of the file. For buffers, only the region between a header and
+the next header is decoded, so the decoded text never exceeds a few blocks.
+With an OutputIndex of the buffer, the header search is skipped altogether.
+File objects, e.g. decompressing readers of archived outputs, are scanned
+chunk by chunk with ``scan_stream``, or block by block with ``iter_blocks_stream``.
+"""
+import mmap
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import regex as re
+import numpy as np
+
+# bytes read at once when a file object is scanned, blocks must be shorter
+STREAM_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def stack_float_array(items: List[Any]):
+    """default finalizer, stack the collected items into a float array"""
+    if items:
+        return np.array(items, dtype=float)
+    else:
+        return None
+
+
+def open_output_mmap(filename: str):
+    """read-only memory map of the output file, used instead of fp.read()"""
+    with open(filename, 'rb') as fp:
+        try:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return b""
+
+
+@dataclass
+class BlockHandler:
+    """
+    A block parser that plugs into the BlockScanner.
+
+    name: key of the parsed result returned by the scanner
+    patterns: pairs of (header, block regex). The header is a literal string
+        found on the first line of the block, the regex is matched from the
+        beginning of that line.
+    collect: converts one regex match into one item
+    finalize: converts the list of collected items into the final result
+    first_only: stop collecting after the first match
+    """
+    name: str
+    patterns: Sequence[Tuple[str, Any]]
+    collect: Callable[[Any], Any]
+    finalize: Callable[[List[Any]], Any] = stack_float_array
+    first_only: bool = False
+
+
+class BlockScanner:
+    """Feed all registered handlers with a single scan over the output"""
+
+    def __init__(self, handlers: Sequence[BlockHandler]):
+        self.handlers = list(handlers)
+        self._dispatch: Dict[str, List[Tuple[BlockHandler, Any]]] = {}
+        for handler in self.handlers:
+            for header, block_re in handler.patterns:
+                self._dispatch.setdefault(header, []).append(
+                    (handler, block_re))
+        # longer headers first, so that a header is never shadowed by its prefix
+        headers = sorted(self._dispatch, key=len, reverse=True)
+        self._header_re = re.compile(
+            "|".join(re.escape(header) for header in headers))
+        self._header_bytes_re = re.compile(
+            b"|".join(re.escape(header.encode()) for header in headers))
+
+    def scan(self, output_file, index=None) -> Dict[str, Any]:
+        items = {handler.name: [] for handler in self.handlers}
+        if output_file is None or not self.handlers:
+            return self._finalize(items)
+
+        if (index is not None) and isinstance(output_file, str):
+            raise TypeError("the byte offsets of an index require a bytes-like output")
+        # end of the last match of each handler, matches never overlap
+        # as in finditer
+        last_end = {handler.name: 0 for handler in self.handlers}
+        for name, item in self._scan_region(output_file, last_end, set(), index=index):
+            items[name].append(item)
+        return self._finalize(items)
+
+    def scan_stream(self, fp, chunk_size: int = STREAM_CHUNK_SIZE) -> Dict[str, Any]:
+        """
+        scan a binary file object chunk by chunk, e.g. a decompressing
+        reader, see iter_stream.
+        """
+        items = {handler.name: [] for handler in self.handlers}
+        for name, item in self.iter_stream(fp, chunk_size=chunk_size):
+            items[name].append(item)
+        return self._finalize(items)
+
+    def iter_stream(self, fp, chunk_size: int = STREAM_CHUNK_SIZE):
+        """
+        yield (handler name, collected item) in the order of a binary file
+        object read chunk by chunk. Only the headers at least chunk_size bytes
+        before the end of the buffered data are handled, so that their blocks
+        are complete, the rest is carried over to the next chunk.
+        """
+        last_end = {handler.name: 0 for handler in self.handlers}
+        finished = set()
+        buffer = b""
+        while self.handlers and (len(finished) < len(self.handlers)):
+            chunk = fp.read(chunk_size)
+            buffer += chunk
+            if chunk:
+                until = buffer.rfind(b"\n", 0, max(0, len(buffer) - chunk_size)) + 1
+            else:
+                until = len(buffer)
+            yield from self._scan_region(buffer, last_end, finished, until=until)
+            if not chunk:
+                break
+            buffer = buffer[until:]
+            for name in last_end:
+                last_end[name] = max(0, last_end[name] - until)
+
+    def _scan_region(self, output_file, last_end, finished, index=None, until=None):
+        # yield the items of the headers found before until, all headers by default
+        if isinstance(output_file, str):
+            match_block = self._match_text_block
+        else:
+            match_block = self._match_buffer_block
+
+        for header, line_start, header_start, next_start in self._iter_headers(output_file, index):
+            if (until is not None) and (header_start >= until):
+                break
+            matched = set()
+            for handler, block_re in self._dispatch[header]:
+                if (handler.name in finished) or (handler.name in matched):
+                    continue
+                if last_end[handler.name] > header_start:
+                    continue
+                start = max(line_start, last_end[handler.name])
+                match, end = match_block(
+                    block_re, output_file, start, header_start, next_start)
+                if match is None:
+                    continue
+                matched.add(handler.name)
+                last_end[handler.name] = end
+                yield handler.name, handler.collect(match)
+                if handler.first_only:
+                    finished.add(handler.name)
+            if len(finished) == len(self.handlers):
+                break
+
+    def _finalize(self, items: Dict[str, List[Any]]) -> Dict[str, Any]:
+        return {handler.name: handler.finalize(items[handler.name])
+                for handler in self.handlers}
+
+    def _iter_hits(self, output_file, index=None):
+        # yield (header, header start) in the order of the file
+        if index is not None:
+            headers = list(self._dispatch)
+            offsets = [index.get_offsets(header) for header in headers]
+            if all(offset is not None for offset in offsets):
+                header_ids = np.concatenate(
+                    [np.full(len(offset), idx) for idx, offset in enumerate(offsets)])
+                offsets = np.concatenate(offsets)
+                order = np.argsort(offsets, kind="stable")
+                for idx, offset in zip(header_ids[order], offsets[order]):
+                    yield headers[idx], int(offset)
+                return
+
+        if isinstance(output_file, str):
+            for hit in self._header_re.finditer(output_file):
+                yield hit.group(), hit.start()
+        else:
+            for hit in self._header_bytes_re.finditer(output_file):
+                yield hit.group().decode(), hit.start()
+
+    def _iter_headers(self, output_file, index=None):
+        # yield (header, line start, header start, line start of next header)
+        newline = "\n" if isinstance(output_file, str) else b"\n"
+
+        previous = None
+        for header, header_start in self._iter_hits(output_file, index):
+            line_start = output_file.rfind(newline, 0, header_start) + 1
+            if previous is not None:
+                yield previous + (line_start,)
+            previous = (header, line_start, header_start)
+        if previous is not None:
+            yield previous + (len(output_file),)
+
+    @staticmethod
+    def _match_at(block_re, text: str, start: int, header_start: int):
+        # block regexes begin with the leading spaces of the header line,
+        # try the line start first and then the positions up to the header.
+        for pos in range(start, header_start + 1):
+            match = block_re.match(text, pos)
+            if match:
+                return match
+        return None
+
+    def _match_text_block(self, block_re, output_file: str, start: int,
+                          header_start: int, next_start: int):
+        match = self._match_at(block_re, output_file, start, header_start)
+        if match is None:
+            return None, start
+        return match, match.end()
+
+    def _match_buffer_block(self, block_re, output_file, start: int,
+                            header_start: int, next_start: int):
+        # only decode the region up to the next header, enlarge it in case
+        # the block runs until the end of the region.
+        end = next_start
+        while True:
+            text = bytes(output_file[start:end]).decode(errors="replace")
+            offset = len(bytes(output_file[start:header_start]).decode(errors="replace"))
+            match = self._match_at(block_re, text, 0, offset)
+            if (match is None) or (match.end() < len(text)) or (end >= len(output_file)):
+                break
+            end = output_file.find(b"\n", end + 2 * (end - start))
+            end = len(output_file) if end == -1 else end + 1
+
+        if match is None:
+            return None, start
+        return match, start + len(text[:match.end()].encode())
+
+
+def scan_blocks(output_file, handlers: Sequence[BlockHandler], index=None) -> Dict[str, Any]:
+    """parse all quantities of the handlers with one pass over output_file"""
+    return BlockScanner(handlers).scan(output_file, index=index)
+
+
+def scan_stream(fp, handlers: Sequence[BlockHandler], chunk_size: int = STREAM_CHUNK_SIZE) -> Dict[str, Any]:
+    """parse all quantities of the handlers with one pass over a binary file object"""
+    return BlockScanner(handlers).scan_stream(fp, chunk_size=chunk_size)
+
+
+def iter_blocks_stream(fp, handler: BlockHandler, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    yield the items of one handler one by one while a binary file object is
+    read chunk by chunk. Only the current chunk is kept in memory, a
+    quantity per step should get a stream of its own.
+    """
+    for _, item in BlockScanner([handler]).iter_stream(fp, chunk_size=chunk_size):
+        yield item
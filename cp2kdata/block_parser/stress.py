@@ -1,6 +1,8 @@
 import regex as re
 import numpy as np
 
+from .scanner import BlockHandler, scan_blocks
+
 STRESS_RE = re.compile(
     r"""
     (\sSTRESS\sTENSOR\s\[GPa\]
@@ -39,16 +41,24 @@ STRESS_RE = re.compile(
 )
 
 
+def collect_stress_tensor(match):
+    # the nine components are converted in one call
+    return np.array(
+        match.group("xx", "xy", "xz", "yx", "yy", "yz", "zx", "zy", "zz"),
+        dtype=float
+    ).reshape(3, 3)
+
+
+STRESS_TENSOR_HANDLER = BlockHandler(
+    name="stress_tensor_list",
+    patterns=[
+        ("STRESS TENSOR [GPa]", STRESS_RE),
+        # pattern used in v8.1
+        ("STRESS| Analytical stress tensor [GPa]", STRESS_RE)
+    ],
+    collect=collect_stress_tensor
+)
+
+
 def parse_stress_tensor_list(output_file):
-    stress_tensor_list = []
-    for match in STRESS_RE.finditer(output_file):
-        stress_tensor = [
-            [match["xx"], match["xy"], match["xz"]],
-            [match["yx"], match["yy"], match["yz"]],
-            [match["zx"], match["zy"], match["zz"]]
-        ]
-        stress_tensor_list.append(stress_tensor)
-    if stress_tensor_list:
-        return np.array(stress_tensor_list, dtype=float)
-    else:
-        return None
+    return scan_blocks(output_file, [STRESS_TENSOR_HANDLER])["stress_tensor_list"]
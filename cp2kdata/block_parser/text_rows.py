@@ -0,0 +1,44 @@
+"""
+Bulk decoding of whitespace separated rows, e.g. the atom rows of a block.
+
+np.loadtxt is implemented in C from numpy 1.23. Before, it parses line by
+line in python, so the rows are split at once and converted column by
+column instead.
+"""
+import io
+
+import numpy as np
+
+# np.loadtxt is implemented in C from numpy 1.23, before it parses line by line in python
+C_LOADTXT = np.lib.NumpyVersion(np.__version__) >= "1.23.0"
+
+
+def split_rows(rows, usecols, dtype=float, ndmin: int = 2) -> np.ndarray:
+    """
+    the columns usecols of rows, a str or an iterable of lines, with the
+    same number of columns in every row. dtype can be a structured dtype
+    with one field per column in usecols.
+    """
+    if not isinstance(rows, str):
+        rows = "\n".join(rows)
+    lines = [line for line in rows.splitlines() if line.strip()]
+    tokens = np.array(" ".join(lines).split()).reshape(len(lines), -1)
+    dtype = np.dtype(dtype)
+    if dtype.names is None:
+        values = tokens[:, usecols].astype(dtype)
+    else:
+        values = np.empty(len(lines), dtype=dtype)
+        for name, col in zip(dtype.names, usecols):
+            values[name] = tokens[:, col]
+    if values.ndim < ndmin:
+        values = values.reshape(values.shape + (1,) * (ndmin - values.ndim))
+    return values
+
+
+def load_rows(rows, usecols, dtype=float, ndmin: int = 2) -> np.ndarray:
+    """np.loadtxt of rows, a str or an iterable of lines, in one pass on every numpy version"""
+    if not C_LOADTXT:
+        return split_rows(rows, usecols, dtype=dtype, ndmin=ndmin)
+    if isinstance(rows, str):
+        rows = io.StringIO(rows)
+    return np.loadtxt(rows, usecols=usecols, dtype=dtype, ndmin=ndmin)
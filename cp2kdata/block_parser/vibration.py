@@ -1,6 +1,8 @@
 import regex as re
 import numpy as np
 
+from .scanner import BlockHandler, scan_blocks
+
 VIB_FREQ_RE = re.compile(
     r"""
     \sVIB\|Frequency\s\(cm\^-1\)(\s{0,15}(?P<vib_freq>[\s-]\d+\.\d+)){1,3}
@@ -9,15 +11,28 @@ VIB_FREQ_RE = re.compile(
 )
 
 
-def parse_vibration_freq_list(output_file):
+def collect_vibration_freqs(match):
+    return match.captures('vib_freq')
+
 
+def finalize_vibration_freq_list(items):
     vib_freq_list = []
-    for match in VIB_FREQ_RE.finditer(output_file):
-        #vib_freq_list.append(match["energy"])
-        for vib_freq in match.captures('vib_freq'):
-            vib_freq_list.append(vib_freq)
+    for vib_freqs in items:
+        vib_freq_list.extend(vib_freqs)
 
     if vib_freq_list:
         return np.array(vib_freq_list, dtype=float)
     else:
-        return None
\ No newline at end of file
+        return None
+
+
+VIB_FREQ_HANDLER = BlockHandler(
+    name="vib_freq_list",
+    patterns=[("VIB|Frequency (cm^-1)", VIB_FREQ_RE)],
+    collect=collect_vibration_freqs,
+    finalize=finalize_vibration_freq_list
+)
+
+
+def parse_vibration_freq_list(output_file):
+    return scan_blocks(output_file, [VIB_FREQ_HANDLER])["vib_freq_list"]
@@ -4,13 +4,74 @@ from copy import deepcopy
 import numpy as np
 import numpy.typing as npt
 from numpy.linalg import LinAlgError
-from ase.geometry.cell import cellpar_to_cell
-from ase.geometry.cell import cell_to_cellpar
 
 from cp2kdata.log import get_logger
 
 logger = get_logger(__name__)
 
+# angles closer than this to 90 degree are treated as right angles, as in ase
+RIGHT_ANGLE_EPS = 2 * np.spacing(90.0, dtype=np.float64)
+
+
+def cellpars_to_cells(cellpars: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    """
+    convert cell parameters [a, b, c, alpha, beta, gamma] of shape (n, 6) to
+    cell matrices of shape (n, 3, 3) in one vectorized expression.
+    The convention follows ase.geometry.cell.cellpar_to_cell: a is along x,
+    b lies in the xy plane, and angles are in degree.
+    """
+    cellpars = np.asarray(cellpars, dtype=float)
+    a, b, c, alpha, beta, gamma = np.moveaxis(cellpars, -1, 0)
+
+    right_alpha = np.abs(np.abs(alpha) - 90) < RIGHT_ANGLE_EPS
+    right_beta = np.abs(np.abs(beta) - 90) < RIGHT_ANGLE_EPS
+    cos_alpha = np.where(right_alpha, 0.0, np.cos(alpha * np.pi / 180.0))
+    cos_beta = np.where(right_beta, 0.0, np.cos(beta * np.pi / 180.0))
+    cos_gamma = np.cos(gamma * np.pi / 180.0)
+    sin_gamma = np.sin(gamma * np.pi / 180.0)
+    # exact values for right angles, avoiding rounding errors of orthorhombic cells
+    plus_right_gamma = np.abs(gamma - 90) < RIGHT_ANGLE_EPS
+    minus_right_gamma = np.abs(gamma + 90) < RIGHT_ANGLE_EPS
+    cos_gamma = np.where(plus_right_gamma | minus_right_gamma, 0.0, cos_gamma)
+    sin_gamma = np.where(plus_right_gamma, 1.0, np.where(minus_right_gamma, -1.0, sin_gamma))
+
+    cx = cos_beta
+    cy = (cos_alpha - cos_beta * cos_gamma) / sin_gamma
+    cz_sqr = 1.0 - cx * cx - cy * cy
+    if np.any(cz_sqr < 0):
+        raise ValueError("The cell angles do not form a valid cell.")
+    cz = np.sqrt(cz_sqr)
+
+    cells = np.zeros(cellpars.shape[:-1] + (3, 3))
+    cells[..., 0, 0] = a
+    cells[..., 1, 0] = b * cos_gamma
+    cells[..., 1, 1] = b * sin_gamma
+    cells[..., 2, 0] = c * cx
+    cells[..., 2, 1] = c * cy
+    cells[..., 2, 2] = c * cz
+    return cells
+
+
+def cells_to_cellpars(cells: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    """
+    convert cell matrices of shape (n, 3, 3) to cell parameters
+    [a, b, c, alpha, beta, gamma] of shape (n, 6), angles in degree.
+    The inverse of cellpars_to_cells, as ase.geometry.cell.cell_to_cellpar.
+    """
+    cells = np.asarray(cells, dtype=float)
+    # stacked row @ column products sum in the same order as np.dot of vectors
+    lengths = np.sqrt((cells[..., None, :] @ cells[..., :, None])[..., 0, 0])
+    angles = []
+    # alpha between b and c, beta between c and a, gamma between a and b
+    for j, k in [(2, 1), (0, 2), (1, 0)]:
+        ll = lengths[..., j] * lengths[..., k]
+        dot = (cells[..., j, None, :] @ cells[..., k, :, None])[..., 0, 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            angle = 180.0 / np.pi * np.arccos(dot / ll)
+        angles.append(np.where(ll > 1e-16, angle, 90.0))
+    return np.concatenate([lengths, np.stack(angles, axis=-1)], axis=-1)
+
+
 class Cp2kCell:
     def __init__(
         self,
@@ -54,7 +115,7 @@ class Cp2kCell:
             logger.info("The length of input cell_param is 3, "
                   "the cell is assumed to be orthorhombic")
         elif cell_param.shape == (6,):
-            self.cell_matrix = cellpar_to_cell(cell_param)
+            self.cell_matrix = cellpars_to_cells(cell_param)
             logger.info("The length of input cell_param is 6, "
                   "the Cp2kCell assumes it is [a, b, c, alpha, beta, gamma], "
                   "which will be converted to cell matrix")
@@ -84,7 +145,7 @@ class Cp2kCell:
         if grid_point is not None:
             self.grid_point = self.grid_point.astype(int)
 
-        self.cell_param = cell_to_cellpar(self.cell_matrix)
+        self.cell_param = cells_to_cellpars(self.cell_matrix)
 
     def copy(self):
         return deepcopy(self)
@@ -1,5 +1,6 @@
 import click
 from cp2kdata import Cp2kCube
+from cp2kdata.deepmd import convert_to_deepmd
 from .funcs import *
 
 
@@ -31,6 +32,14 @@ def cube():
 
 cli.add_command(cube)
 
+
+@click.group("dpdata")
+def dpdata():
+    click.echo('Convert CP2K Runs to DeePMD Data')
+
+
+cli.add_command(dpdata)
+
 # -- for gen test --#
 # -- Cutoff --#
 
@@ -303,10 +312,61 @@ plot.add_command(ti)
     default=135,
     help='width'
 )
-def view(cube_file, axis, mav, l1, l2, ncov, unit, width):
+@click.option(
+    '--stream',
+    is_flag=True,
+    default=False,
+    help='average while reading the cube file, without loading the whole grid'
+)
+def view(cube_file, axis, mav, l1, l2, ncov, unit, width, stream):
+    if stream:
+        if mav:
+            x, y = Cp2kCube.stream_mav(cube_file, l1, l2, ncov, axis=axis)
+        else:
+            x, y = Cp2kCube.stream_pav(cube_file, axis=axis)
+        Cp2kCube.plot_ascii(y, unit=unit, width=width)
+        return
     cube = Cp2kCube(cube_file)
     cube.view_cube_acsii(axis=axis, mav=mav, l1=l1, l2=l2,
                          ncov=ncov, unit=unit, width=width)
 
 
 cube.add_command(view)
+
+
+# -- for dpdata -- #
+@click.command()
+@click.option(
+    '--set_size',
+    type=int,
+    default=5000,
+    help='number of frames in each set.XXX'
+)
+@click.option(
+    '--n_workers',
+    type=int,
+    default=1,
+    help='number of processes parsing the runs'
+)
+@click.option(
+    '--output_name',
+    type=str,
+    default="output",
+    help='name of the cp2k output in each run directory'
+)
+@click.option(
+    '--true_symbols',
+    type=bool,
+    default=False,
+    help='use true chemical symbols instead of the kind names in cp2k input'
+)
+@click.argument('root', type=str, nargs=1)
+@click.argument('out_dir', type=str, nargs=1)
+def convert(root, out_dir, set_size, n_workers, output_name, true_symbols):
+    num_frames = convert_to_deepmd(root, out_dir, set_size=set_size, n_workers=n_workers,
+                                   output_name=output_name, true_symbols=true_symbols)
+    for system_name, system_frames in num_frames.items():
+        click.echo(f"{system_name}: {system_frames} frames")
+
+
+dpdata.add_command(convert)
@@ -0,0 +1,103 @@
+"""
+Transparent reading of compressed cp2k files.
+
+Files ending with .gz, .bz2, .xz, .lzma or .zst are decompressed on the fly
+while they are read, so archived runs can be analysed in place, without
+inflating them on disk or in memory. gzip files are decompressed in a
+background thread when python-isal is installed. zstd files require the
+zstd module of the standard library (python>=3.14) or the zstandard package.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import os
+
+import numpy as np
+
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz", ".lzma", ".zst")
+# bytes decompressed at once when only the tail of a file is needed
+TAIL_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def is_compressed(filename) -> bool:
+    return os.fspath(filename).endswith(COMPRESSED_SUFFIXES)
+
+
+def strip_compressed_suffix(filename) -> str:
+    """the name of the file before compression, e.g. Project-k1-1.pdos"""
+    filename = os.fspath(filename)
+    if is_compressed(filename):
+        return os.path.splitext(filename)[0]
+    return filename
+
+
+def open_zstd(filename):
+    try:
+        from compression import zstd
+        return zstd.open(filename, "rb")
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            f"Reading {filename} requires the zstandard package, "
+            "please install it with `pip install zstandard`.")
+    return zstandard.open(filename, "rb")
+
+
+def open_compressed(filename):
+    """binary reader which decompresses filename while it is read"""
+    suffix = os.path.splitext(filename)[1]
+    if suffix == ".gz":
+        try:
+            from isal import igzip_threaded
+        except ImportError:
+            return gzip.open(filename, "rb")
+        # the decompression runs in a separate thread, in parallel with parsing
+        return igzip_threaded.open(filename, "rb", threads=1)
+    elif suffix == ".bz2":
+        return bz2.open(filename, "rb")
+    elif suffix in [".xz", ".lzma"]:
+        return lzma.open(filename, "rb")
+    elif suffix == ".zst":
+        return open_zstd(filename)
+    else:
+        raise ValueError(f"{filename} is not a compressed file.")
+
+
+def zopen(filename, mode: str = "r", **kwargs):
+    """
+    open filename for reading, compressed files are decompressed on the fly.
+    mode is "r" for text or "rb" for bytes, kwargs such as errors are
+    passed on to the text reader.
+    """
+    filename = os.fspath(filename)
+    if not is_compressed(filename):
+        return open(filename, mode, **kwargs)
+    fp = open_compressed(filename)
+    if "b" in mode:
+        return fp
+    return io.TextIOWrapper(fp, **kwargs)
+
+
+def read_tail(filename, size: int) -> bytes:
+    """the last size bytes of filename, compressed files are streamed through"""
+    if not is_compressed(filename):
+        with open(filename, "rb") as fp:
+            fp.seek(max(0, os.path.getsize(filename) - size))
+            return fp.read()
+    tail = b""
+    with zopen(filename, "rb") as fp:
+        while True:
+            chunk = fp.read(TAIL_CHUNK_SIZE)
+            if not chunk:
+                return tail
+            tail = (tail + chunk)[-size:]
+
+
+def zloadtxt(filename, **kwargs):
+    """np.loadtxt which also reads compressed files"""
+    with zopen(filename, "r") as fp:
+        return np.loadtxt(fp, **kwargs)
@@ -1,57 +1,257 @@
+import glob
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
 
 import numpy as np
 import numpy.typing as npt
 import matplotlib.pyplot as plt
 from scipy import fft
-from ase import Atom, Atoms
+from ase import Atoms
 from monty.json import MSONable
 import asciichartpy as acp
+import regex as re
 
 from cp2kdata.log import get_logger
-from cp2kdata.utils import file_content
+from cp2kdata.compression import zopen, COMPRESSED_SUFFIXES
 from cp2kdata.utils import interpolate_spline
 from cp2kdata.utils import find_closet_idx_by_value
 from cp2kdata.units import au2A, au2eV
 from cp2kdata.cell import Cp2kCell
+from cp2kdata.cube.cube_cache import load_cube_cache, save_cube_cache
 
 logger = get_logger(__name__)
 
+# step of a cube printed along a trajectory, e.g. Si-v_hartree-1_50.cube
+CUBE_STEP_RE = re.compile(
+    r"_(?P<step>\d+)\.cube(?:" + "|".join(re.escape(suffix) for suffix in COMPRESSED_SUFFIXES) + r")?$")
+
+# bytes of cube values decoded at once
+CUBE_CHUNK_SIZE = 1024 * 1024
+# cube values are written as 6E13.5 by cp2k, e.g. "  0.20871E+00", and as
+# 13.5E by Cp2kCube.write_cube, e.g. "  2.08710E-01". Both share the columns
+# of the sign, the 6 mantissa digits, the dot and the exponent.
+CUBE_VAL_WIDTH = 13
+CUBE_MANTISSA_COLS = [2, 4, 5, 6, 7, 8]
+CUBE_EXP_COLS = [11, 12]
+# powers of ten which are exact in float64, mantissa * 10**exp is then
+# rounded once, the same as the decimal parser of numpy
+CUBE_EXACT_POW10 = 10.0 ** np.arange(23)
+
+
+def decode_fixed_width_vals(chunk: bytes) -> np.ndarray:
+    """
+    decode cube values in the fixed width layout of cp2k with integer
+    arithmetic on the digit columns, None if chunk is not in this layout
+    """
+    chunk = chunk.replace(b"\n", b"")
+    if len(chunk) % CUBE_VAL_WIDTH:
+        return None
+    chars = np.frombuffer(chunk, dtype=np.uint8).reshape(-1, CUBE_VAL_WIDTH)
+    digits = chars[:, CUBE_MANTISSA_COLS + CUBE_EXP_COLS] - np.uint8(ord("0"))
+    if ((digits > 9).any() or (chars[:, 0] != ord(" ")).any()
+            or (chars[:, 3] != ord(".")).any() or (chars[:, 9] != ord("E")).any()
+            or ((chars[:, 1] != ord(" ")) & (chars[:, 1] != ord("-"))).any()
+            or ((chars[:, 10] != ord("+")) & (chars[:, 10] != ord("-"))).any()):
+        return None
+    digits = digits.astype(np.int32)
+    mantissa = digits[:, 0]
+    for col in range(1, len(CUBE_MANTISSA_COLS)):
+        mantissa = mantissa * 10 + digits[:, col]
+    exp = digits[:, -2] * 10 + digits[:, -1]
+    # the mantissa has 5 decimals
+    exp = np.where(chars[:, 10] == ord("-"), -exp, exp) - 5
+    inexact = np.abs(exp) >= len(CUBE_EXACT_POW10)
+    pow10 = CUBE_EXACT_POW10[np.minimum(np.abs(exp), len(CUBE_EXACT_POW10) - 1)]
+    vals = np.where(exp < 0, mantissa / pow10, mantissa * pow10)
+    np.negative(vals, out=vals, where=chars[:, 1] == ord("-"))
+    if inexact.any():
+        # e.g. densities below 1E-18, left to the decimal parser
+        vals[inexact] = np.array(chars[inexact].tobytes().split(), dtype=float)
+    return vals
+
+
+def iter_cube_vals(fp, chunk_size: int = CUBE_CHUNK_SIZE):
+    """
+    decoded values of the cube body, a chunk of lines at a time, so that
+    the body is never held in memory as text. fp is opened in binary mode
+    and positioned after the header.
+    """
+    rest = b""
+    while True:
+        data = fp.read(chunk_size)
+        chunk = rest + data
+        if data:
+            # values are never split, the chunk is cut after its last line
+            end = chunk.rfind(b"\n") + 1
+            chunk, rest = chunk[:end], chunk[end:]
+        if chunk:
+            vals = decode_fixed_width_vals(chunk)
+            if vals is None:
+                vals = np.array(chunk.split(), dtype=float)
+            yield vals
+        if not data:
+            return
+
+
+# values written per line of the cube body
+CUBE_VALS_PER_LINE = 6
+# rows of cube values formatted at once
+CUBE_WRITE_CHUNK_VALS = 32 * 1024
+# scaled mantissas closer than this to a rounding tie are formatted by python,
+# the error of the scaling is far below it
+CUBE_ROUNDING_TOL = 1e-7
+# powers of ten used for scaling, values with 3 digit exponents are left to python
+CUBE_POW10_RANGE = 110
+CUBE_POW10 = 10.0 ** np.arange(-CUBE_POW10_RANGE, CUBE_POW10_RANGE + 1)
+
+
+def format_cube_val(val: float, cp2k_style: bool = False) -> str:
+    """one cube value, as 13.5E or in the E13.5 style of cp2k, e.g. 0.20871E+00"""
+    if (not cp2k_style) or (not np.isfinite(val)):
+        return f"{val:13.5E}"
+    mantissa, exp = f"{val:.4E}".split("E")
+    sign = "-" if mantissa.startswith("-") else ""
+    digits = mantissa.lstrip("-").replace(".", "")
+    exp = int(exp) + 1 if val != 0 else 0
+    # fortran drops the E of 3 digit exponents
+    exp = f"E{exp:+03d}" if abs(exp) < 100 else f"{exp:+04d}"
+    return f"{sign}0.{digits}{exp}".rjust(CUBE_VAL_WIDTH)
+
+
+def format_cube_vals(vals, cp2k_style: bool = False) -> np.ndarray:
+    """
+    (nvals, 13) characters of the values formatted as format_cube_val does,
+    the digits are computed with array arithmetic. The few values close to
+    a rounding tie or out of the 2 digit exponent range are left to python.
+    """
+    vals = np.asarray(vals, dtype=float).ravel()
+    num_digits = 5 if cp2k_style else 6
+    abs_vals = np.abs(vals)
+
+    def scale(exp):
+        pow10_idx = np.clip(num_digits - 1 - exp, -CUBE_POW10_RANGE, CUBE_POW10_RANGE) + CUBE_POW10_RANGE
+        return abs_vals * CUBE_POW10[pow10_idx]
+
+    with np.errstate(all="ignore"):
+        exp = np.floor(np.log10(abs_vals))
+        exp = np.where(np.isfinite(exp), exp, 0).astype(np.int32)
+        scaled = scale(exp)
+        # log10 may be off by one next to powers of ten
+        shift = (scaled >= 10 ** num_digits).astype(np.int32) - (scaled < 10 ** (num_digits - 1))
+        shift[abs_vals == 0] = 0
+        if shift.any():
+            exp += shift
+            scaled = scale(exp)
+        mantissa = np.rint(scaled)
+        frac = scaled - np.floor(scaled)
+    # rounding up to the next power of ten
+    carry = mantissa == 10 ** num_digits
+    mantissa[carry] = 10 ** (num_digits - 1)
+    exp[carry] += 1
+    if cp2k_style:
+        exp[abs_vals != 0] += 1
+    fallback = ~np.isfinite(scaled) | (np.abs(frac - 0.5) < CUBE_ROUNDING_TOL) | (np.abs(exp) >= 100)
+    mantissa = np.where(fallback, 0, mantissa).astype(np.int32)
+    exp = np.where(fallback, 0, exp)
+
+    chars = np.empty((len(vals), CUBE_VAL_WIDTH), dtype=np.uint8)
+    chars[:, 0] = ord(" ")
+    chars[:, 1] = np.where(np.signbit(vals), ord("-"), ord(" "))
+    chars[:, 3] = ord(".")
+    chars[:, 9] = ord("E")
+    chars[:, 10] = np.where(exp < 0, ord("-"), ord("+"))
+    mantissa_cols = CUBE_MANTISSA_COLS[1:] if cp2k_style else CUBE_MANTISSA_COLS
+    if cp2k_style:
+        chars[:, CUBE_MANTISSA_COLS[0]] = ord("0")
+    for idx, col in enumerate(mantissa_cols):
+        chars[:, col] = mantissa // 10 ** (num_digits - 1 - idx) % 10 + ord("0")
+    abs_exp = np.abs(exp)
+    chars[:, CUBE_EXP_COLS[0]] = abs_exp // 10 + ord("0")
+    chars[:, CUBE_EXP_COLS[1]] = abs_exp % 10 + ord("0")
+    if fallback.any():
+        formatted = "".join(format_cube_val(val, cp2k_style) for val in vals[fallback].tolist())
+        chars[fallback] = np.frombuffer(formatted.encode(), dtype=np.uint8).reshape(-1, CUBE_VAL_WIDTH)
+    return chars
+
+
+def get_cube_row_layout(num_vals: int):
+    """
+    byte positions of the values and the line breaks in a row of num_vals
+    values, 6 values per line, and the length of the row
+    """
+    starts = np.arange(num_vals) * CUBE_VAL_WIDTH + np.arange(num_vals) // CUBE_VALS_PER_LINE
+    val_pos = (starts[:, np.newaxis] + np.arange(CUBE_VAL_WIDTH)).ravel()
+    num_lines = -(-num_vals // CUBE_VALS_PER_LINE)
+    # every line ends with a line break, the last one may be shorter
+    ends = np.minimum((np.arange(num_lines) + 1) * CUBE_VALS_PER_LINE, num_vals)
+    newline_pos = ends * CUBE_VAL_WIDTH + np.arange(num_lines)
+    return val_pos, newline_pos, num_vals * CUBE_VAL_WIDTH + num_lines
+
+
+def iter_cube_rows_bytes(cube_vals, cp2k_style: bool = False):
+    """
+    the cube body in the write order of cp2k, x, then y, then z fastest,
+    with one line break after each z row, a chunk of rows at a time
+    """
+    cube_vals = np.asarray(cube_vals)
+    rows = cube_vals.reshape(-1, cube_vals.shape[-1])
+    val_pos, newline_pos, row_len = get_cube_row_layout(rows.shape[1])
+    rows_per_chunk = max(1, CUBE_WRITE_CHUNK_VALS // max(1, rows.shape[1]))
+    for start in range(0, len(rows), rows_per_chunk):
+        chunk = rows[start:start+rows_per_chunk]
+        out = np.empty((len(chunk), row_len), dtype=np.uint8)
+        out[:, val_pos] = format_cube_vals(chunk, cp2k_style).reshape(len(chunk), -1)
+        out[:, newline_pos] = ord("\n")
+        yield out.tobytes()
+
+
 class Cp2kCube(MSONable):
     # add MSONable use as_dict and from_dict
     """
     Documentation for the Cp2kCube class.
     """
 
-    def __init__(self, fname: str = None, cube_vals: np.ndarray = None, cell: Cp2kCell = None, stc: Atoms = None):
+    def __init__(self, fname: str = None, cube_vals: np.ndarray = None, cell: Cp2kCell = None, stc: Atoms = None,
+                 use_cache: bool = False):
         """
         New Cp2kCube return raw values in cp2k cube file
         Units in Cp2kCube class
         length in bohr and energy in hartree for potential file
         length in bohr and density in e/bohr^3 for density file
         to convert unit: try from cp2kdata.utils import au2A, au2eV
+        use_cache: save the parsed cube to a binary sidecar file, and
+        memory-map the values of the sidecar when the cube is loaded again
         """
         self.file = fname
 
-        if cell is None:
-            _grid_point = self._parse_grid_point(self.file)
-            _gs_matrix = self._parse_gs_matrix(self.file)
-            self.cell = self._parse_cell(_grid_point, _gs_matrix)
-        else:
-            self.cell = cell
-        if stc is None:
-            _num_atoms = self._parse_num_atoms(self.file)
-            self.stc = self._parse_stc(_num_atoms, self.file, self.cell)
-        else:
-            self.stc = stc
-
-        if cube_vals is None:
-            self.cube_vals = self._parse_cube_vals(self.file,
-                                                 self.num_atoms,
-                                                 self.cell.grid_point
-                                                 )
-        else:
-            self.cube_vals = cube_vals
+        use_cache = use_cache and (cell is None) and (stc is None) and (cube_vals is None)
+        if use_cache:
+            cache = load_cube_cache(self.file)
+            if cache is not None:
+                logger.debug(f"Load the cube values of {self.file} from the cache")
+                cell = self._parse_cell(cache["grid_point"], cache["gs_matrix"])
+                stc = self._build_stc(cache["numbers"], cache["positions"], cell)
+                cube_vals = cache["cube_vals"]
+                use_cache = False
+
+        if (cell is None) or (stc is None) or (cube_vals is None):
+            # the header, the structure and the values are read with one open
+            with zopen(self.file, "rb") as fp:
+                num_atoms, grid_point, gs_matrix = self._parse_header(fp)
+                if cell is None:
+                    cell = self._parse_cell(grid_point, gs_matrix)
+                atom_lines = [fp.readline() for _ in range(num_atoms)]
+                if stc is None:
+                    stc = self._parse_stc(atom_lines, cell)
+                if cube_vals is None:
+                    cube_vals = self._parse_cube_vals(fp, self.file, grid_point)
+            if use_cache:
+                save_cube_cache(self.file, cube_vals, grid_point, gs_matrix, stc.numbers, stc.positions)
+        self.cell = cell
+        self.stc = stc
+        self.cube_vals = cube_vals
 
     @property
     def num_atoms(self):
@@ -98,45 +298,101 @@ class Cp2kCube(MSONable):
     def get_pav(self, axis='z', interpolate=False):
 
         # do the planar average along specific axis
-        lengths = self.cell.get_cell_lengths()
-        grid_point = self.cell.grid_point
-        gs_matrix = self.cell.grid_spacing_matrix
+        mean_axes = {'x': (1, 2), 'y': (0, 2), 'z': (0, 1)}
+        if axis not in mean_axes:
+            print("not such plane average style, the avaialble options are 'x', 'y', 'z'")
+        vals = self.cube_vals.mean(axis=mean_axes[axis])
+        return self._get_pav_points(self.cell, axis, vals, interpolate=interpolate)
+
+    @staticmethod
+    def stream_pav(fname: str, axis='z', interpolate=False):
+        """
+        planar average of a cube file, accumulated while its values are read
+        in the write order of cp2k (z fastest), so only a chunk of the grid is
+        held in memory. The result equals Cp2kCube(fname).get_pav(axis, interpolate)
+        up to the order of summation.
+        """
+        cell, vals = Cp2kCube._stream_pav_vals(fname, axis)
+        return Cp2kCube._get_pav_points(cell, axis, vals, interpolate=interpolate)
+
+    @staticmethod
+    def stream_mav(fname: str, l1, l2=0, ncov=1, interpolate=False, axis="z"):
+        """macro average of a cube file from its streamed planar average"""
+        cell, vals = Cp2kCube._stream_pav_vals(fname, axis)
+        pav_x, pav = Cp2kCube._get_pav_points(cell, axis, vals, interpolate=interpolate)
+        length = cell.get_cell_lengths()['xyz'.index(axis)]
+        return pav_x, Cp2kCube.macro_average(pav_x, pav, length, l1, l2=l2, ncov=ncov)
+
+    @staticmethod
+    def _stream_pav_vals(fname: str, axis='z'):
+        # cell and planar average of a cube file read chunk by chunk
+        axis_idx = 'xyz'.index(axis)
+        with zopen(fname, "rb") as fp:
+            num_atoms, grid_point, gs_matrix = Cp2kCube._parse_header(fp)
+            cell = Cp2kCube._parse_cell(grid_point, gs_matrix)
+            for _ in range(num_atoms):
+                fp.readline()
+            num_y, num_z = grid_point[1], grid_point[2]
+            num_rows = grid_point[0]*num_y
+            sums = np.zeros(grid_point[axis_idx])
+            # complete z rows read so far, and the values of the incomplete row
+            row_start = 0
+            rest = np.empty(0)
+            for chunk_vals in iter_cube_vals(fp):
+                vals = np.concatenate([rest, chunk_vals])
+                num_chunk_rows = len(vals)//num_z
+                rows = vals[:num_chunk_rows*num_z].reshape(num_chunk_rows, num_z)
+                rest = vals[num_chunk_rows*num_z:]
+                if row_start + num_chunk_rows > num_rows:
+                    raise ValueError(
+                        f"{fname} contains more values than the {grid_point} grid points.")
+                if axis == 'z':
+                    sums += rows.sum(axis=0)
+                else:
+                    row_idx = np.arange(row_start, row_start+num_chunk_rows)
+                    plane_idx = row_idx//num_y if axis == 'x' else row_idx % num_y
+                    sums += np.bincount(plane_idx, weights=rows.sum(axis=1), minlength=len(sums))
+                row_start += num_chunk_rows
+        if (row_start != num_rows) or len(rest):
+            raise ValueError(f"{fname} doesn't contain the values of all {grid_point} grid points.")
+        return cell, sums/(np.prod(grid_point)//grid_point[axis_idx])
+
+    @staticmethod
+    def _get_pav_points(cell: Cp2kCell, axis, vals, interpolate=False):
+        # grid points along the axis of the planar average vals
+        lengths = cell.get_cell_lengths()
+        grid_point = cell.grid_point
+        gs_matrix = cell.grid_spacing_matrix
         if axis == 'x':
-            vals = self.cube_vals.mean(axis=(1, 2))
             points = np.arange(0, grid_point[0])*gs_matrix[0][0]
             length = lengths[0]
 
             np.testing.assert_array_equal(
-                self.cell.get_cell_angles()[[1, 2]],
+                cell.get_cell_angles()[[1, 2]],
                 np.array([90.0, 90.0]),
                 err_msg=f"The axis x is not perpendicular to yz plane, the pav can not be used!"
             )
 
         elif axis == 'y':
-            vals = self.cube_vals.mean(axis=(0, 2))
             points = np.arange(0, grid_point[1])*gs_matrix[1][1]
             length = lengths[1]
 
             np.testing.assert_array_equal(
-                self.cell.get_cell_angles()[[0, 2]],
+                cell.get_cell_angles()[[0, 2]],
                 np.array([90.0, 90.0]),
                 err_msg=f"The axis y is not perpendicular to xz plane, the pav can not be used!"
             )
 
         elif axis == 'z':
-            vals = self.cube_vals.mean(axis=(0, 1))
             points = np.arange(0, grid_point[2])*gs_matrix[2][2]
             length = lengths[2]
 
             np.testing.assert_array_equal(
-                self.cell.get_cell_angles()[[0, 1]],
+                cell.get_cell_angles()[[0, 1]],
                 np.array([90.0, 90.0]),
                 err_msg=f"The axis z is not perpendicular to xy plane, the pav can not be used!"
             )
 
-        else:
-            print("not such plane average style, the avaialble options are 'x', 'y', 'z'")
-
         # interpolate or note
         if interpolate:
             # set the last point same as first point
@@ -161,14 +417,7 @@ class Cp2kCube(MSONable):
         length = cell_length[axis]
 
         pav_x, pav = self.get_pav(axis=axis, interpolate=interpolate)
-        theta_1_fft = fft.fft(self.square_wave_filter(pav_x, l1, length))
-        pav_fft = fft.fft(pav)
-        mav_fft = pav_fft*theta_1_fft*length/len(pav_x)
-        if ncov == 2:
-            theta_2_fft = fft.fft(self.square_wave_filter(pav_x, l2, length))
-            mav_fft = mav_fft*theta_2_fft*length/len(pav_x)
-        mav = fft.ifft(mav_fft)
-        return pav_x, np.real(mav)
+        return pav_x, self.macro_average(pav_x, pav, length, l1, l2=l2, ncov=ncov)
 
     def quick_plot(self, axis="z", interpolate=False):
 
@@ -191,7 +440,10 @@ class Cp2kCube(MSONable):
             x, y = self.get_mav(l1, l2, ncov, axis=axis)
         else:
             x, y = self.get_pav(axis=axis)
+        self.plot_ascii(y, unit=unit, width=width)
 
+    @staticmethod
+    def plot_ascii(y, unit='au', width=135):
         if unit == 'au':
             pass
         elif unit == 'eV':
@@ -201,40 +453,33 @@ class Cp2kCube(MSONable):
         step = int(len(y)/width)
         print(acp.plot(y[::step], {'height': 20}))
 
-    def write_cube(self, fname, comments='#'):
+    def write_cube(self, fname, comments='#', cp2k_style: bool = False):
+        """
+        write the cube file, the values are formatted as 2.08710E-01 by default,
+        cp2k_style=True writes them as cp2k does, e.g. 0.20871E+00
+        """
         grid_point = self.cell.grid_point
         gs_matrix = self.cell.grid_spacing_matrix
-        with open(fname, 'w') as fw:
+        with open(fname, 'wb') as fw:
             # write header
-            fw.write('Cube file generated by CP2KData\n')
-            fw.write(comments+'\n')
+            header = 'Cube file generated by CP2KData\n'
+            header += comments+'\n'
             # grid information
-            fw.write(f'{self.num_atoms:5d}{0:12.6f}{0:12.6f}{0:12.6f}\n')
-            fw.write(
-                f'{grid_point[0]:5d}{gs_matrix[0][0]:12.6f}{gs_matrix[0][1]:12.6f}{gs_matrix[0][2]:12.6f}\n')
-            fw.write(
-                f'{grid_point[1]:5d}{gs_matrix[1][0]:12.6f}{gs_matrix[1][1]:12.6f}{gs_matrix[1][2]:12.6f}\n')
-            fw.write(
-                f'{grid_point[2]:5d}{gs_matrix[2][0]:12.6f}{gs_matrix[2][1]:12.6f}{gs_matrix[2][2]:12.6f}\n')
+            header += f'{self.num_atoms:5d}{0:12.6f}{0:12.6f}{0:12.6f}\n'
+            header += f'{grid_point[0]:5d}{gs_matrix[0][0]:12.6f}{gs_matrix[0][1]:12.6f}{gs_matrix[0][2]:12.6f}\n'
+            header += f'{grid_point[1]:5d}{gs_matrix[1][0]:12.6f}{gs_matrix[1][1]:12.6f}{gs_matrix[1][2]:12.6f}\n'
+            header += f'{grid_point[2]:5d}{gs_matrix[2][0]:12.6f}{gs_matrix[2][1]:12.6f}{gs_matrix[2][2]:12.6f}\n'
             # structure information
             for atom in self.stc:
-                fw.write(
-                    f'{atom.number:5d}{0:12.6f}{atom.position[0]/au2A:12.6f}{atom.position[1]/au2A:12.6f}{atom.position[2]/au2A:12.6f}\n')
+                header += f'{atom.number:5d}{0:12.6f}{atom.position[0]/au2A:12.6f}{atom.position[1]/au2A:12.6f}{atom.position[2]/au2A:12.6f}\n'
+            fw.write(header.encode())
             # cube values
             # cp2k write cube loop in z, y, x order
             # https://github.com/cp2k/cp2k/blob/01090ebf0718ff6885d11f89fe10938d80eb0a02/src/pw/realspace_grid_cube.F#L99
-            for i in range(grid_point[0]):
-                for j in range(grid_point[1]):
-                    for k in range(grid_point[2]):
-                        # notice that cp2k write scientific notion differntly
-                        # cp2k:   0.20871E+00
-                        # python: 2.08710E-01
-                        fw.write(f'{self.cube_vals[i,j,k]:13.5E}')
-                        if (k+1) % 6 == 0:
-                            fw.write('\n')
-                    # write a new line character after each z value
-                    if grid_point[2] % 6 != 0:
-                        fw.write('\n')
+            # 6 values per line and a new line character after each z row,
+            # whole rows are formatted at once
+            for row_bytes in iter_cube_rows_bytes(self.cube_vals, cp2k_style=cp2k_style):
+                fw.write(row_bytes)
 
     def get_integration(self,
                         start_x: float=None,
@@ -308,7 +553,8 @@ class Cp2kCube(MSONable):
         return self.cell.copy()
 
     def reduce_resolution(self, stride, axis='xyz'):
-        new_cube = self.copy()
+        # the values are not copied, memory-mapped values stay on disk
+        new_cube = Cp2kCube(fname=self.file, cube_vals=self.cube_vals, cell=self.cell.copy(), stc=self.stc.copy())
 
         stride_dict = {
             "xyz": np.array([stride, stride, stride]),
@@ -337,39 +583,19 @@ class Cp2kCube(MSONable):
 
     # methods begin with _ are private methods
     @staticmethod
-    def _parse_gs_matrix(fname: str) -> npt.NDArray[np.float64]:
-        content_list = file_content(fname, (3, 6))
-        content_list = content_list.split()
-
-        gs_matrix = [
-            [float(content_list[1]), float(
-                content_list[2]), float(content_list[3])],
-            [float(content_list[5]), float(
-                content_list[6]), float(content_list[7])],
-            [float(content_list[9]), float(
-                content_list[10]), float(content_list[11])]
-        ]
-        gs_matrix = np.array(gs_matrix)
-        return gs_matrix
-
-    @staticmethod
-    def _parse_grid_point(fname: str) -> npt.NDArray[np.int64]:
-        # read grid point and grid size, unit: angstrom
-        content_list = file_content(fname, (3, 6))
-        content_list = content_list.split()
-        num_x = int(content_list[0])
-        num_y = int(content_list[4])
-        num_z = int(content_list[8])
-        return np.array([num_x, num_y, num_z])
-
-    @staticmethod
-    def _parse_num_atoms(fname: str) -> int:
+    def _parse_header(fp):
         """
-        be used to parse the number of atoms from the cube file only
+        number of atoms, grid points and grid spacing matrix from the first
+        6 lines of the cube file, fp is left at the first atom.
         """
-        line = file_content(fname, 2)
-        num_atoms = int(line.split()[0])
-        return num_atoms
+        # two comment lines
+        fp.readline()
+        fp.readline()
+        num_atoms = int(fp.readline().split()[0])
+        grid_lines = np.array([fp.readline().split()[:4] for _ in range(3)], dtype=float)
+        grid_point = grid_lines[:, 0].astype(int)
+        gs_matrix = grid_lines[:, 1:]
+        return num_atoms, grid_point, gs_matrix
 
     @staticmethod
     def _parse_cell(grid_point: npt.NDArray[np.int64], gs_matrix: npt.NDArray[np.float64]) -> Cp2kCell:
@@ -377,30 +603,46 @@ class Cp2kCube(MSONable):
         return Cp2kCell(cell_param, grid_point, gs_matrix)
 
     @staticmethod
-    def _parse_stc(num_atoms: int, fname: str, cell: Cp2kCell) -> Atoms:
-        atom_list = []
-        for i in range(num_atoms):
-            stc_vals = file_content(fname, (6+i, 6+i+1))
-            stc_vals = stc_vals.split()
-            atom = Atom(
-                symbol=int(stc_vals[0]),
-                position=(
-                    float(stc_vals[2])*au2A, float(stc_vals[3])*au2A, float(stc_vals[4])*au2A)
-            )
-            atom_list.append(atom)
+    def _parse_stc(atom_lines, cell: Cp2kCell) -> Atoms:
+        # atomic number, charge and position in bohr of each atom
+        atom_vals = np.array([line.split()[:5] for line in atom_lines], dtype=float).reshape(-1, 5)
+        return Cp2kCube._build_stc(atom_vals[:, 0].astype(int), atom_vals[:, 2:]*au2A, cell)
 
-        stc = Atoms(atom_list)
+    @staticmethod
+    def _build_stc(numbers, positions, cell: Cp2kCell) -> Atoms:
+        # positions in angstrom
+        stc = Atoms(numbers=numbers, positions=positions)
         stc.set_cell(cell.cell_matrix*au2A)
         return stc
 
     @staticmethod
-    def _parse_cube_vals(fname: str, num_atoms: int, grid_point: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
-        # read the cube value from file
-        cube_vals = file_content(fname, (6+num_atoms,))
-        cube_vals = cube_vals.split()
-        cube_vals = np.array(cube_vals, dtype=float)
-        cube_vals = cube_vals.reshape(grid_point)
-        return cube_vals
+    def _parse_cube_vals(fp, fname: str, grid_point: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+        # the values are decoded in bulk into a preallocated array,
+        # chunk by chunk, so compressed cube files are streamed as well
+        cube_vals = np.empty(np.prod(grid_point), dtype=float)
+        num_vals = 0
+        for chunk_vals in iter_cube_vals(fp):
+            if num_vals + len(chunk_vals) > len(cube_vals):
+                raise ValueError(
+                    f"{fname} contains more values than the {grid_point} grid points.")
+            cube_vals[num_vals:num_vals+len(chunk_vals)] = chunk_vals
+            num_vals += len(chunk_vals)
+        if num_vals != len(cube_vals):
+            raise ValueError(f"{fname} doesn't contain the values of all {grid_point} grid points.")
+        return cube_vals.reshape(grid_point)
+
+    @staticmethod
+    def macro_average(pav_x: npt.NDArray[np.float64], pav: npt.NDArray[np.float64], length: float,
+                      l1: float, l2: float = 0, ncov: int = 1) -> npt.NDArray[np.float64]:
+        # convolution of the planar average with one or two square waves
+        theta_1_fft = fft.fft(Cp2kCube.square_wave_filter(pav_x, l1, length))
+        pav_fft = fft.fft(pav)
+        mav_fft = pav_fft*theta_1_fft*length/len(pav_x)
+        if ncov == 2:
+            theta_2_fft = fft.fft(Cp2kCube.square_wave_filter(pav_x, l2, length))
+            mav_fft = mav_fft*theta_2_fft*length/len(pav_x)
+        mav = fft.ifft(mav_fft)
+        return np.real(mav)
 
     @staticmethod
     def square_wave_filter(x: npt.NDArray[np.float64], l: float, cell_z: float) -> npt.NDArray[np.float64]:
@@ -412,6 +654,139 @@ class Cp2kCube(MSONable):
         return y
 
 
+def find_cube_series(cube_dir: str, prefix: str):
+    """
+    cube files named <prefix>_<step>.cube in cube_dir, e.g. prefix
+    "*-v_hartree-1" or "*-ELECTRON_DENSITY-1", and their steps, sorted by step
+    """
+    cube_files = {}
+    for cube_file in glob.glob(os.path.join(glob.escape(cube_dir), f"{prefix}_*.cube*")):
+        match = CUBE_STEP_RE.search(cube_file)
+        if match:
+            cube_files[int(match["step"])] = cube_file
+    steps = sorted(cube_files)
+    return [cube_files[step] for step in steps], np.array(steps, dtype=int)
+
+
+def load_cube_vals(cube_file: str, use_cache: bool = False) -> npt.NDArray[np.float64]:
+    return np.asarray(Cp2kCube(cube_file, use_cache=use_cache).cube_vals)
+
+
+def load_cube_pav(cube_file: str, axis: str, interpolate: bool, use_cache: bool = False):
+    # only the planar average is sent back from the workers
+    return Cp2kCube(cube_file, use_cache=use_cache).get_pav(axis=axis, interpolate=interpolate)
+
+
+class RunningStats:
+    """running mean and variance of equally shaped arrays (Welford)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+
+    def add(self, vals):
+        vals = np.asarray(vals, dtype=float)
+        self.count += 1
+        if self.mean is None:
+            self.mean = vals.copy()
+            self._m2 = np.zeros_like(self.mean)
+            return
+        delta = vals - self.mean
+        self.mean += delta/self.count
+        self._m2 += delta*(vals - self.mean)
+
+    @property
+    def var(self):
+        # population variance over the added arrays
+        return self._m2/self.count
+
+
 class Cp2kCubeTraj:
-    def __init__(cube_dir, prefix):
-        pass
+    """
+    a series of cube files printed along a trajectory, e.g. every 50 md steps.
+    The header and the structure are read from the first cube only, the values
+    are decoded in n_workers processes and reduced on the fly, so averages over
+    hundreds of cubes never hold more than a few grids in memory.
+    """
+
+    def __init__(self, cube_dir: str = ".", prefix: str = "*-v_hartree-1", n_workers: int = 1,
+                 use_cache: bool = False):
+        self.cube_files, self.steps = find_cube_series(cube_dir, prefix)
+        if not self.cube_files:
+            raise FileNotFoundError(f"No cube files {prefix}_<step>.cube are found in {cube_dir}")
+        self.n_workers = n_workers
+        self.use_cache = use_cache
+        with zopen(self.cube_files[0], "rb") as fp:
+            num_atoms, grid_point, gs_matrix = Cp2kCube._parse_header(fp)
+            self.cell = Cp2kCube._parse_cell(grid_point, gs_matrix)
+            self.stc = Cp2kCube._parse_stc([fp.readline() for _ in range(num_atoms)], self.cell)
+
+    def __len__(self):
+        return len(self.cube_files)
+
+    def _map(self, func, *args):
+        # results in the order of the cube files, at most 2 * n_workers cubes are pending
+        if self.n_workers <= 1:
+            for cube_file in self.cube_files:
+                yield func(cube_file, *args)
+            return
+        futures = deque()
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            for cube_file in self.cube_files:
+                if len(futures) >= 2 * self.n_workers:
+                    yield futures.popleft().result()
+                futures.append(executor.submit(func, cube_file, *args))
+            while futures:
+                yield futures.popleft().result()
+
+    def iter_cube_vals(self):
+        """values of every cube, one grid at a time"""
+        for cube_file, cube_vals in zip(self.cube_files, self._map(load_cube_vals, self.use_cache)):
+            if not np.array_equal(cube_vals.shape, self.cell.grid_point):
+                raise ValueError(
+                    f"The grid {cube_vals.shape} of {cube_file} differs from the grid {self.cell.grid_point} of the series.")
+            yield cube_vals
+
+    def iter_cubes(self):
+        for cube_file, cube_vals in zip(self.cube_files, self.iter_cube_vals()):
+            yield Cp2kCube(fname=cube_file, cube_vals=cube_vals, cell=self.cell.copy(), stc=self.stc.copy())
+
+    def get_mean_cube(self, return_var: bool = False):
+        """the time averaged cube, and the variance of every grid point if return_var"""
+        stats = RunningStats()
+        for cube_vals in self.iter_cube_vals():
+            stats.add(cube_vals)
+        mean_cube = Cp2kCube(cube_vals=stats.mean, cell=self.cell.copy(), stc=self.stc.copy())
+        if return_var:
+            return mean_cube, stats.var
+        return mean_cube
+
+    def _get_pav_stats(self, axis, interpolate, l1=None, l2=0, ncov=1):
+        stats = RunningStats()
+        length = self.cell.get_cell_lengths()["xyz".index(axis)]
+        for pav_x, pav in self._map(load_cube_pav, axis, interpolate, self.use_cache):
+            if l1 is not None:
+                pav = Cp2kCube.macro_average(pav_x, pav, length, l1, l2=l2, ncov=ncov)
+            stats.add(pav)
+        return pav_x, stats
+
+    def get_pav(self, axis="z", interpolate=False, return_std=False):
+        """
+        time averaged planar average, and its standard deviation
+        over the cubes if return_std
+        """
+        pav_x, stats = self._get_pav_stats(axis, interpolate)
+        if return_std:
+            return pav_x, stats.mean, np.sqrt(stats.var)
+        return pav_x, stats.mean
+
+    def get_mav(self, l1, l2=0, ncov=1, interpolate=False, axis="z", return_std=False):
+        """
+        time averaged macro average, and its standard deviation
+        over the cubes if return_std
+        """
+        pav_x, stats = self._get_pav_stats(axis, interpolate, l1=l1, l2=l2, ncov=ncov)
+        if return_std:
+            return pav_x, stats.mean, np.sqrt(stats.var)
+        return pav_x, stats.mean
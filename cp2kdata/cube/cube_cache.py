@@ -0,0 +1,79 @@
+"""
+Binary sidecar of a parsed cube file.
+
+Decoding the text of a large cube file takes a while, and the same cube is
+often analysed again and again. After the first parse, the grid values are
+saved next to the cube as ``<cube>.cp2kdata-cube.npy`` and the grid and the
+structure as ``<cube>.cp2kdata-cube.npz``, keyed on the size and mtime of
+the cube file. Later loads memory-map the values instead of decoding the
+text again, so the grid is only paged in where it is used.
+"""
+import os
+from typing import Dict
+
+import numpy as np
+
+from cp2kdata.log import get_logger
+
+logger = get_logger(__name__)
+
+CUBE_CACHE_SUFFIX = ".cp2kdata-cube"
+# bump the version whenever the layout of the sidecar changes
+CUBE_CACHE_VERSION = 1
+
+
+def get_cube_cache_files(fname: str):
+    """the values file and the header file of the sidecar of fname"""
+    prefix = str(fname) + CUBE_CACHE_SUFFIX
+    return prefix + ".npy", prefix + ".npz"
+
+
+def get_cube_cache_key(fname: str) -> Dict:
+    stat = os.stat(fname)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def load_cube_cache(fname: str) -> Dict:
+    """
+    memory-mapped values, grid and structure of the sidecar of fname,
+    None if the sidecar doesn't exist or the cube file has changed.
+    """
+    vals_file, header_file = get_cube_cache_files(fname)
+    try:
+        key = get_cube_cache_key(fname)
+        with np.load(header_file, allow_pickle=False) as data:
+            if int(data["version"]) != CUBE_CACHE_VERSION:
+                return None
+            if {"size": int(data["size"]), "mtime": int(data["mtime"])} != key:
+                return None
+            cache = {name: data[name] for name in ["grid_point", "gs_matrix", "numbers", "positions"]}
+        cache["cube_vals"] = np.load(vals_file, mmap_mode="r")
+    except (OSError, ValueError, KeyError) as err:
+        logger.debug(f"Cannot load the cube cache of {fname}: {err}")
+        return None
+    if not np.array_equal(cache["cube_vals"].shape, cache["grid_point"]):
+        return None
+    return cache
+
+
+def save_cube_cache(fname: str, cube_vals, grid_point, gs_matrix, numbers, positions):
+    vals_file, header_file = get_cube_cache_files(fname)
+    try:
+        key = get_cube_cache_key(fname)
+        if os.path.exists(header_file):
+            os.remove(header_file)
+        np.save(vals_file, np.ascontiguousarray(cube_vals))
+        # the header is written last, an interrupted write leaves no valid cache
+        with open(header_file, "wb") as fp:
+            np.savez(
+                fp,
+                version=CUBE_CACHE_VERSION,
+                size=key["size"],
+                mtime=key["mtime"],
+                grid_point=np.asarray(grid_point),
+                gs_matrix=np.asarray(gs_matrix),
+                numbers=np.asarray(numbers),
+                positions=np.asarray(positions)
+            )
+    except OSError as err:
+        logger.warning(f"Cannot write the cube cache of {fname}: {err}")
@@ -0,0 +1,245 @@
+"""
+Streaming conversion of cp2k runs into DeePMD-kit training data.
+
+convert_to_deepmd walks a directory tree and streams the frames of every
+ENERGY_FORCE and MD run into set.XXX shards of a deepmd/npy system per atom
+type signature. ENERGY_FORCE runs are parsed with the cp2kdata/e_f format of
+dpdata in a process pool. MD runs are read frame by frame with
+Cp2kOutput.iter_frames and added in batches of set_size frames. Only the
+pending frames of each system, the current batch and the single point runs
+being parsed are kept in memory, instead of the whole dataset.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from cp2kdata.block_parser.header_info import parse_global_info
+from cp2kdata.log import get_logger
+
+logger = get_logger(__name__)
+
+# frame quantities of a labeled system and their file names in deepmd/npy
+DEEPMD_NAMES = {
+    "cells": "box",
+    "coords": "coord",
+    "energies": "energy",
+    "forces": "force",
+    "virials": "virial"
+}
+
+
+def find_cp2k_runs(root, output_name: str = "output") -> List[str]:
+    """directories under root containing a cp2k output named output_name, sorted"""
+    run_dirs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if output_name in filenames:
+            run_dirs.append(dirpath)
+    return run_dirs
+
+
+def get_run_type(run_dir: str, output_name: str = "output") -> str:
+    return parse_global_info(os.path.join(run_dir, output_name)).run_type
+
+
+def load_cp2k_run(run_dir: str, output_name: str = "output", **kwargs) -> Dict:
+    """
+    labeled data of one run in the units of dpdata, None for unsupported runs.
+    MD runs are loaded as a whole, see iter_md_labeled_batches for streaming.
+    """
+    # the plugin formats are imported here, dpdata is only needed for conversions
+    from cp2kdata.dpdata_plugin import CP2KEnergyForceFormat, CP2KMDFormat
+
+    output_file = os.path.join(run_dir, output_name)
+    run_type = get_run_type(run_dir, output_name)
+    if run_type == "ENERGY_FORCE":
+        data = CP2KEnergyForceFormat().from_labeled_system(output_file, **kwargs)
+    elif run_type == "MD":
+        data = CP2KMDFormat().from_labeled_system(run_dir, cp2k_output_name=output_name, **kwargs)
+    else:
+        logger.info(f"Skip {output_file}, run type {run_type} is not supported.")
+        return None
+    if len(data["energies"]) == 0:
+        # e.g. not converged single points
+        return None
+    return data
+
+
+def try_load_cp2k_run(run_dir: str, output_name: str, kwargs: Dict) -> Tuple[Dict, str]:
+    # failures of single runs are reported, without aborting the conversion
+    try:
+        return load_cp2k_run(run_dir, output_name=output_name, **kwargs), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def get_type_signature(data: Dict) -> Tuple:
+    # frames can share a system only if every atom has the same type
+    return tuple(data["atom_names"]), np.asarray(data["atom_types"], dtype=int).tobytes()
+
+
+class DeepmdShardWriter:
+    """
+    write the frames of one deepmd/npy system as set.000, set.001, ...
+    with set_size frames per set, the last set may be smaller.
+    """
+
+    def __init__(self, system_dir: str, atom_names, atom_types,
+                 set_size: int = 5000, prec=np.float32):
+        self.system_dir = system_dir
+        self.set_size = set_size
+        self.prec = prec
+        self.num_sets = 0
+        self.num_frames = 0
+        # pending frame arrays, the frames before head_offset of the first
+        # one are written already
+        self.buffer = deque()
+        self.head_offset = 0
+        self.num_buffered = 0
+        os.makedirs(system_dir, exist_ok=True)
+        np.savetxt(os.path.join(system_dir, "type.raw"), atom_types, fmt="%d")
+        np.savetxt(os.path.join(system_dir, "type_map.raw"), atom_names, fmt="%s")
+
+    def add(self, data: Dict):
+        """add the frames of a labeled system with the atom types of this system"""
+        nframes = len(data["energies"])
+        if nframes == 0:
+            return
+        frames = {name: np.reshape(data[name], (nframes, -1)).astype(self.prec)
+                  for name in DEEPMD_NAMES if name in data}
+        # frames with and without virials cannot share a set
+        if self.buffer and (self.buffer[0].keys() != frames.keys()):
+            self.write_set(self.pop_frames(self.num_buffered))
+        self.buffer.append(frames)
+        self.num_buffered += nframes
+        self.num_frames += nframes
+        while self.num_buffered >= self.set_size:
+            self.write_set(self.pop_frames(self.set_size))
+
+    def close(self):
+        if self.buffer:
+            self.write_set(self.pop_frames(self.num_buffered))
+
+    def get_buffered_frames(self) -> int:
+        return self.num_buffered
+
+    def pop_frames(self, nframes: int) -> Dict:
+        # only the nframes popped frames are copied, not the whole buffer
+        parts = []
+        remaining = nframes
+        while remaining > 0:
+            head = self.buffer[0]
+            stop = min(len(head["energies"]), self.head_offset + remaining)
+            parts.append({name: values[self.head_offset:stop] for name, values in head.items()})
+            remaining -= stop - self.head_offset
+            if stop == len(head["energies"]):
+                self.buffer.popleft()
+                self.head_offset = 0
+            else:
+                self.head_offset = stop
+        self.num_buffered -= nframes
+        if len(parts) == 1:
+            return parts[0]
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def write_set(self, frames: Dict):
+        set_dir = os.path.join(self.system_dir, "set.%03d" % self.num_sets)
+        os.makedirs(set_dir)
+        for name, values in frames.items():
+            np.save(os.path.join(set_dir, DEEPMD_NAMES[name]), values)
+        self.num_sets += 1
+
+
+def get_system_name(atom_names, atom_types, used_names) -> str:
+    # formula in the order of the type map, e.g. O64H128
+    atom_numbs = np.bincount(atom_types, minlength=len(atom_names))
+    name = "".join(f"{atom_name}{atom_numb}" for atom_name, atom_numb in zip(atom_names, atom_numbs))
+    # the same formula with atoms in another order
+    suffix = 1
+    system_name = name
+    while system_name in used_names:
+        system_name = f"{name}_{suffix}"
+        suffix += 1
+    return system_name
+
+
+def convert_to_deepmd(root, out_dir, set_size: int = 5000, n_workers: int = 1,
+                      output_name: str = "output", prec=np.float32, **kwargs) -> Dict[str, int]:
+    """
+    convert all cp2k runs under root into deepmd/npy systems under out_dir,
+    one system per atom type signature, and return the number of frames
+    written to each system. kwargs are passed to the cp2kdata/e_f and
+    cp2kdata/md formats, e.g. true_symbols or skip.
+
+    ENERGY_FORCE runs are parsed in n_workers processes, MD runs are
+    streamed in the main process in batches of set_size frames.
+    """
+    # the plugin formats are imported here, dpdata is only needed for conversions
+    from cp2kdata.dpdata_plugin import iter_md_labeled_batches
+
+    run_dirs = find_cp2k_runs(root, output_name=output_name)
+    writers = {}
+
+    def add_frames(data):
+        signature = get_type_signature(data)
+        if signature not in writers:
+            atom_types = np.asarray(data["atom_types"], dtype=int)
+            system_name = get_system_name(
+                data["atom_names"], atom_types, [os.path.basename(writer.system_dir) for writer in writers.values()])
+            writers[signature] = DeepmdShardWriter(
+                os.path.join(out_dir, system_name), data["atom_names"], atom_types,
+                set_size=set_size, prec=prec)
+        writers[signature].add(data)
+
+    def write_run(run_dir, data, error):
+        if error is not None:
+            logger.warning(f"Failed to convert {run_dir}, {error}")
+            return
+        if data is not None:
+            add_frames(data)
+
+    def write_md_run(run_dir):
+        try:
+            for data in iter_md_labeled_batches(run_dir, set_size, cp2k_output_name=output_name, **kwargs):
+                add_frames(data)
+        except Exception as e:
+            logger.warning(f"Failed to convert {run_dir}, {type(e).__name__}: {e}")
+
+    def is_md_run(run_dir):
+        # runs whose header cannot be parsed fail in try_load_cp2k_run
+        try:
+            return get_run_type(run_dir, output_name) == "MD"
+        except Exception:
+            return False
+
+    if n_workers <= 1:
+        for run_dir in run_dirs:
+            if is_md_run(run_dir):
+                write_md_run(run_dir)
+            else:
+                write_run(run_dir, *try_load_cp2k_run(run_dir, output_name, kwargs))
+    else:
+        futures = deque()
+        # frames are written in the order of run_dirs, at most 2 * n_workers runs are pending
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            for run_dir in run_dirs:
+                if is_md_run(run_dir):
+                    while futures:
+                        pending_dir, future = futures.popleft()
+                        write_run(pending_dir, *future.result())
+                    write_md_run(run_dir)
+                    continue
+                if len(futures) >= 2 * n_workers:
+                    pending_dir, future = futures.popleft()
+                    write_run(pending_dir, *future.result())
+                futures.append((run_dir, executor.submit(try_load_cp2k_run, run_dir, output_name, kwargs)))
+            while futures:
+                pending_dir, future = futures.popleft()
+                write_run(pending_dir, *future.result())
+
+    for writer in writers.values():
+        writer.close()
+    return {os.path.basename(writer.system_dir): writer.num_frames for writer in writers.values()}
@@ -5,8 +5,9 @@ from dpdata.unit import EnergyConversion, LengthConversion, PressureConversion
 from dpdata.format import Format
 
 from cp2kdata import Cp2kOutput
+from cp2kdata.output import OUTPUT_FIELDS
 from cp2kdata.log import get_logger
-from cp2kdata.block_parser.converge import parse_e_f_converge
+from cp2kdata.block_parser.converge import parse_tail_info
 
 
 logger = get_logger(__name__)
@@ -24,6 +25,9 @@ VIRIAL_WRN = (
     "please check the cp2kdata version and the virial.npy"
     )
 
+# quantities that dpdata cannot do without, they are always parsed
+DPDATA_REQUIRED_FIELDS = ["energies", "forces", "cells", "coordinates", "symbols"]
+
 
 @Format.register("cp2k/output")
 @Format.register("cp2kdata/e_f")
@@ -35,7 +39,7 @@ class CP2KEnergyForceFormat(Format):
 
         # -- start parsing --
         logger.debug(WRAPPER)
-        converge_info = parse_e_f_converge(file_name)
+        converge_info = parse_tail_info(file_name)
         if not converge_info.converge:
             data = {
                 'atom_names': [],
@@ -48,7 +52,7 @@ class CP2KEnergyForceFormat(Format):
             }
             return data
 
-        cp2k_e_f = Cp2kOutput(file_name)
+        cp2k_e_f = Cp2kOutput(file_name, fields=get_dpdata_fields(**kwargs), converge_info=converge_info)
 
         chemical_symbols = get_chemical_symbols_from_cp2kdata(
             cp2koutput=cp2k_e_f,
@@ -70,6 +74,7 @@ class CP2KEnergyForceFormat(Format):
             logger.warning(VIRIAL_WRN)
             volume = np.linalg.det(data['cells'][0])
             data['virials'] = cp2k_e_f.stress_tensor_list*volume/EV_ANG_m3_TO_GPa
+        cp2k_e_f.close()
 
         logger.debug(WRAPPER)
         return data
@@ -86,6 +91,12 @@ class CP2KMDFormat(Format):
         cells = kwargs.get('cells', None)
         cp2k_output_name = kwargs.get('cp2k_output_name', None)
         ensemble_type = kwargs.get('ensemble_type', None)
+        use_cache = kwargs.get('use_cache', False)
+
+        fields = get_dpdata_fields(**kwargs)
+        if cells is not None:
+            # cells provided by users are not parsed
+            fields.remove("cells")
 
         # -- start parsing --
         logger.debug(WRAPPER)
@@ -94,7 +105,9 @@ class CP2KMDFormat(Format):
                             run_type="MD",
                             ensemble_type=ensemble_type,
                             path_prefix=path_prefix,
-                            restart=restart
+                            restart=restart,
+                            fields=fields,
+                            use_cache=use_cache
                             )
 
         num_frames = cp2kmd.get_num_frames()
@@ -145,11 +158,88 @@ class CP2KMDFormat(Format):
             volumes = np.linalg.det(data['cells'])
             volumes = volumes[:, np.newaxis, np.newaxis]
             data['virials'] = cp2kmd.stress_tensor_list*volumes/EV_ANG_m3_TO_GPa
+        cp2kmd.close()
 
         logger.debug(WRAPPER)
         return data
 
 
+def iter_md_labeled_batches(file_name, batch_size: int, restart: bool = None, **kwargs):
+    """
+    yield the labeled data of a cp2k md run in batches of batch_size frames,
+    in the units of the cp2kdata/md format. The frames are read with
+    Cp2kOutput.iter_frames, so only one batch is kept in memory.
+    """
+    true_symbols = kwargs.get('true_symbols', False)
+    cells = kwargs.get('cells', None)
+    fields = get_dpdata_fields(**kwargs)
+    if cells is not None:
+        fields.remove("cells")
+        cells = np.asarray(cells)
+
+    # fields are given as skip, the blocks are not prefetched as a whole
+    cp2kmd = Cp2kOutput(output_file=kwargs.get('cp2k_output_name', None),
+                        run_type="MD",
+                        ensemble_type=kwargs.get('ensemble_type', None),
+                        path_prefix=file_name,
+                        restart=restart,
+                        skip=[field for field in OUTPUT_FIELDS if field not in fields],
+                        use_cache=kwargs.get('use_cache', False)
+                        )
+    chemical_symbols = get_chemical_symbols_from_cp2kdata(
+        cp2koutput=cp2kmd,
+        true_symbols=true_symbols
+    )
+    atom_names, atom_numbs, atom_types = get_uniq_atom_names_and_types(
+        chemical_symbols=chemical_symbols)
+
+    def get_batch(frames, start):
+        for frame in frames:
+            for name in ["positions", "forces", "energy", "cell"]:
+                if (getattr(frame, name) is None) and (name != "cell" or cells is None):
+                    raise ValueError(f"No {name} found for the md step {frame.step} in {file_name}")
+        data = {"atom_names": atom_names, "atom_numbs": atom_numbs, "atom_types": atom_types}
+        data['energies'] = np.array([frame.energy for frame in frames]) * AU_TO_EV
+        if cells is None:
+            data['cells'] = np.array([frame.cell for frame in frames])
+        elif cells.shape == (3, 3):
+            data['cells'] = np.repeat(cells[np.newaxis, :, :], repeats=len(frames), axis=0)
+        else:
+            data['cells'] = cells[start:start + len(frames)]
+        data['coords'] = np.array([frame.positions for frame in frames])
+        data['forces'] = np.array([frame.forces for frame in frames]) * AU_TO_EV/AU_TO_ANG
+        if all(frame.stress is not None for frame in frames):
+            # note that virial = stress * volume
+            volumes = np.linalg.det(data['cells'])[:, np.newaxis, np.newaxis]
+            data['virials'] = np.array([frame.stress for frame in frames])*volumes/EV_ANG_m3_TO_GPa
+        return data
+
+    frames = []
+    start = 0
+    with cp2kmd:
+        for frame in cp2kmd.iter_frames():
+            frames.append(frame)
+            if len(frames) == batch_size:
+                yield get_batch(frames, start)
+                start += len(frames)
+                frames = []
+    if frames:
+        yield get_batch(frames, start)
+
+
+def get_dpdata_fields(fields=None, skip=None, **kwargs):
+    # parse the required fields and the optional stress in one pass,
+    # users can only restrict the optional fields
+    if fields is None:
+        fields = ["stress"]
+    skip = [field for field in (skip or []) if field not in DPDATA_REQUIRED_FIELDS]
+    if skip:
+        logger.debug(f"Skip parsing {skip}")
+    fields = DPDATA_REQUIRED_FIELDS + [field for field in fields
+                                       if field not in DPDATA_REQUIRED_FIELDS]
+    return [field for field in fields if field not in skip]
+
+
 def get_chemical_symbols_from_cp2kdata(cp2koutput, true_symbols):
     if cp2koutput.atomic_kind is None:
         logger.debug("Missing the atomic kind informations, atom names are true chemical symbols.")
@@ -1,31 +1,94 @@
 import sys
 import numpy as np
 import glob
+import mmap
 import os
 import sys
+import time
+from contextlib import ExitStack, closing
 from functools import cached_property
 
 from cp2kdata.plots.geo_opt_plot import geo_opt_info_plot
 from cp2kdata.log import get_logger
 from cp2kdata.utils import format_logger
+from cp2kdata.compression import COMPRESSED_SUFFIXES, is_compressed, zopen
+from cp2kdata.units import bar2GPa
 from cp2kdata.block_parser.header_info import GlobalInfo, Cp2kInfo, DFTInfo, MDInfo
 from cp2kdata.block_parser.dft_plus_u import parse_dft_plus_u_occ
-from cp2kdata.block_parser.forces import parse_atomic_forces_list
-from cp2kdata.block_parser.geo_opt import parse_geo_opt_info
+from cp2kdata.block_parser.forces import parse_atomic_forces_list, ATOMIC_FORCES_HANDLER
+from cp2kdata.block_parser.geo_opt import parse_geo_opt_info, GEO_OPT_INFO_HANDLER
 from cp2kdata.block_parser.header_info import parse_dft_info, parse_global_info, parse_cp2k_info, parse_md_info
-from cp2kdata.block_parser.hirshfeld import parse_hirshfeld_pop_list
-from cp2kdata.block_parser.mulliken import parse_mulliken_pop_list
-from cp2kdata.block_parser.energies import parse_energies_list
-from cp2kdata.block_parser.coordinates import parse_init_atomic_coordinates
-from cp2kdata.block_parser.atomic_kind import parse_atomic_kinds
+from cp2kdata.block_parser.header_info import scan_header, parse_terminated_by_request
+from cp2kdata.block_parser.hirshfeld import parse_hirshfeld_pop_list, HIRSHFELD_POP_HANDLER
+from cp2kdata.block_parser.mulliken import parse_mulliken_pop_list, get_mulliken_pop_handler
+from cp2kdata.block_parser.energies import parse_energies_list, ENERGIES_HANDLER
+from cp2kdata.block_parser.coordinates import parse_init_atomic_coordinates, INIT_ATOMIC_COORDINATES_HANDLER
+from cp2kdata.block_parser.atomic_kind import parse_atomic_kinds, ATOMIC_KINDS_HANDLER
 from cp2kdata.block_parser.errors_handle import parse_errors
-from cp2kdata.block_parser.stress import parse_stress_tensor_list
-from cp2kdata.block_parser.cells import parse_all_cells, parse_all_md_cells
+from cp2kdata.block_parser.converge import ConvergeInfo
+from cp2kdata.block_parser.stress import parse_stress_tensor_list, STRESS_TENSOR_HANDLER
+from cp2kdata.block_parser.cells import parse_all_cells, parse_all_md_cells, ALL_CELLS_HANDLER
+from cp2kdata.block_parser.cells import get_md_cell_params_handler, md_cell_params_to_cells
+from cp2kdata.block_parser.scanner import iter_blocks_stream, scan_blocks, scan_stream, open_output_mmap
+from cp2kdata.block_parser.output_index import load_or_build_output_index, find_complete_steps_end
 from cp2kdata.block_parser.md_xyz import parse_md_ener, parse_pos_xyz, parse_frc_xyz, parse_md_stress, parse_md_cell
-from cp2kdata.block_parser.vibration import parse_vibration_freq_list
+from cp2kdata.block_parser.md_xyz import MDFrame, StepCursor, iter_xyz_frames, iter_md_table
+from cp2kdata.block_parser.md_xyz import ENERGY_RE, STEP_RE, read_new_xyz_frames, read_new_md_table
+from cp2kdata.block_parser.md_cache import CACHED_QUANTITIES, get_cache_dir, get_md_cache_key
+from cp2kdata.block_parser.md_cache import load_md_cache, save_md_cache
+from cp2kdata.block_parser.vibration import parse_vibration_freq_list, VIB_FREQ_HANDLER
 
 logger = get_logger(__name__)
 
+# quantities which can be selected by Cp2kOutput(fields=..., skip=...),
+# each field covers the attributes below
+OUTPUT_FIELDS = {
+    "energies": ["energies_list"],
+    "forces": ["atomic_forces_list"],
+    "stress": ["stress_tensor_list", "md_stress_list"],
+    "cells": ["all_cells"],
+    "coordinates": ["init_atomic_coordinates", "atomic_frames_list"],
+    "symbols": ["chemical_symbols", "atom_kind_list", "atomic_kind"],
+    "geo_opt_info": ["geo_opt_info"],
+    "mulliken": ["mulliken_pop_list"],
+    "hirshfeld": ["hirshfeld_pop_list"],
+    "vib_freq": ["vib_freq_list"]
+}
+
+# fields of the md frames which are followed by Cp2kOutput.refresh
+FOLLOWED_FIELDS = ["energies", "forces", "stress", "cells", "coordinates", "symbols"]
+# output blocks printed at every md step, the blocks found by a refresh are
+# appended to them. The other blocks are printed once in the header.
+MD_STEP_BLOCKS = ["energies_list", "atomic_forces_list", "stress_tensor_list", "md_cell_params"]
+
+
+def get_selected_fields(fields=None, skip=None):
+    """the fields to parse, all fields except those in skip by default"""
+    for name in (fields or []) + (skip or []):
+        if name not in OUTPUT_FIELDS:
+            raise ValueError(
+                f"Unknown field {name}, available fields are {list(OUTPUT_FIELDS)}")
+    if fields is None:
+        fields = list(OUTPUT_FIELDS)
+    skip = skip or []
+    return [field for field in fields if field not in skip]
+
+
+def append_frames(frames, new_frames):
+    """concatenate the new frames to frames, either of them may be None"""
+    if frames is None:
+        return new_frames
+    if (new_frames is None) or (len(new_frames) == 0):
+        return frames
+    return np.concatenate([frames, new_frames])
+
+
+def get_frame_item(values, frame_idx):
+    if (values is None) or (frame_idx >= len(values)):
+        return None
+    return values[frame_idx]
+
+
 class Cp2kOutput:
     """Class for parsing cp2k output"""
 
@@ -35,6 +98,12 @@ class Cp2kOutput:
             run_type: str = None,
             path_prefix: str = ".",
             restart: bool = None,
+            use_mmap: bool = False,
+            use_index: bool = False,
+            fields: list = None,
+            skip: list = None,
+            use_cache: bool = False,
+            converge_info: ConvergeInfo = None,
             **kwargs
     ):
 
@@ -50,9 +119,13 @@ class Cp2kOutput:
             raise FileNotFoundError(
                 f'cp2k output file {output_file} is not found')
 
+        # GLOBAL|, CP2K|, DFT| and MD| information is collected by one pass
+        # over the header, which stops at the first SCF step.
+        self._header = scan_header(self.filename) if self.filename else None
         try:
             self.global_info = self.get_global_info(run_type=run_type,
-                                                    filename=self.filename
+                                                    filename=self.filename,
+                                                    header=self._header
                                                     )
         except ValueError as err:
             logger.error(
@@ -78,22 +151,24 @@ class Cp2kOutput:
             raise ValueError(
                 "please provide cp2k output file with MEDIUM print level. Print Level Low doesn't provide necessary information for initialize the cp2kdata class.")
 
-        # -- set some basic attributes --
-        self.num_frames = None
-        self.init_atomic_coordinates = None
-        self.atomic_kind = None
-        self.atom_kind_list = None
+        # -- blocks parsed from the output, filled on demand --
+        self._blocks = {}
+        # byte offsets reached by refresh, None until the first refresh
+        self._follow_offsets = None
 
         # -- start parse necessary information --
         # sometimes I use self.filename and sometimes I use self.output_file
-        # self.filename is used for parsing information by monty package.
+        # the output file itself is only read when the first block is parsed.
+        self.use_mmap = use_mmap
+        self.use_index = use_index
+        # the tail read by parse_tail_info is reused instead of reading it again
+        self.converge_info = converge_info
         if self.filename:
-            with open(self.filename, 'r') as fp:
-                self.output_file = fp.read()
-            self.cp2k_info = parse_cp2k_info(self.filename)
-            self.dft_info = parse_dft_info(self.filename)
+            self.cp2k_info = parse_cp2k_info(
+                self.filename, header=self._header,
+                terminated_by_request=converge_info.terminated_by_request if converge_info else None)
+            self.dft_info = parse_dft_info(self.filename, header=self._header)
         else:
-            self.output_file = None
             self.cp2k_info = Cp2kInfo(version="Unknown")
 
         self.ensemble_type = kwargs.get("ensemble_type", None)
@@ -106,22 +181,24 @@ class Cp2kOutput:
 
         self.check_run_type(run_type=self.global_info.run_type)
 
-        run_type_parser_candidates = {
-            "ENERGY": self.parse_energy_force,
-            "ENERGY_FORCE": self.parse_energy_force,
-            "GEO_OPT": self.parse_geo_opt,
-            "CELL_OPT": self.parse_cell_opt,
-            "MD": self.parse_md,
-            "VIBRATIONAL_ANALYSIS": self.parse_vibrational_analysis
-        }
-
-        # call corresponding parser for run types
-        parse_run_type = run_type_parser_candidates.get(
-            self.global_info.run_type, None)
-        if parse_run_type:
-            parse_run_type()
-        else:
-            f"parser for run type {self.global_info.run_type} is not implemented yet!"
+        # quantities such as energies_list and atomic_forces_list are
+        # cached properties, they are only parsed when first accessed.
+        # MD additionally needs the ensemble type and the separate md files.
+        if self.global_info.run_type == "MD":
+            self.setup_md()
+
+        # quantities outside the selected fields are never parsed,
+        # the selected ones are parsed together in a single pass
+        self.fields = get_selected_fields(fields=fields, skip=skip)
+        for field, attrs in OUTPUT_FIELDS.items():
+            if field not in self.fields:
+                for attr in attrs:
+                    setattr(self, attr, None)
+        if fields is not None:
+            self.prefetch_blocks(self.get_field_handlers(self.fields))
+
+        if use_cache and (self.global_info.run_type == "MD"):
+            self.setup_md_cache()
 
         # self.errors_info = parse_errors(self.output_file)
         # if ignore_error:
@@ -282,22 +359,22 @@ class Cp2kOutput:
     @cached_property
     def mulliken_pop_list(self):
         # use cached property to prase only once
-        return parse_mulliken_pop_list(self.output_file, self.dft_info)
+        handler = get_mulliken_pop_handler(self.dft_info)
+        if handler is None:
+            return None
+        return self.get_block(handler)
 
     def get_mulliken_pop_list(self):
         return self.mulliken_pop_list
 
     def get_spin_moment_mulliken_list(self):
         mulliken_pop_list = self.get_mulliken_pop_list()
-        spin_moment_mulliken_list = []
-
-        for mulliken_pop in mulliken_pop_list:
-            spin_moment_mulliken = np.array(
-                [mulliken_atom['spin_moment'] for mulliken_atom in mulliken_pop], dtype=float)
-            spin_moment_mulliken_list.append(spin_moment_mulliken)
-        spin_moment_mulliken_list = np.array(spin_moment_mulliken_list)
-
-        return spin_moment_mulliken_list
+        if mulliken_pop_list is None:
+            return None
+        if mulliken_pop_list.spin_moment is None:
+            # spin restricted
+            return np.zeros_like(mulliken_pop_list.net_charge)
+        return mulliken_pop_list.spin_moment
 
     def get_spin_moment_list(self, type='mulliken'):
         if type == 'mulliken':
@@ -306,8 +383,12 @@ class Cp2kOutput:
             raise NotImplementedError(
                 "Only Mulliken Spin Moment is implemented now")
 
-    # def get_hirshfeld_pop_list(self):
-    #     return self.hirshfeld_pop_list
+    @cached_property
+    def hirshfeld_pop_list(self):
+        return self.get_block(HIRSHFELD_POP_HANDLER)
+
+    def get_hirshfeld_pop_list(self):
+        return self.hirshfeld_pop_list
 
     # def get_dft_plus_u_occ(self):
     #     return self.dft_plus_u_occ
@@ -329,134 +410,339 @@ class Cp2kOutput:
         print("haven't implemented yet")
         pass
 
-    def parse_energy_force(self):
-        self.geo_opt_info = None
-        self.num_frames = 1
-        self.init_atomic_coordinates, self.atom_kind_list, self.chemical_symbols = parse_init_atomic_coordinates(
-            self.output_file)
-        self.all_cells = parse_all_cells(self.output_file)
-        self.energies_list = parse_energies_list(self.output_file)
-
-        self.atomic_kind = parse_atomic_kinds(self.output_file)
-        self.atomic_forces_list = parse_atomic_forces_list(self.output_file)
-        self.stress_tensor_list = parse_stress_tensor_list(self.output_file)
-
-    def parse_vibrational_analysis(self):
-        self.parse_energy_force()
-
-    def parse_geo_opt(self):
-        self.init_atomic_coordinates, self.atom_kind_list, self.chemical_symbols = parse_init_atomic_coordinates(
-            self.output_file)
-        self.geo_opt_info = parse_geo_opt_info(self.output_file)
-        self.energies_list = parse_energies_list(self.output_file)
-        self.num_frames = len(self.geo_opt_info)
-        self.atomic_forces_list = parse_atomic_forces_list(self.output_file)
-        self.stress_tensor_list = parse_stress_tensor_list(self.output_file)
-
-    def parse_cell_opt(self):
-        # initial information
-        self.init_atomic_coordinates, self.atom_kind_list, self.chemical_symbols = parse_init_atomic_coordinates(
-            self.output_file)
-        self.atomic_kind = parse_atomic_kinds(self.output_file)
-
-        pos_xyz_file_list = glob.glob(
-            os.path.join(self.path_prefix, "*pos*.xyz"))
-        if pos_xyz_file_list:
-            self.atomic_frames_list, energies_list_from_pos, self.chemical_symbols = parse_pos_xyz(
-                pos_xyz_file_list[0])
-            self.energies_list = energies_list_from_pos
-
-        self.all_cells = parse_all_cells(self.output_file)
-        self.atomic_forces_list = parse_atomic_forces_list(self.output_file)
-        self.stress_tensor_list = parse_stress_tensor_list(self.output_file)
-
-        self.num_frames = len(self.energies_list)
-
-    def parse_md(self):
-        self.md_info = self.get_md_info(ensemble_type=self.ensemble_type,
-                                        filename=self.filename)
-        self.check_md_type(md_type=self.md_info.ensemble_type)
+    def close(self):
+        """
+        release the memory map of the output file. The parsed quantities
+        stay available, the output is mapped again if it is needed later.
+        """
+        output_file = self.__dict__.pop("output_file", None)
+        if isinstance(output_file, mmap.mmap):
+            output_file.close()
 
-        # parse md energies
-        ener_file_list = glob.glob(os.path.join(self.path_prefix, "*.ener"))
-        if ener_file_list:
-            self.energies_list = parse_md_ener(ener_file_list[0])
+    def __enter__(self):
+        return self
 
-        # parse md poses
-        pos_xyz_file_list = glob.glob(
-            os.path.join(self.path_prefix, "*-pos-*.xyz"))
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-        n_pos_xyz_files = len(pos_xyz_file_list)
-        if n_pos_xyz_files > 1:
-            raise ValueError(
-                f"Cp2kData found {n_pos_xyz_files} pos files.\n"
-                f"{pos_xyz_file_list}.\n"
-                f"Please remove extra pos files and keep only one pos file in the folder."
-                )
+    def has_whole_tail(self) -> bool:
+        # the tail of converge_info holds the whole output
+        return (self.converge_info is not None) and self.converge_info.whole_file
 
-        if pos_xyz_file_list:
-            # TODO: Is it possible to have no pos file?
-            self.atomic_frames_list, energies_list_from_pos, self.chemical_symbols = parse_pos_xyz(
-                pos_xyz_file_list[0])
+    @cached_property
+    def output_file(self):
+        if not self.filename:
+            return None
+        if self.has_whole_tail() and not (self.use_mmap or self.use_index):
+            return self.converge_info.tail.decode()
+        if (self.use_mmap or self.use_index) and not is_compressed(self.filename):
+            # block parsers run over the memory-mapped bytes,
+            # the whole output is never decoded into a str.
+            return open_output_mmap(self.filename)
+        with zopen(self.filename, 'r') as fp:
+            return fp.read()
 
-            if not hasattr(self, "energies_list"):
-                self.energies_list = energies_list_from_pos
-        else:
-            # if no pos file and ener file, parse energies from the output file
-            if not hasattr(self, "energies_list"):
+    @cached_property
+    def output_index(self):
+        if self.filename and self.use_index and not is_compressed(self.filename):
+            # the byte offsets of blocks are saved in a sidecar file
+            # and reused when the same output is opened again.
+            return load_or_build_output_index(self.filename, output_file=self.output_file)
+        return None
+
+    def scan_output(self, handlers):
+        # feed all block handlers with one pass over the output file
+        if self.filename and is_compressed(self.filename) and not self.has_whole_tail():
+            # compressed outputs are decompressed chunk by chunk while scanning
+            with zopen(self.filename, 'rb') as fp:
+                return scan_stream(fp, handlers)
+        return scan_blocks(self.output_file, handlers, index=self.output_index)
+
+    def prefetch_blocks(self, handlers):
+        # parse all blocks which are not cached yet with a single pass
+        handlers = [handler for handler in handlers
+                    if handler.name not in self._blocks]
+        if handlers:
+            self._blocks.update(self.scan_output(handlers))
+
+    def get_block(self, handler):
+        # each block is parsed once and only when it is requested
+        self.prefetch_blocks([handler])
+        return self._blocks[handler.name]
+
+    def get_field_handlers(self, fields):
+        # handlers of the output blocks needed by the fields, quantities
+        # read from the md files or the pos file need no output block
+        if not self.filename:
+            return []
+        run_type = self.global_info.run_type
+        md_files = self.md_files if run_type == "MD" else {}
+        handlers = []
+        for field in fields:
+            if field == "energies":
+                if md_files.get("ener") or md_files.get("pos"):
+                    continue
+                if (run_type == "CELL_OPT") and self._get_pos_xyz_file():
+                    continue
+                handlers.append(ENERGIES_HANDLER)
+            elif field == "forces":
+                if not md_files.get("frc"):
+                    handlers.append(ATOMIC_FORCES_HANDLER)
+            elif field == "stress":
+                if not md_files.get("stress"):
+                    handlers.append(STRESS_TENSOR_HANDLER)
+            elif field == "cells":
+                if run_type != "MD":
+                    handlers.append(ALL_CELLS_HANDLER)
+                elif not md_files.get("cell"):
+                    handlers.append(ALL_CELLS_HANDLER)
+                    if self.md_info.ensemble_type in ["NPT_F", "NPT_I"]:
+                        handlers.append(get_md_cell_params_handler(self.cp2k_info))
+            elif field in ["coordinates", "symbols"]:
+                handlers.append(INIT_ATOMIC_COORDINATES_HANDLER)
+                if field == "symbols":
+                    handlers.append(ATOMIC_KINDS_HANDLER)
+            elif (field == "geo_opt_info") and (run_type == "GEO_OPT"):
+                handlers.append(GEO_OPT_INFO_HANDLER)
+            elif field == "mulliken":
+                handler = get_mulliken_pop_handler(self.dft_info)
+                if handler is not None:
+                    handlers.append(handler)
+            elif field == "hirshfeld":
+                handlers.append(HIRSHFELD_POP_HANDLER)
+            elif (field == "vib_freq") and (run_type == "VIBRATIONAL_ANALYSIS"):
+                handlers.append(VIB_FREQ_HANDLER)
+        return handlers
+
+    # -- lazy quantities, parsed on first access --
+    @cached_property
+    def energies_list(self):
+        run_type = self.global_info.run_type
+        if run_type == "MD":
+            if self.md_files["ener"]:
+                return parse_md_ener(self.md_files["ener"])
+            elif self.md_files["pos"]:
+                return self._pos_xyz_info[1]
+            else:
+                # if no pos file and ener file, parse energies from the output file
                 format_logger(info="Energies", filename=self.filename)
-                self.energies_list = parse_energies_list(self.output_file)
-                self.energies_list = self.drop_last_info(
-                    self.cp2k_info, self.energies_list)
-            self.atomic_frames_list = None
-
-        frc_xyz_file_list = glob.glob(
-            os.path.join(self.path_prefix, "*frc*.xyz"))
-        if frc_xyz_file_list:
-            self.atomic_forces_list = parse_frc_xyz(frc_xyz_file_list[0])
+                energies_list = self.get_block(ENERGIES_HANDLER)
+                return self.drop_last_info(self.cp2k_info, energies_list)
+        elif (run_type == "CELL_OPT") and self._get_pos_xyz_file():
+            return self._pos_xyz_info[1]
         else:
-            format_logger(info="Forces", filename=self.filename)
-            self.atomic_forces_list = parse_atomic_forces_list(
-                self.output_file)
+            return self.get_block(ENERGIES_HANDLER)
 
-            self.atomic_forces_list = self.drop_first_info(
-                self.cp2k_info, self.atomic_forces_list, info="forces")
+    @cached_property
+    def atomic_forces_list(self):
+        if self.global_info.run_type == "MD":
+            if self.md_files["frc"]:
+                return parse_frc_xyz(self.md_files["frc"])
+            format_logger(info="Forces", filename=self.filename)
+            atomic_forces_list = self.get_block(ATOMIC_FORCES_HANDLER)
+            atomic_forces_list = self.drop_first_info(
+                self.cp2k_info, atomic_forces_list, info="forces")
+            atomic_forces_list = self.drop_last_info(
+                self.cp2k_info, atomic_forces_list, info="forces")
+            return atomic_forces_list
+        else:
+            return self.get_block(ATOMIC_FORCES_HANDLER)
 
-            self.atomic_forces_list = self.drop_last_info(
-                self.cp2k_info, self.atomic_forces_list, info="forces")
+    @cached_property
+    def stress_tensor_list(self):
+        if self.global_info.run_type != "MD":
+            return self.get_block(STRESS_TENSOR_HANDLER)
 
-        # stress tensor part
-        stress_file_list = glob.glob(
-            os.path.join(self.path_prefix, "*.stress"))
-        self.stress_tensor_list = None
-        if stress_file_list:
+        stress_file = self.md_files["stress"]
+        if stress_file:
             logger.warning(
-                f"cp2kdata found a file recording stresses: {stress_file_list[0]}"
-                f"But the parser for {stress_file_list[0]} is not supported yet"
+                f"cp2kdata found a file recording stresses: {stress_file}. "
+                f"But the stress tensors in {stress_file} include the kinetic contribution, "
+                "they are available as md_stress_list instead"
             )
             # TODO: the unit of stress is bar in -1.stress file, but not GPa in the output file
             # TODO: however, covert bar to GPa is not consistent with the output file!
             # TODO: check this latter
-            # self.stress_tensor_list = parse_md_stress(stress_file_list[0])
-
-        elif self.output_file:
+            # return parse_md_stress(stress_file)
+            return None
+        elif self.filename:
             format_logger(info="Stresses", filename=self.filename)
 
-            self.stress_tensor_list = parse_stress_tensor_list(
-                    self.output_file)
+            stress_tensor_list = self.get_block(STRESS_TENSOR_HANDLER)
 
             # stress tensor could be None if the output file doesn't contain stress information
-            if self.stress_tensor_list is not None:
-                self.stress_tensor_list = self.drop_first_info(
-                    self.cp2k_info, self.stress_tensor_list, info="stresses")
+            if stress_tensor_list is not None:
+                stress_tensor_list = self.drop_first_info(
+                    self.cp2k_info, stress_tensor_list, info="stresses")
 
-                self.stress_tensor_list = self.drop_last_info(
-                    self.cp2k_info, self.stress_tensor_list, info="stresses")
+                stress_tensor_list = self.drop_last_info(
+                    self.cp2k_info, stress_tensor_list, info="stresses")
+            return stress_tensor_list
         else:
             logger.debug("No stress tensor information found, omitted.")
+            return None
+
+    @cached_property
+    def md_stress_list(self):
+        # pressure tensors of the -1.stress file in GPa, unlike the stress tensors
+        # of the output they include the kinetic contribution
+        if (self.global_info.run_type != "MD") or (not self.md_files["stress"]):
+            return None
+        return parse_md_stress(self.md_files["stress"]) * bar2GPa
+
+    def get_md_stress_list(self):
+        return self.md_stress_list
+
+    @cached_property
+    def all_cells(self):
+        if self.global_info.run_type == "MD":
+            return self.get_md_cells()
+        else:
+            return self.get_block(ALL_CELLS_HANDLER)
+
+    @cached_property
+    def geo_opt_info(self):
+        if self.global_info.run_type == "GEO_OPT":
+            return self.get_block(GEO_OPT_INFO_HANDLER)
+        else:
+            return None
 
-        self.num_frames = len(self.energies_list)
+    @cached_property
+    def num_frames(self):
+        run_type = self.global_info.run_type
+        if run_type in ["ENERGY", "ENERGY_FORCE", "VIBRATIONAL_ANALYSIS"]:
+            return 1
+        elif run_type == "GEO_OPT":
+            frames = self.geo_opt_info
+        else:
+            frames = self.energies_list
+        # the quantity may be excluded by fields or skip
+        if frames is None:
+            return None
+        return len(frames)
+
+    @cached_property
+    def atomic_frames_list(self):
+        return self._pos_xyz_info[0]
+
+    @cached_property
+    def init_atomic_coordinates(self):
+        return self._init_atomic_info[0]
+
+    @cached_property
+    def atom_kind_list(self):
+        return self._init_atomic_info[1]
+
+    @cached_property
+    def chemical_symbols(self):
+        run_type = self.global_info.run_type
+        # symbols in pos file are used for cell_opt, and md without output
+        if (run_type == "CELL_OPT") and self._get_pos_xyz_file():
+            return self._pos_xyz_info[2]
+        elif (run_type == "MD") and (not self.filename):
+            return self._pos_xyz_info[2]
+        else:
+            return self._init_atomic_info[2]
+
+    @cached_property
+    def atomic_kind(self):
+        if self.filename:
+            return self.get_block(ATOMIC_KINDS_HANDLER)
+        else:
+            return None
+
+    @cached_property
+    def _init_atomic_info(self):
+        # initial coordinates, kind list and chemical symbols share one block
+        init_atomic_info = None
+        if self.filename:
+            init_atomic_info = self.get_block(INIT_ATOMIC_COORDINATES_HANDLER)
+        if init_atomic_info is None:
+            return None, None, None
+        return init_atomic_info
+
+    @cached_property
+    def _pos_xyz_info(self):
+        # atomic frames, energies and chemical symbols share one pos file
+        pos_xyz_file = self._get_pos_xyz_file()
+        if pos_xyz_file:
+            return parse_pos_xyz(pos_xyz_file)
+        else:
+            return None, None, None
+
+    def _get_pos_xyz_file(self):
+        if self.global_info.run_type == "MD":
+            return self.md_files["pos"]
+        elif self.global_info.run_type == "CELL_OPT":
+            pos_xyz_file_list = glob.glob(
+                os.path.join(self.path_prefix, "*pos*.xyz"))
+            if pos_xyz_file_list:
+                return pos_xyz_file_list[0]
+        return None
+
+    def setup_md(self):
+        self.md_info = self.get_md_info(ensemble_type=self.ensemble_type,
+                                        filename=self.filename,
+                                        header=self._header)
+        self.check_md_type(md_type=self.md_info.ensemble_type)
+        self.md_files = self.get_md_files(self.path_prefix)
+
+    def setup_md_cache(self):
+        # load the md quantities from the binary cache of path_prefix,
+        # or parse them and write the cache for the next time
+        cache_dir = get_cache_dir(self.path_prefix)
+        key = get_md_cache_key(
+            [self.filename, *self.md_files.values()],
+            ensemble_type=self.md_info.ensemble_type,
+            restart=self.cp2k_info.restart,
+            fields=self.fields
+        )
+        cache = load_md_cache(cache_dir, key)
+        if cache is not None:
+            logger.debug(f"Load md quantities from the cache {cache_dir}")
+            quantities, chemical_symbols = cache
+            for name, attr, _ in CACHED_QUANTITIES:
+                if name in quantities:
+                    setattr(self, attr, quantities[name])
+            if "symbols" in self.fields:
+                self.chemical_symbols = chemical_symbols
+            return
+
+        quantities = {name: getattr(self, attr) for name, attr, field in CACHED_QUANTITIES
+                      if field in self.fields}
+        save_md_cache(cache_dir, key, quantities, chemical_symbols=self.chemical_symbols)
+
+    @staticmethod
+    def get_md_files(path_prefix):
+        # the first file of each kind of md output, None if not found.
+        # the files may be compressed, e.g. Project-pos-1.xyz.gz
+        def glob_md_files(pattern):
+            return [file for suffix in ("",) + COMPRESSED_SUFFIXES
+                    for file in glob.glob(os.path.join(path_prefix, pattern + suffix))]
+
+        pos_xyz_file_list = glob_md_files("*-pos-*.xyz")
 
+        n_pos_xyz_files = len(pos_xyz_file_list)
+        if n_pos_xyz_files > 1:
+            raise ValueError(
+                f"Cp2kData found {n_pos_xyz_files} pos files.\n"
+                f"{pos_xyz_file_list}.\n"
+                f"Please remove extra pos files and keep only one pos file in the folder."
+                )
+
+        md_file_patterns = {
+            "ener": "*.ener",
+            "frc": "*frc*.xyz",
+            "stress": "*.stress",
+            "cell": "*.cell"
+        }
+        md_files = {"pos": pos_xyz_file_list[0] if pos_xyz_file_list else None}
+        for key, pattern in md_file_patterns.items():
+            file_list = glob_md_files(pattern)
+            md_files[key] = file_list[0] if file_list else None
+        return md_files
+
+    def get_md_cells(self):
         # here parse cell information
         WARNING_MSG_PARSE_CELL_FROM_OUTPUT = \
             (
@@ -483,47 +769,47 @@ class Cp2kOutput:
                 "------------------\n"
             )
 
-        cell_file_list = glob.glob(os.path.join(self.path_prefix, "*.cell"))
+        cell_file = self.md_files["cell"]
+        all_cells = None
         if (self.md_info.ensemble_type == "NVT") or \
             (self.md_info.ensemble_type == "NVE") or \
                 (self.md_info.ensemble_type == "REFTRAJ"):  # not ture REFTRAJ also contrains different cell?
-            if cell_file_list:
-                self.all_cells = parse_md_cell(cell_file_list[0])
+            if cell_file:
+                all_cells = parse_md_cell(cell_file)
             elif self.filename:
                 format_logger(info="Cells", filename=self.filename)
                 logger.warning(WARNING_MSG_PARSE_CELL_FROM_OUTPUT)
 
                 # self.organize_md_cell()
                 # parse the first cell
-                first_cell = parse_all_cells(self.output_file)
+                first_cell = self.get_block(ALL_CELLS_HANDLER)
+                # the header of a running md may not be written yet
+                if first_cell is None:
+                    return None
                 assert first_cell.shape == (1, 3, 3)
-                self.all_cells = first_cell
-                self.all_cells = np.repeat(
-                    self.all_cells, repeats=self.num_frames, axis=0)
+                all_cells = np.repeat(
+                    first_cell, repeats=self.num_frames, axis=0)
 
         elif (self.md_info.ensemble_type == "NPT_F"):
-            if cell_file_list:
+            if cell_file:
                 # all cells include initial cell
-                self.all_cells = parse_md_cell(cell_file_list[0])
+                all_cells = parse_md_cell(cell_file)
             elif self.filename:
                 format_logger(info="Cells", filename=self.filename)
                 logger.warning(WARNING_MSG_PARSE_CELL_FROM_OUTPUT)
 
-                self.organize_md_cell()
+                all_cells = self.organize_md_cell()
 
         elif (self.md_info.ensemble_type == "NPT_I"):
-            if cell_file_list:
-                self.all_cells = parse_md_cell(cell_file_list[0])
+            if cell_file:
+                all_cells = parse_md_cell(cell_file)
             elif self.filename:
                 format_logger(info="Cells", filename=self.filename)
                 logger.warning(WARNING_MSG_PARSE_CELL_FROM_OUTPUT)
 
-                self.organize_md_cell()
+                all_cells = self.organize_md_cell()
 
-        if self.output_file:
-            self.init_atomic_coordinates, self.atom_kind_list, self.chemical_symbols = parse_init_atomic_coordinates(
-                self.output_file)
-            self.atomic_kind = parse_atomic_kinds(self.output_file)
+        return all_cells
 
     def organize_md_cell(self):
         # whether reserve the first cell is determined by the restart
@@ -531,23 +817,302 @@ class Cp2kOutput:
         WARNING_MSG = "cp2kdata obtains more than one initial cell from the output file, \
                     please check if your output file has duplicated header information."
 
+        md_cell_params_handler = get_md_cell_params_handler(self.cp2k_info)
+        self.prefetch_blocks([ALL_CELLS_HANDLER, md_cell_params_handler])
         # only parse the first cell
-        first_cell = parse_all_cells(self.output_file)
+        first_cell = self.get_block(ALL_CELLS_HANDLER)
+        if first_cell is None:
+            return None
         assert first_cell.shape == (1, 3, 3), WARNING_MSG
         # parse the rest of the cells
-        self.all_cells = parse_all_md_cells(self.output_file,
-                                            cp2k_info=self.cp2k_info,
+        all_cells = md_cell_params_to_cells(self.get_block(md_cell_params_handler),
                                             init_cell_info=first_cell[0])
+        # no md step is written yet
+        if all_cells is None:
+            all_cells = np.empty((0, 3, 3), dtype=float)
         # prepend the first cell
         if self.cp2k_info.restart is not True:
-            self.all_cells = np.insert(
-                self.all_cells, 0, first_cell[0], axis=0)
+            all_cells = np.insert(
+                all_cells, 0, first_cell[0], axis=0)
+        return all_cells
+
+    def iter_frames(self):
+        """
+        yield the md frames one by one as MDFrame.
+
+        The pos, frc, ener and cell files are read line by line and merged
+        by step, so only one frame is kept in memory. Quantities which are
+        only found in the output are aligned to the frames by order. The
+        forces and stresses of the output are read step by step as well,
+        but energies and cells without an ener or cell file are parsed from
+        the whole output first.
+        """
+        assert self.global_info.run_type == "MD", "iter_frames is only available for MD run type."
+        md_files = self.md_files
+        if md_files["pos"]:
+            main_file = md_files["pos"]
+        elif md_files["frc"]:
+            main_file = md_files["frc"]
+        else:
+            raise ValueError("iter_frames requires a *-pos-*.xyz or *frc*.xyz file.")
+
+        # blocks of the output which are read step by step, unless parsed already
+        stream_handlers = []
+        forces_cursor = None
+        forces_list = None
+        if ("forces" in self.fields) and (main_file != md_files["frc"]):
+            if md_files["frc"]:
+                forces_cursor = StepCursor(
+                    (step, values) for step, _, values, _ in iter_xyz_frames(md_files["frc"]))
+            elif "atomic_forces_list" in self.__dict__:
+                forces_list = self.atomic_forces_list
+            else:
+                stream_handlers.append(ATOMIC_FORCES_HANDLER)
+
+        energies_cursor = None
+        energies_list = None
+        if "energies" in self.fields:
+            if md_files["ener"]:
+                energies_cursor = StepCursor(iter_md_table(md_files["ener"], usecols=(4,)))
+            elif not md_files["pos"]:
+                if "energies_list" not in self.__dict__:
+                    logger.warning("No ener file found, the energies of all frames are parsed at once.")
+                energies_list = self.energies_list
+
+        cells_cursor = None
+        all_cells = None
+        if "cells" in self.fields:
+            if md_files["cell"]:
+                cells_cursor = StepCursor(iter_md_table(md_files["cell"], usecols=range(2, 11)))
+            else:
+                if "all_cells" not in self.__dict__:
+                    logger.warning("No cell file found, the cells of all frames are parsed at once.")
+                all_cells = self.all_cells
+
+        stress_tensor_list = None
+        if ("stress" in self.fields) and self.filename and (not md_files["stress"]) \
+                and ("stress_tensor_list" not in self.__dict__):
+            stream_handlers.append(STRESS_TENSOR_HANDLER)
+        else:
+            stress_tensor_list = self.stress_tensor_list
+
+        with ExitStack() as stack:
+            # every quantity is read by a stream of its own, the blocks of one
+            # quantity are never held back while the other one is searched
+            forces_blocks = iter(())
+            stress_blocks = iter(())
+            if ATOMIC_FORCES_HANDLER in stream_handlers:
+                format_logger(info="Forces", filename=self.filename)
+                forces_blocks = stack.enter_context(closing(
+                    self.iter_md_step_blocks(ATOMIC_FORCES_HANDLER, info="forces")))
+            if STRESS_TENSOR_HANDLER in stream_handlers:
+                format_logger(info="Stresses", filename=self.filename)
+                stress_blocks = stack.enter_context(closing(
+                    self.iter_md_step_blocks(STRESS_TENSOR_HANDLER, info="stresses")))
+
+            for frame_idx, (step, chemical_symbols, values, energy) in enumerate(iter_xyz_frames(main_file)):
+                frame = MDFrame(step=step, chemical_symbols=chemical_symbols)
+                if main_file == md_files["pos"]:
+                    if "coordinates" in self.fields:
+                        frame.positions = values
+                elif "forces" in self.fields:
+                    frame.forces = values
+                if forces_cursor is not None:
+                    frame.forces = forces_cursor.get(step)
+                elif forces_list is not None:
+                    frame.forces = get_frame_item(forces_list, frame_idx)
+                else:
+                    frame.forces = next(forces_blocks, frame.forces)
+
+                if energies_cursor is not None:
+                    energy = energies_cursor.get(step)
+                    frame.energy = None if energy is None else energy[0]
+                elif energies_list is not None:
+                    frame.energy = get_frame_item(energies_list, frame_idx)
+                elif ("energies" in self.fields) and md_files["pos"]:
+                    frame.energy = energy
+
+                if cells_cursor is not None:
+                    cell = cells_cursor.get(step)
+                    frame.cell = None if cell is None else cell.reshape(3, 3)
+                else:
+                    frame.cell = get_frame_item(all_cells, frame_idx)
+                if stress_tensor_list is not None:
+                    frame.stress = get_frame_item(stress_tensor_list, frame_idx)
+                else:
+                    frame.stress = next(stress_blocks, None)
+                yield frame
+
+    def iter_md_step_blocks(self, handler, info="info"):
+        """
+        yield the blocks of handler one by one while the output is read
+        chunk by chunk, the first and the last ones are dropped as by
+        drop_first_info and drop_last_info.
+        """
+        with zopen(self.filename, 'rb') as fp:
+            yield from self._drop_md_step_blocks(iter_blocks_stream(fp, handler), info=info)
+
+    def _drop_md_step_blocks(self, blocks, info="info"):
+        if self.cp2k_info.restart == True:
+            logger.info(
+                f"The cp2k output is restarted from previous MD run, drop the first {info}.")
+            next(blocks, None)
+        if self.cp2k_info.terminated_by_request != True:
+            yield from blocks
+            return
+        # hold back one block, the last one is never yielded
+        previous = next(blocks, None)
+        for block in blocks:
+            yield previous
+            previous = block
+        if previous is not None:
+            print(f"The cp2k output is terminated by user request, drop the last {info}.")
+
+    def refresh(self) -> int:
+        """
+        parse the md steps written since the last refresh and append them
+        to the parsed quantities, return the number of new frames.
+
+        The byte offsets reached in the output and in the pos, frc, ener and
+        cell files are remembered, so a refresh only reads the new data.
+        Only complete frames, rows and md steps are parsed, a step which is
+        still being written is picked up by a later refresh. The first
+        refresh parses all files from the beginning.
+        """
+        assert self.global_info.run_type == "MD", "refresh is only available for MD run type."
+        if self._follow_offsets is None:
+            self._follow_offsets = {}
+            self._md_data = {}
+            self._blocks = {}
+            self._follow_num_frames = 0
+            self._follow_ended = False
+        offsets = self._follow_offsets
+        md_data = self._md_data
+        md_files = self.md_files
+
+        # the steps are taken from the pos file, or the frc file without pos file
+        for kind in ["pos", "frc"]:
+            if not md_files[kind]:
+                continue
+            if (kind == "frc") and ("forces" not in self.fields) and md_files["pos"]:
+                continue
+            values, comments, chemical_symbols, offsets[kind] = read_new_xyz_frames(
+                md_files[kind], offset=offsets.get(kind, 0))
+            md_data[kind] = append_frames(md_data.get(kind), values)
+            if kind == "pos":
+                energies = np.array([ENERGY_RE.search(comment)["energy"] for comment in comments],
+                                    dtype=np.float64)
+                md_data["pos_energies"] = append_frames(md_data.get("pos_energies"), energies)
+                md_data["symbols"] = md_data.get("symbols") or chemical_symbols
+            if (kind == "pos") or (not md_files["pos"]):
+                step_matches = [STEP_RE.search(comment) for comment in comments]
+                md_data["steps"] = md_data.get("steps", []) + \
+                    [int(match["step"]) if match else None for match in step_matches]
+
+        if md_files["ener"] and ("energies" in self.fields):
+            _, values, offsets["ener"] = read_new_md_table(
+                md_files["ener"], usecols=(4,), offset=offsets.get("ener", 0))
+            md_data["ener"] = append_frames(md_data.get("ener"), values[:, 0])
+        if md_files["cell"] and ("cells" in self.fields):
+            _, values, offsets["cell"] = read_new_md_table(
+                md_files["cell"], usecols=range(2, 11), offset=offsets.get("cell", 0))
+            md_data["cell"] = append_frames(md_data.get("cell"), values.reshape(-1, 3, 3))
+
+        if self.filename:
+            self._refresh_output_blocks()
+
+        # quantities derived from the md data and the output blocks are
+        # computed again when they are accessed
+        self.close()
+        for attr in ["output_index", "num_frames", "_pos_xyz_info", "_init_atomic_info"]:
+            self.__dict__.pop(attr, None)
+        for field in self.fields:
+            for attr in OUTPUT_FIELDS[field]:
+                self.__dict__.pop(attr, None)
+        if md_files["pos"]:
+            self._pos_xyz_info = (md_data.get("pos"), md_data.get("pos_energies"), md_data.get("symbols"))
+        if md_files["frc"] and ("forces" in self.fields):
+            self.atomic_forces_list = md_data.get("frc")
+        if md_files["ener"] and ("energies" in self.fields):
+            self.energies_list = md_data.get("ener")
+        if md_files["cell"] and ("cells" in self.fields):
+            self.all_cells = md_data.get("cell")
+
+        # a frame is complete once all its quantities are written,
+        # stresses are not necessarily printed at every step
+        num_frames = [len(values) for values in [self.atomic_frames_list, self.atomic_forces_list,
+                                                  self.energies_list, self.all_cells]
+                      if values is not None]
+        num_frames = min(num_frames) if num_frames else 0
+        num_new_frames = num_frames - self._follow_num_frames
+        self._follow_num_frames = num_frames
+        return num_new_frames
+
+    def _refresh_output_blocks(self):
+        # blocks of the followed fields in the complete steps of the new output
+        handlers = self.get_field_handlers(
+            [field for field in self.fields if field in FOLLOWED_FIELDS])
+        followed_names = [handler.name for handler in handlers]
+        # other blocks are parsed again from the whole output on access
+        for name in list(self._blocks):
+            if name not in followed_names:
+                del self._blocks[name]
+
+        with open(self.filename, "rb") as fp:
+            fp.seek(self._follow_offsets.get("output", 0))
+            buffer = fp.read()
+        end = find_complete_steps_end(buffer)
+        handlers = [handler for handler in handlers
+                    if (handler.name in MD_STEP_BLOCKS) or (self._blocks.get(handler.name) is None)]
+        blocks = scan_blocks(buffer[:end], handlers) if end else {}
+        for handler in handlers:
+            block = blocks.get(handler.name, None)
+            if handler.name in MD_STEP_BLOCKS:
+                self._blocks[handler.name] = append_frames(self._blocks.get(handler.name), block)
+            else:
+                self._blocks[handler.name] = block
+        self._follow_offsets["output"] = self._follow_offsets.get("output", 0) + end
+
+        # the whole buffer is complete only once the program has ended
+        if end and (end == len(buffer)):
+            self._follow_ended = True
+            self.cp2k_info.terminated_by_request = parse_terminated_by_request(self.filename)
+
+    def follow(self, interval: float = 10.0, timeout: float = None):
+        """
+        yield the frames of a running md as MDFrame as soon as they are
+        complete. The files are refreshed every interval seconds, until
+        the output reports the end of the program or no new frame has been
+        written for timeout seconds.
+        """
+        frame_idx = 0
+        last_update = time.monotonic()
+        while True:
+            if self.refresh() > 0:
+                last_update = time.monotonic()
+            steps = self._md_data.get("steps", [])
+            for frame_idx in range(frame_idx, self._follow_num_frames):
+                yield MDFrame(
+                    step=get_frame_item(steps, frame_idx),
+                    chemical_symbols=self.chemical_symbols,
+                    positions=get_frame_item(self.atomic_frames_list, frame_idx),
+                    forces=get_frame_item(self.atomic_forces_list, frame_idx),
+                    energy=get_frame_item(self.energies_list, frame_idx),
+                    cell=get_frame_item(self.all_cells, frame_idx),
+                    stress=get_frame_item(self.stress_tensor_list, frame_idx)
+                )
+            frame_idx = self._follow_num_frames
+            if self._follow_ended:
+                return
+            if (timeout is not None) and (time.monotonic() - last_update > timeout):
+                return
+            time.sleep(interval)
 
     @cached_property
     def vib_freq_list(self):
         assert self.global_info.run_type == "VIBRATIONAL_ANALYSIS", "vibrational frequency is only available for VIBRATIONAL_ANALYSIS run type."
         # use cached property to prase only once
-        return parse_vibration_freq_list(self.output_file)
+        return self.get_block(VIB_FREQ_HANDLER)
 
     def get_vib_freq_list(self):
         return self.vib_freq_list
@@ -572,9 +1137,9 @@ class Cp2kOutput:
         return array
 
     @staticmethod
-    def get_global_info(run_type=None, filename=None):
+    def get_global_info(run_type=None, filename=None, header=None):
         if filename:
-            global_info = parse_global_info(filename)
+            global_info = parse_global_info(filename, header=header)
         elif run_type:
             global_info = GlobalInfo(run_type=run_type.upper())
         else:
@@ -582,9 +1147,9 @@ class Cp2kOutput:
         return global_info
 
     @staticmethod
-    def get_md_info(ensemble_type=None, filename=None):
+    def get_md_info(ensemble_type=None, filename=None, header=None):
         if filename:
-            md_info = parse_md_info(filename)
+            md_info = parse_md_info(filename, header=header)
         elif ensemble_type:
             md_info = MDInfo(ensemble_type=ensemble_type.upper())
         else:
@@ -9,6 +9,7 @@ from matplotlib.gridspec import GridSpec
 from scipy.ndimage import gaussian_filter1d
 
 from cp2kdata.units import au2eV
+from cp2kdata.compression import zopen, zloadtxt, strip_compressed_suffix
 
 atomic_color_map = {
     'Ac': (0.39344, 0.62101, 0.45034),
@@ -221,7 +222,7 @@ class Cp2kPdos():
         Returns:
             str: The element extracted from the first line of the file.
         """
-        with open(self.file) as f:
+        with zopen(self.file) as f:
             first_line = f.readline()
             element = first_line.split()[6]
         return element
@@ -235,7 +236,7 @@ class Cp2kPdos():
         """
         # this is fermi energy not fermi level!
         # fermi energy is same as HOMO energy
-        with open(self.file) as f:
+        with zopen(self.file) as f:
             first_line = f.readline()
             fermi_idx = first_line.split().index("E(Fermi)")
             fermi = first_line.split()[fermi_idx+2]
@@ -249,13 +250,13 @@ class Cp2kPdos():
         Returns:
             numpy.ndarray: An array of DOS energies in eV.
         """
-        energies = np.loadtxt(self.file, usecols=1)
+        energies = zloadtxt(self.file, usecols=1)
         energies = energies * au2eV
         return energies
 
     @property
     def occupation(self):
-        occupation = np.loadtxt(self.file, usecols=2)
+        occupation = zloadtxt(self.file, usecols=2)
 
         return occupation
 
@@ -295,19 +296,19 @@ class Cp2kPdos():
         fermi = self.fermi
         #steplen = 0.1
         if (dos_type == "custom") and (usecols is not None):
-            weights = np.loadtxt(file, usecols=usecols).sum(axis=1)
+            weights = zloadtxt(file, usecols=usecols).sum(axis=1)
             print("use customed columns")
         elif dos_type == "total":
-            tmp_len = len(np.loadtxt(file, usecols=2))
+            tmp_len = len(zloadtxt(file, usecols=2))
             weights = np.ones(tmp_len)
         elif dos_type == "s":
-            weights = np.loadtxt(file, usecols=3)
+            weights = zloadtxt(file, usecols=3)
         elif dos_type == "p":
-            weights = np.loadtxt(file, usecols=(4, 5, 6)).sum(axis=1)
+            weights = zloadtxt(file, usecols=(4, 5, 6)).sum(axis=1)
         elif dos_type == "d":
-            weights = np.loadtxt(file, usecols=(7, 8, 9, 10, 11)).sum(axis=1)
+            weights = zloadtxt(file, usecols=(7, 8, 9, 10, 11)).sum(axis=1)
         elif dos_type == "f":
-            weights = np.loadtxt(file, usecols=(
+            weights = zloadtxt(file, usecols=(
                 12, 13, 14, 15, 16, 17, 18)).sum(axis=1)
         else:
             raise NameError("dos type does not exist!")
@@ -334,7 +335,7 @@ PDOS_NAME_RE = re.compile(
 
 def pdos_name_parser(filename):
     # used to parse pdos filename
-    filename = os.path.basename(filename)
+    filename = os.path.basename(strip_compressed_suffix(filename))
     match = PDOS_NAME_RE.match(filename)
 
     project_name = match["project_name"]
@@ -0,0 +1,133 @@
+import operator
+import os
+
+import numpy as np
+
+from cp2kdata.log import get_logger
+from cp2kdata.compression import is_compressed
+from cp2kdata.block_parser.md_xyz import ENERGY_RE, STEP_RE, scan_frame_offsets
+from cp2kdata.block_parser.text_rows import load_rows
+
+logger = get_logger(__name__)
+
+
+class Cp2kXYZTrajectory:
+    """
+    Random access to the frames of cp2k xyz trajectories such as
+    *-pos-*.xyz, *-frc-*.xyz and *-vel-*.xyz files.
+
+    Only the byte offsets of the frames are determined on opening, frames
+    are read from the file when they are requested:
+
+    traj = Cp2kXYZTrajectory("Project-pos-1.xyz")
+    len(traj)       # number of frames
+    traj[0]         # (natoms, 3) array of the first frame
+    traj[::100]     # (nframes, natoms, 3) array of every 100th frame
+    """
+
+    def __init__(self, xyz_file: str):
+        if is_compressed(xyz_file):
+            raise ValueError(
+                f"Random access to the compressed file {xyz_file} is not supported, "
+                "use parse_pos_xyz or parse_frc_xyz instead.")
+        self.xyz_file = xyz_file
+        with open(xyz_file, "rb") as fp:
+            self.natoms = int(fp.readline())
+            fp.readline()
+            self.chemical_symbols = [
+                fp.readline().split()[0].decode().lower().capitalize()
+                for _ in range(self.natoms)
+            ]
+            frame_size = fp.tell()
+        self.frame_offsets = self._get_uniform_frame_offsets(frame_size)
+        if self.frame_offsets is None:
+            logger.debug(f"Frames in {xyz_file} differ in size, scan the frame offsets.")
+            self.frame_offsets = scan_frame_offsets(xyz_file, self.natoms)
+
+    def _get_uniform_frame_offsets(self, frame_size):
+        # cp2k writes fixed width lines, so all frames usually have the same
+        # size and the offsets follow from the first frame. Probe the middle
+        # and the last frame, the frames read later are checked again.
+        num_frames = os.path.getsize(self.xyz_file) // frame_size
+        if num_frames == 0:
+            return None
+        frame_offsets = np.arange(num_frames + 1, dtype=np.int64) * frame_size
+        with open(self.xyz_file, "rb") as fp:
+            for idx in {num_frames // 2, num_frames - 1}:
+                if self._read_frame_lines(fp, frame_offsets, idx) is None:
+                    return None
+        return frame_offsets
+
+    def _read_frame_lines(self, fp, frame_offsets, idx):
+        # lines of the frame idx, None if the offsets don't match a frame
+        start, end = frame_offsets[idx], frame_offsets[idx + 1]
+        fp.seek(start)
+        data = fp.read(end - start)
+        if not data.endswith(b"\n"):
+            return None
+        lines = data.decode().splitlines()
+        try:
+            natoms = int(lines[0])
+        except (IndexError, ValueError):
+            return None
+        if (natoms != self.natoms) or (len(lines) != self.natoms + 2):
+            return None
+        return lines
+
+    def _get_frame_lines(self, fp, idx):
+        lines = self._read_frame_lines(fp, self.frame_offsets, idx)
+        if lines is None:
+            # the frames were assumed to have the same size, fall back to a scan
+            self.frame_offsets = scan_frame_offsets(self.xyz_file, self.natoms)
+            lines = self._read_frame_lines(fp, self.frame_offsets, idx)
+        if lines is None:
+            raise ValueError(
+                f"Cannot read frame {idx} of {self.xyz_file}, "
+                f"only trajectories with a constant number of atoms are supported.")
+        return lines
+
+    def _get_indices(self, idx):
+        num_frames = len(self)
+        if isinstance(idx, slice):
+            return range(num_frames)[idx]
+        if isinstance(idx, (list, tuple, np.ndarray)):
+            return [self._get_indices(ii) for ii in idx]
+        idx = operator.index(idx)
+        if idx < 0:
+            idx += num_frames
+        if not 0 <= idx < num_frames:
+            raise IndexError(f"frame index out of range for {num_frames} frames")
+        return idx
+
+    def __len__(self):
+        return len(self.frame_offsets) - 1
+
+    def __getitem__(self, idx):
+        indices = self._get_indices(idx)
+        with open(self.xyz_file, "rb") as fp:
+            if isinstance(indices, int):
+                lines = self._get_frame_lines(fp, indices)
+                return load_rows(lines[2:], usecols=(1, 2, 3), dtype=np.float64, ndmin=2)
+            values = np.empty((len(indices), self.natoms, 3), dtype=np.float64)
+            for values_idx, frame_idx in enumerate(indices):
+                lines = self._get_frame_lines(fp, frame_idx)
+                values[values_idx] = load_rows(
+                    lines[2:], usecols=(1, 2, 3), dtype=np.float64, ndmin=2)
+        return values
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def get_comment(self, idx: int) -> str:
+        idx = self._get_indices(idx)
+        with open(self.xyz_file, "rb") as fp:
+            return self._get_frame_lines(fp, idx)[1]
+
+    def get_step(self, idx: int):
+        match = STEP_RE.search(self.get_comment(idx))
+        return int(match["step"]) if match else None
+
+    def get_energy(self, idx: int):
+        match = ENERGY_RE.search(self.get_comment(idx))
+        return float(match["energy"]) if match else None
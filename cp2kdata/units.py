@@ -25,5 +25,7 @@ au2eV = 2.72113838565563E+01
 au2Hz = 6.57968392072181E+15
 au2percm = 2.19474631370540E+05
 
+bar2GPa = 1.0E-04
+
 kB = kB_J_per_K * au2eV / au2J
 WaveNumber2eV = au2eV / au2percm
@@ -11,6 +11,7 @@ from ase.geometry.analysis import Analysis
 from ase.io import read, write
 
 from cp2kdata.log import get_logger
+from cp2kdata.compression import zopen
 
 logger = get_logger(__name__)
 
@@ -90,14 +91,14 @@ def file_content(file, num):
     #      a tuple (num1, ) -> return the line content from
     #                          num1, to the end of file
     if isinstance(num, int):
-        with open(file) as f:
+        with zopen(file) as f:
             for _idx, line in enumerate(f):
                 if _idx == num:
                     return line
     elif isinstance(num, tuple):
         content = ""
         if len(num) == 2:
-            with open(file) as f:
+            with zopen(file) as f:
                 for _idx, line in enumerate(f):
                     if (_idx >= num[0]) and (_idx < num[1]):
                         content += line
@@ -107,7 +108,7 @@ def file_content(file, num):
                         continue
             return content
         elif len(num) == 1:
-            with open(file) as f:
+            with zopen(file) as f:
                 for _idx, line in enumerate(f):
                     if (_idx >= num[0]):
                         content += line
@@ -0,0 +1,43 @@
+from cp2kdata import Cp2kOutput
+from cp2kdata.batch import parse_many, STATUS_OK, STATUS_NOT_CONVERGED, STATUS_FAILED
+import numpy as np
+import pytest
+
+
+e_f_output_list = [
+    "tests/test_energy_force/v6.1/normal/output",
+    "tests/test_energy_force/v7.1/normal/output",
+    "tests/test_energy_force/v8.1/normal/output",
+    "tests/test_energy_force/v9.0/normal/output",
+]
+paths = e_f_output_list + [
+    "tests/test_dpdata/v7.1/e_f_no_converge/output",
+    "tests/test_dpdata/v2023.1/aimd_nvt/output",
+    "tests/test_batch/missing_output",
+]
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_parse_many(n_workers):
+    result = parse_many(paths, n_workers=n_workers, max_pending=2)
+    assert len(result) == len(paths)
+    assert result.status.tolist() == [STATUS_OK] * 4 + [STATUS_NOT_CONVERGED, STATUS_FAILED, STATUS_FAILED]
+    assert result.errors[:4] == [None] * 4
+    assert "ENERGY_FORCE" in result.errors[5]
+    assert result.ok.sum() == 4
+    assert np.isnan(result.energies[4:]).all()
+    assert result.natoms[4:].tolist() == [0, 0, 0]
+
+    for idx, path in enumerate(e_f_output_list):
+        cp2k_output = Cp2kOutput(path)
+        atoms = result.get_atoms_slice(idx)
+        assert result.energies[idx] == cp2k_output.energies_list[-1]
+        np.testing.assert_array_equal(result.cells[idx], cp2k_output.get_init_cell())
+        np.testing.assert_array_equal(result.coords[atoms], cp2k_output.init_atomic_coordinates)
+        np.testing.assert_array_equal(result.forces[atoms], cp2k_output.atomic_forces_list[-1])
+        assert result.chemical_symbols[atoms].tolist() == cp2k_output.get_chemical_symbols()
+        if cp2k_output.stress_tensor_list is not None:
+            np.testing.assert_array_equal(result.stresses[idx], cp2k_output.stress_tensor_list[-1])
+        else:
+            assert np.isnan(result.stresses[idx]).all()
+    assert len(result.coords) == result.atom_offsets[-1]
@@ -2,6 +2,7 @@ import pytest
 import numpy as np
 from ase.geometry.cell import cellpar_to_cell
 from ase.geometry.cell import cell_to_cellpar
+from cp2kdata.cell import cellpars_to_cells, cells_to_cellpars
 from cp2kdata.cell import Cp2kCell  # Replace 'your_module' with the actual module containing the Cp2kCell class.
 
 class TestCp2kCell:
@@ -101,3 +102,18 @@ class TestCp2kCell:
         expected_cell_param = self._create_expected_cell_param(cell_param)
         expected_cell_lengths = expected_cell_param[:3]
         assert np.array_equal(cell.get_cell_lengths(), expected_cell_lengths)
+
+
+def test_batched_cell_conversion():
+    rng = np.random.default_rng(0)
+    cellpars = np.column_stack([rng.uniform(5, 20, (100, 3)), rng.uniform(70, 110, (100, 3))])
+    cellpars[::4, 3:] = 90.0
+    cellpars[1::4, 5] = 120.0
+    expected_cells = np.array([cellpar_to_cell(cellpar) for cellpar in cellpars])
+    cells = cellpars_to_cells(cellpars)
+    assert cells.shape == (100, 3, 3)
+    assert np.array_equal(cells, expected_cells)
+    assert np.array_equal(cellpars_to_cells(cellpars[0]), expected_cells[0])
+    expected_cellpars = np.array([cell_to_cellpar(cell) for cell in expected_cells])
+    assert np.array_equal(cells_to_cellpars(cells), expected_cellpars)
+    assert np.allclose(cells_to_cellpars(cells), cellpars)
@@ -0,0 +1,91 @@
+from cp2kdata import Cp2kOutput, Cp2kCube
+from cp2kdata.block_parser.md_xyz import parse_pos_xyz
+from cp2kdata.block_parser.scanner import iter_blocks_stream, scan_blocks, scan_stream
+from cp2kdata.block_parser.forces import ATOMIC_FORCES_HANDLER
+from cp2kdata.block_parser.energies import ENERGIES_HANDLER
+import bz2
+import gzip
+import lzma
+import io
+import os
+import numpy as np
+import pytest
+
+
+compressors = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+
+def compress_file(src, dst_dir, suffix):
+    dst = os.path.join(dst_dir, os.path.basename(src) + suffix)
+    with open(src, "rb") as fp_src, compressors[suffix](dst, "wb") as fp_dst:
+        fp_dst.write(fp_src.read())
+    return dst
+
+
+@pytest.fixture(params=list(compressors), ids=list(compressors))
+def suffix(request):
+    return request.param
+
+
+def test_output(suffix, tmp_path):
+    e_f_path = "tests/test_energy_force/v7.1/normal"
+    compress_file(os.path.join(e_f_path, "output"), tmp_path, suffix)
+    output = Cp2kOutput("output", path_prefix=e_f_path)
+    compressed_output = Cp2kOutput("output" + suffix, path_prefix=str(tmp_path))
+    assert compressed_output.get_version_string() == output.get_version_string()
+    assert np.array_equal(compressed_output.energies_list, output.energies_list)
+    assert np.array_equal(compressed_output.atomic_forces_list, output.atomic_forces_list)
+    assert np.array_equal(compressed_output.stress_tensor_list, output.stress_tensor_list)
+    assert compressed_output.get_chemical_symbols() == output.get_chemical_symbols()
+
+
+def test_md(suffix, tmp_path):
+    md_path = "tests/test_dpdata/v2023.2/aimd_nvt_restart"
+    for name in os.listdir(md_path):
+        if os.path.isfile(os.path.join(md_path, name)):
+            compress_file(os.path.join(md_path, name), tmp_path, suffix)
+    output = Cp2kOutput("output", run_type="MD", path_prefix=md_path)
+    compressed_output = Cp2kOutput("output" + suffix, run_type="MD", path_prefix=str(tmp_path))
+    assert np.array_equal(compressed_output.atomic_frames_list, output.atomic_frames_list)
+    assert np.array_equal(compressed_output.atomic_forces_list, output.atomic_forces_list)
+    assert np.array_equal(compressed_output.energies_list, output.energies_list)
+    assert np.array_equal(compressed_output.all_cells, output.all_cells)
+
+
+def test_pos_xyz(suffix, tmp_path):
+    pos_xyz_file = "tests/test_dpdata/v7.1/aimd/DPGEN-pos-1.xyz"
+    compressed_file = compress_file(pos_xyz_file, tmp_path, suffix)
+    pos_list, energies_list, chemical_symbols = parse_pos_xyz(pos_xyz_file)
+    for n_workers in [1, 2]:
+        compressed_pos_xyz = parse_pos_xyz(compressed_file, n_workers=n_workers)
+        assert np.array_equal(compressed_pos_xyz[0], pos_list)
+        assert np.array_equal(compressed_pos_xyz[1], energies_list)
+        assert compressed_pos_xyz[2] == chemical_symbols
+
+
+def test_cube(tmp_path):
+    cube_file = "tests/test_cube/Si_bulk8-v_hartree-1_0.cube"
+    compressed_file = compress_file(cube_file, tmp_path, ".gz")
+    assert np.array_equal(Cp2kCube(compressed_file).cube_vals, Cp2kCube(cube_file).cube_vals)
+
+
+def test_scan_stream():
+    with open("tests/test_dpdata/v2023.1/aimd_nvt/output", "rb") as fp:
+        output_file = fp.read()
+    handlers = [ENERGIES_HANDLER, ATOMIC_FORCES_HANDLER]
+    blocks = scan_blocks(output_file, handlers)
+    # blocks straddle the boundaries of small chunks
+    stream_blocks = scan_stream(io.BytesIO(output_file), handlers, chunk_size=32 * 1024)
+    for handler in handlers:
+        assert np.array_equal(stream_blocks[handler.name], blocks[handler.name])
+
+
+def test_iter_blocks_stream():
+    with open("tests/test_dpdata/v2023.1/aimd_nvt/output", "rb") as fp:
+        output_file = fp.read()
+    handlers = [ENERGIES_HANDLER, ATOMIC_FORCES_HANDLER]
+    blocks = scan_blocks(output_file, handlers)
+    for handler in handlers:
+        # blocks straddle the boundaries of small chunks
+        items = list(iter_blocks_stream(io.BytesIO(output_file), handler, chunk_size=32 * 1024))
+        assert np.array_equal(handler.finalize(items), blocks[handler.name])
@@ -1,10 +1,15 @@
+import functools
+import io
 import os
 import filecmp
+import shutil
 
 import pytest
 import numpy as np
 
-from cp2kdata import Cp2kCube
+from cp2kdata import Cp2kCube, Cp2kCubeTraj
+import cp2kdata.cube.cube as cube_module
+from cp2kdata.cube.cube import iter_cube_vals, format_cube_vals, format_cube_val
 
 
 path_prefix = "tests/test_cube/"
@@ -114,3 +119,141 @@ class TestCp2kCube():
 
 
 
+
+
+@pytest.mark.parametrize("chunk", [
+    # cp2k and Cp2kCube.write_cube styles, with exponents beyond the exact powers of ten
+    b"  0.20871E+00 -0.12345E-03  0.99999E+99\n -0.10000E-99  0.00000E+00\n",
+    b"  2.08710E-01 -1.23450E-04\n  9.99990E+98  1.00000E-30\n",
+    # other layouts are left to the decimal parser
+    b"0.5 -1.25e-3\n 3.0E+00 7\n",
+    b"  2.08710E-01 -1.23450E-04\r\n",
+])
+def test_iter_cube_vals(chunk):
+    for chunk_size in [7, 1024]:
+        vals = np.concatenate(list(iter_cube_vals(io.BytesIO(chunk), chunk_size=chunk_size)))
+        np.testing.assert_array_equal(vals, np.array(chunk.split(), dtype=float))
+
+
+def test_cube_cache(tmp_path):
+    cube_file = tmp_path / "Si_bulk8-v_hartree-1_0.cube"
+    shutil.copy(os.path.join(path_prefix, "Si_bulk8-v_hartree-1_0.cube"), cube_file)
+    cube = Cp2kCube(cube_file)
+    # the first load writes the sidecar, the second one memory-maps it
+    for _ in range(2):
+        cached_cube = Cp2kCube(cube_file, use_cache=True)
+        np.testing.assert_array_equal(cached_cube.cube_vals, cube.cube_vals)
+    assert isinstance(cached_cube.cube_vals, np.memmap)
+    np.testing.assert_array_equal(cached_cube.cell.cell_matrix, cube.cell.cell_matrix)
+    np.testing.assert_array_equal(cached_cube.stc.positions, cube.stc.positions)
+    np.testing.assert_array_equal(cached_cube.stc.numbers, cube.stc.numbers)
+    np.testing.assert_array_equal(cached_cube.get_pav()[1], cube.get_pav()[1])
+    assert cached_cube.get_integration(start_z=5.0, end_z=7.0) == cube.get_integration(start_z=5.0, end_z=7.0)
+    reduced_cube = cached_cube.reduce_resolution(stride=2)
+    np.testing.assert_array_equal(reduced_cube.cube_vals, cube.reduce_resolution(stride=2).cube_vals)
+    np.testing.assert_array_equal(reduced_cube.cell.grid_point, cube.reduce_resolution(stride=2).cell.grid_point)
+
+    # a changed cube file is parsed again
+    with open(cube_file, "a") as fp:
+        fp.write("\n")
+    assert not isinstance(Cp2kCube(cube_file, use_cache=True).cube_vals, np.memmap)
+
+
+def test_format_cube_vals():
+    rng = np.random.default_rng(0)
+    vals = np.concatenate([
+        rng.normal(size=1000) * 10.0 ** rng.integers(-120, 120, size=1000),
+        10.0 ** np.arange(-30, 30), np.round(rng.normal(size=1000), 5),
+        [0.0, -0.0, 0.5, 9.999995, 9.99995, 99999.5, np.nan, np.inf]
+    ])
+    for cp2k_style in [False, True]:
+        formatted = format_cube_vals(vals, cp2k_style=cp2k_style).tobytes().decode()
+        assert formatted == "".join(format_cube_val(val, cp2k_style=cp2k_style) for val in vals)
+    assert format_cube_val(0.20871, cp2k_style=True) == "  0.20871E+00"
+    assert format_cube_val(-2.0871e-5, cp2k_style=True) == " -0.20871E-04"
+    assert format_cube_val(0.20871) == "  2.08710E-01"
+
+
+@pytest.mark.parametrize("grid_point", [[2, 3, 6], [2, 3, 7]])
+def test_write_cube_cp2k_style(grid_point, tmp_path):
+    cube = Cp2kCube(os.path.join(path_prefix, "Si_bulk8-v_hartree-1_0.cube"))
+    cube.cell.grid_point = np.array(grid_point)
+    cube.cube_vals = np.random.default_rng(0).normal(size=grid_point)
+    cube.write_cube(tmp_path/"cp2k_style.cube", cp2k_style=True)
+    with open(tmp_path/"cp2k_style.cube") as fp:
+        lines = fp.readlines()[6+cube.num_atoms:]
+    # 6 values per line and a line break after each z row
+    assert len(lines) == grid_point[0] * grid_point[1] * -(-grid_point[2] // 6)
+    assert lines[0].startswith("  0.") or lines[0].startswith(" -0.")
+    new_cube = Cp2kCube(tmp_path/"cp2k_style.cube")
+    np.testing.assert_array_equal(new_cube.cube_vals, np.array([float(f"{val:.4E}") for val in cube.cube_vals.ravel()]).reshape(grid_point))
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_cube_traj(n_workers, tmp_path):
+    cube = Cp2kCube(os.path.join(path_prefix, "Si_bulk8-v_hartree-1_0.cube"))
+    rng = np.random.default_rng(0)
+    cubes = []
+    for step in [100, 0, 50]:
+        new_cube = cube.copy()
+        new_cube.cube_vals = cube.cube_vals + rng.normal(size=cube.cube_vals.shape)
+        new_cube.write_cube(tmp_path/f"Si_bulk8-v_hartree-1_{step}.cube")
+        cubes.append((step, Cp2kCube(tmp_path/f"Si_bulk8-v_hartree-1_{step}.cube")))
+    # other series and files are not picked up
+    cube.write_cube(tmp_path/"Si_bulk8-ELECTRON_DENSITY-1_0.cube")
+    cube.write_cube(tmp_path/"Si_bulk8-v_hartree-1.cube")
+    cubes = [cube for step, cube in sorted(cubes, key=lambda item: item[0])]
+
+    cube_traj = Cp2kCubeTraj(tmp_path, prefix="*-v_hartree-1", n_workers=n_workers)
+    assert len(cube_traj) == 3
+    assert cube_traj.steps.tolist() == [0, 50, 100]
+    all_vals = np.stack([cube.cube_vals for cube in cubes])
+    mean_cube, var = cube_traj.get_mean_cube(return_var=True)
+    np.testing.assert_allclose(mean_cube.cube_vals, all_vals.mean(axis=0), rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(var, all_vals.var(axis=0), rtol=1e-10, atol=1e-12)
+    np.testing.assert_array_equal(mean_cube.cell.cell_matrix, cube.cell.cell_matrix)
+
+    pav_x, pav, pav_std = cube_traj.get_pav(axis="z", return_std=True)
+    all_pav = np.stack([cube.get_pav(axis="z")[1] for cube in cubes])
+    np.testing.assert_array_equal(pav_x, cube.get_pav(axis="z")[0])
+    np.testing.assert_allclose(pav, all_pav.mean(axis=0), rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(pav_std, all_pav.std(axis=0), rtol=1e-10, atol=1e-12)
+    mav_x, mav = cube_traj.get_mav(l1=1, l2=1, ncov=2)
+    np.testing.assert_allclose(mav, mean_cube.get_mav(l1=1, l2=1, ncov=2)[1], rtol=1e-10, atol=1e-12)
+
+    for traj_cube, cube in zip(cube_traj.iter_cubes(), cubes):
+        np.testing.assert_array_equal(traj_cube.cube_vals, cube.cube_vals)
+
+
+@pytest.mark.parametrize("axis", ["x", "y", "z"])
+def test_stream_pav(axis, tmp_path):
+    cube = Cp2kCube(os.path.join(path_prefix, "Si_bulk8-v_hartree-1_0.cube"))
+    cube.cube_vals = np.random.default_rng(0).normal(size=cube.cube_vals.shape)
+    cube.write_cube(tmp_path/"random.cube")
+    cube = Cp2kCube(tmp_path/"random.cube")
+    for interpolate in [False, True]:
+        pav_x, pav = Cp2kCube.stream_pav(tmp_path/"random.cube", axis=axis, interpolate=interpolate)
+        pav_x_answer, pav_answer = cube.get_pav(axis=axis, interpolate=interpolate)
+        np.testing.assert_array_equal(pav_x, pav_x_answer)
+        np.testing.assert_allclose(pav, pav_answer, rtol=1e-10, atol=1e-12)
+    mav_x, mav = Cp2kCube.stream_mav(tmp_path/"random.cube", l1=1, l2=1, ncov=2, axis=axis)
+    np.testing.assert_allclose(mav, cube.get_mav(l1=1, l2=1, ncov=2, axis=axis)[1], rtol=1e-10, atol=1e-12)
+
+
+def test_stream_pav_small_chunks(monkeypatch):
+    # z rows straddle the chunks
+    cube_file = os.path.join(path_prefix, "Si_bulk8-v_hartree-1_0.cube")
+    monkeypatch.setattr(cube_module, "iter_cube_vals", functools.partial(iter_cube_vals, chunk_size=1000))
+    np.testing.assert_allclose(Cp2kCube.stream_pav(cube_file, axis="x")[1],
+                               Cp2kCube(cube_file).get_pav(axis="x")[1], rtol=1e-10, atol=1e-12)
+
+
+def test_truncated_cube(tmp_path):
+    with open(os.path.join(path_prefix, "Si_bulk8-v_hartree-1_0.cube"), "rb") as fp:
+        content = fp.read()
+    cube_file = tmp_path/"truncated.cube"
+    cube_file.write_bytes(content[:len(content)//2].rsplit(b"\n", 1)[0] + b"\n")
+    with pytest.raises(ValueError, match="doesn't contain the values of all"):
+        Cp2kCube(cube_file)
+    with pytest.raises(ValueError, match="doesn't contain the values of all"):
+        Cp2kCube.stream_pav(cube_file)
@@ -0,0 +1,106 @@
+from cp2kdata.deepmd import convert_to_deepmd, DeepmdShardWriter
+import dpdata
+# the plugin is registered once dpdata is imported
+from cp2kdata.dpdata_plugin import CP2KMDFormat, iter_md_labeled_batches
+import numpy as np
+import os
+import pytest
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_convert_to_deepmd(n_workers, tmp_path):
+    num_frames = convert_to_deepmd("tests/test_dpdata/v7.1", tmp_path, set_size=2, n_workers=n_workers)
+    # the run which is not converged is skipped
+    assert num_frames == {
+        "O32N80C16H64": 11,
+        "O64H128": 6,
+        "Ag13O2": 3,
+        "Fe16Fe26O18": 1,
+        "Al40Co40H294O227": 1
+    }
+    for system_name, system_frames in num_frames.items():
+        sets = sorted(name for name in os.listdir(tmp_path/system_name) if name.startswith("set."))
+        assert [len(np.load(tmp_path/system_name/set_name/"energy.npy")) for set_name in sets] == \
+            [2] * (system_frames // 2) + [1] * (system_frames % 2)
+
+    ref_system = dpdata.LabeledSystem(
+        "tests/test_dpdata/v7.1/aimd_npt_f", cp2k_output_name="output", fmt="cp2kdata/md")
+    system = dpdata.LabeledSystem(str(tmp_path/"O32N80C16H64"), fmt="deepmd/npy")
+    assert system.data["atom_names"] == list(ref_system.data["atom_names"])
+    np.testing.assert_array_equal(system.data["atom_types"], ref_system.data["atom_types"])
+    for name in ["coords", "forces", "energies", "cells"]:
+        np.testing.assert_array_equal(system.data[name], ref_system.data[name].astype(np.float32))
+
+
+@pytest.mark.parametrize("md_path", [
+    "tests/test_dpdata/v7.1/aimd_virial_in_output",
+    "tests/test_dpdata/v2023.2/aimd_nvt_restart"
+])
+def test_iter_md_labeled_batches(md_path):
+    ref_data = CP2KMDFormat().from_labeled_system(md_path, cp2k_output_name="output")
+    batches = list(iter_md_labeled_batches(md_path, 2, cp2k_output_name="output"))
+    assert [len(batch["energies"]) for batch in batches][:-1] == [2] * (len(batches) - 1)
+    for name in ["coords", "forces", "energies", "cells", "virials"]:
+        if name in ref_data:
+            np.testing.assert_allclose(np.concatenate([batch[name] for batch in batches]), ref_data[name])
+        else:
+            assert all(name not in batch for batch in batches)
+
+
+def test_shard_writer(tmp_path):
+    writer = DeepmdShardWriter(str(tmp_path/"system"), ["O"], np.zeros(2, dtype=int), set_size=3)
+    energies = np.arange(11, dtype=float)
+    # batches which do not line up with the sets, the last ones with virials
+    for start, stop in [(0, 2), (2, 7), (7, 8), (8, 9), (9, 11)]:
+        nframes = stop - start
+        data = {"energies": energies[start:stop], "coords": np.zeros((nframes, 2, 3)),
+                "forces": np.zeros((nframes, 2, 3)), "cells": np.zeros((nframes, 3, 3))}
+        if start >= 8:
+            data["virials"] = np.zeros((nframes, 3, 3))
+        writer.add(data)
+    writer.close()
+    sets = sorted(name for name in os.listdir(tmp_path/"system") if name.startswith("set."))
+    set_energies = [np.load(tmp_path/"system"/set_name/"energy.npy").ravel().tolist() for set_name in sets]
+    # the frames without virials are flushed before the first virial
+    assert set_energies == [[0, 1, 2], [3, 4, 5], [6, 7], [8, 9, 10]]
+    assert [os.path.exists(tmp_path/"system"/set_name/"virial.npy") for set_name in sets] == \
+        [False, False, False, True]
+    assert writer.num_frames == 11
+
+
+def test_convert_md_without_stress(tmp_path, monkeypatch):
+    import cp2kdata.output as output_module
+    from dataclasses import replace
+
+    # count the force blocks read from the output so far
+    num_collected = []
+    collect = output_module.ATOMIC_FORCES_HANDLER.collect
+
+    def count_collect(match):
+        num_collected.append(None)
+        return collect(match)
+
+    monkeypatch.setattr(output_module, "ATOMIC_FORCES_HANDLER",
+                        replace(output_module.ATOMIC_FORCES_HANDLER, collect=count_collect))
+    num_added = []
+    add = DeepmdShardWriter.add
+
+    def check_add(writer, data):
+        num_added.append(len(data["energies"]))
+        # no force block is read ahead of the current batch
+        assert len(num_collected) <= sum(num_added)
+        add(writer, data)
+
+    monkeypatch.setattr(DeepmdShardWriter, "add", check_add)
+    md_path = "tests/test_dpdata/v2023.1/aimd_nvt"
+    num_frames = convert_to_deepmd(md_path, tmp_path, set_size=2)
+    assert num_added[:-1] == [2] * (len(num_added) - 1)
+
+    ref_system = dpdata.LabeledSystem(md_path, cp2k_output_name="output", fmt="cp2kdata/md")
+    assert list(num_frames.values()) == [len(ref_system)]
+    system_dir = tmp_path/list(num_frames)[0]
+    assert not any(os.path.exists(system_dir/set_name/"virial.npy")
+                   for set_name in os.listdir(system_dir) if set_name.startswith("set."))
+    system = dpdata.LabeledSystem(str(system_dir), fmt="deepmd/npy")
+    for name in ["coords", "forces", "energies", "cells"]:
+        np.testing.assert_array_equal(system.data[name], ref_system.data[name].astype(np.float32))
@@ -137,6 +137,35 @@ class TestEnergyForce():
         assert len(pot_energy) == 1
         assert list(pot_energy) == answer_in_dict["pot_energy"]        
 
+    def test_lazy_parsing(self, output_and_answer_path, answer_in_dict):
+        lazy_output = Cp2kOutput(os.path.join(output_and_answer_path[1], 'output'))
+        assert "atomic_forces_list" not in lazy_output.__dict__
+        pot_energy = lazy_output.get_energies_list()
+        assert list(pot_energy) == answer_in_dict["pot_energy"]
+        # only the energies are parsed
+        assert "atomic_forces_list" not in lazy_output.__dict__
+        assert "stress_tensor_list" not in lazy_output.__dict__
+        assert list(lazy_output._blocks) == ["energies_list"]
+
+    def test_selected_fields(self, output_and_answer_path, answer_in_dict):
+        selected_output = Cp2kOutput(os.path.join(output_and_answer_path[1], 'output'),
+                                     fields=["energies", "forces"])
+        # the selected fields are parsed together, the others are skipped
+        assert sorted(selected_output._blocks) == ["atomic_forces_list", "energies_list"]
+        assert list(selected_output.get_energies_list()) == answer_in_dict["pot_energy"]
+        assert selected_output.stress_tensor_list is None
+        assert selected_output.all_cells is None
+        assert sorted(selected_output._blocks) == ["atomic_forces_list", "energies_list"]
+
+        skipped_output = Cp2kOutput(os.path.join(output_and_answer_path[1], 'output'),
+                                    skip=["stress"])
+        assert skipped_output.stress_tensor_list is None
+        assert not skipped_output._blocks
+
+        with pytest.raises(ValueError):
+            Cp2kOutput(os.path.join(output_and_answer_path[1], 'output'),
+                       fields=["energy"])
+
 #    def test_mulliken_charges(self):
 #        pass
 
@@ -0,0 +1,53 @@
+from cp2kdata import Cp2kOutput
+from cp2kdata.block_parser.converge import parse_tail_info, parse_e_f_converge
+import gzip
+import numpy as np
+import pytest
+
+
+e_f_output_list = [
+    "tests/test_energy_force/v6.1/normal/output",
+    "tests/test_energy_force/v7.1/normal/output",
+    "tests/test_energy_force/v8.1/normal/output",
+    "tests/test_energy_force/v9.0/normal/output",
+    "tests/test_dpdata/v7.1/e_f_no_converge/output",
+]
+
+
+@pytest.mark.parametrize("output_file", e_f_output_list)
+@pytest.mark.parametrize("tail_size", [1024, 1024 * 1024])
+def test_tail_info(output_file, tail_size):
+    # small tails fall back to the search of the whole file
+    converge_info = parse_tail_info(output_file, tail_size=tail_size)
+    assert converge_info.converge == parse_e_f_converge(output_file).converge
+    assert converge_info.program_ended
+    assert not converge_info.exceed_wall_time
+    assert not converge_info.terminated_by_request
+    assert converge_info.whole_file == (tail_size > 1024)
+
+
+def test_exceed_wall_time(tmp_path):
+    with open("tests/test_dpdata/v7.1/e_f_no_converge/output") as fp:
+        lines = fp.readlines()
+    end = next(idx for idx, line in enumerate(lines) if "SCF run NOT converged" in line)
+    output_file = tmp_path / "output"
+    output_file.write_text("".join(lines[:end]) + " *** exceeded requested execution time ***\n")
+    converge_info = parse_tail_info(output_file)
+    assert not converge_info.converge
+    assert not converge_info.program_ended
+    assert converge_info.exceed_wall_time
+
+
+def test_reuse_tail(tmp_path):
+    output_file = "tests/test_energy_force/v7.1/normal/output"
+    compressed_file = tmp_path / "output.gz"
+    with open(output_file, "rb") as fp_src, gzip.open(compressed_file, "wb") as fp_dst:
+        fp_dst.write(fp_src.read())
+    output = Cp2kOutput(output_file)
+    for file_name in [output_file, str(compressed_file)]:
+        converge_info = parse_tail_info(file_name)
+        tail_output = Cp2kOutput(file_name, converge_info=converge_info)
+        assert tail_output.output_file == converge_info.tail.decode()
+        assert np.array_equal(tail_output.energies_list, output.energies_list)
+        assert np.array_equal(tail_output.atomic_forces_list, output.atomic_forces_list)
+        assert tail_output.get_chemical_symbols() == output.get_chemical_symbols()
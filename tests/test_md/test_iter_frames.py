@@ -0,0 +1,97 @@
+from cp2kdata import Cp2kOutput
+import cp2kdata.output as output_module
+from dataclasses import replace
+import numpy as np
+import pytest
+
+
+md_path_list = [
+    "tests/test_dpdata/v7.1/aimd_virial_in_output",
+    "tests/test_dpdata/v7.1/aimd_npt_f",
+    "tests/test_dpdata/v2022.2/aimd_npt_i",
+    "tests/test_dpdata/v2023.2/aimd_nvt_restart"
+]
+
+
+@pytest.fixture(params=md_path_list, scope='class', ids=md_path_list)
+def md_output(request):
+    return Cp2kOutput("output", run_type="MD", path_prefix=request.param)
+
+
+class TestIterFrames():
+    def test_frames(self, md_output):
+        frames = list(md_output.iter_frames())
+        assert len(frames) == len(md_output.atomic_frames_list)
+        for idx, frame in enumerate(frames):
+            assert np.array_equal(frame.positions, md_output.atomic_frames_list[idx])
+            assert np.array_equal(frame.forces, md_output.atomic_forces_list[idx])
+            assert frame.energy == md_output.energies_list[idx]
+            assert np.allclose(frame.cell, md_output.all_cells[idx])
+            assert frame.chemical_symbols == md_output.get_chemical_symbols()
+
+    def test_selected_fields(self, md_output):
+        md_path = md_output.path_prefix
+        selected_output = Cp2kOutput("output", run_type="MD", path_prefix=md_path,
+                                     fields=["energies"])
+        for frame in selected_output.iter_frames():
+            assert frame.positions is None
+            assert frame.forces is None
+            assert frame.cell is None
+            assert frame.energy is not None
+
+
+# runs without a frc file, the forces are only printed in the output,
+# the stresses in the output of aimd_npt_i only
+output_md_path_list = [
+    "tests/test_dpdata/v2022.2/aimd_npt_i",
+    "tests/test_dpdata/v2023.1/aimd_npt_f",
+    "tests/test_dpdata/v2023.1/aimd_nvt"
+]
+
+
+@pytest.mark.parametrize("md_path", output_md_path_list)
+@pytest.mark.parametrize("restart", [None, True])
+@pytest.mark.parametrize("terminated_by_request", [False, True])
+def test_stream_output_blocks(md_path, restart, terminated_by_request):
+    def get_output():
+        output = Cp2kOutput("output", run_type="MD", path_prefix=md_path, restart=restart)
+        output.cp2k_info.terminated_by_request = terminated_by_request
+        return output
+
+    # the blocks are streamed before the lists are parsed
+    frames = list(get_output().iter_frames())
+    md_output = get_output()
+    assert not md_output.md_files["frc"]
+    atomic_forces_list = md_output.atomic_forces_list
+    stress_tensor_list = md_output.stress_tensor_list
+    for idx, frame in enumerate(frames):
+        if idx < len(atomic_forces_list):
+            assert np.array_equal(frame.forces, atomic_forces_list[idx])
+        else:
+            assert frame.forces is None
+        if (stress_tensor_list is not None) and (idx < len(stress_tensor_list)):
+            assert np.array_equal(frame.stress, stress_tensor_list[idx])
+        else:
+            assert frame.stress is None
+
+
+@pytest.mark.parametrize("md_path", output_md_path_list)
+def test_stream_output_blocks_bounded(md_path, monkeypatch):
+    # count the force blocks read from the output so far
+    num_collected = []
+    collect = output_module.ATOMIC_FORCES_HANDLER.collect
+
+    def count_collect(match):
+        num_collected.append(None)
+        return collect(match)
+
+    monkeypatch.setattr(output_module, "ATOMIC_FORCES_HANDLER",
+                        replace(output_module.ATOMIC_FORCES_HANDLER, collect=count_collect))
+    md_output = Cp2kOutput("output", run_type="MD", path_prefix=md_path)
+    assert "stress" in md_output.fields
+    for idx, frame in enumerate(md_output.iter_frames()):
+        assert frame.forces is not None
+        assert (frame.stress is not None) == ("aimd_npt_i" in md_path)
+        # the search of the stresses reads no force block ahead
+        assert len(num_collected) <= idx + 1
+    assert len(num_collected) == idx + 1
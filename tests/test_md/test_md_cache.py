@@ -0,0 +1,30 @@
+from cp2kdata import Cp2kOutput
+import os
+import shutil
+import numpy as np
+
+
+def test_md_cache(tmp_path):
+    md_path = str(tmp_path/"aimd")
+    shutil.copytree("tests/test_dpdata/v2023.2/aimd_nvt_restart", md_path)
+    md_output = Cp2kOutput("output", run_type="MD", path_prefix=md_path)
+    # the first load writes the cache, the second one reads it
+    Cp2kOutput("output", run_type="MD", path_prefix=md_path, use_cache=True)
+    assert os.path.isfile(os.path.join(md_path, ".cp2kdata_cache", "manifest.json"))
+    cached_output = Cp2kOutput("output", run_type="MD", path_prefix=md_path, use_cache=True)
+    assert isinstance(cached_output.atomic_frames_list, np.memmap)
+    assert np.array_equal(cached_output.atomic_frames_list, md_output.atomic_frames_list)
+    assert np.array_equal(cached_output.atomic_forces_list, md_output.atomic_forces_list)
+    assert np.array_equal(cached_output.energies_list, md_output.energies_list)
+    assert np.array_equal(cached_output.all_cells, md_output.all_cells)
+    assert list(cached_output.chemical_symbols) == list(md_output.chemical_symbols)
+
+    # the cache is not used once a source file changes
+    ener_file = os.path.join(md_path, "H2O_restart-1.ener")
+    with open(ener_file, "r") as fp:
+        lines = fp.readlines()
+    with open(ener_file, "w") as fp:
+        fp.writelines(lines[:-1])
+    updated_output = Cp2kOutput("output", run_type="MD", path_prefix=md_path, use_cache=True)
+    assert not isinstance(updated_output.energies_list, np.memmap)
+    assert len(updated_output.energies_list) == len(md_output.energies_list) - 1
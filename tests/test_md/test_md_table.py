@@ -0,0 +1,45 @@
+from cp2kdata import Cp2kOutput
+from cp2kdata.block_parser.md_xyz import load_md_table, split_md_table, parse_md_stress
+from cp2kdata.block_parser.fep import parse_vertical_gap
+import numpy as np
+import pytest
+
+
+table_file_list = [
+    "tests/test_dpdata/v7.1/aimd_virial/water-1.ener",
+    "tests/test_dpdata/v7.1/aimd_virial/water-1.stress",
+    "tests/test_dpdata/v7.1/aimd_npt_f/cp2k-1.cell",
+]
+
+
+@pytest.fixture(params=table_file_list, ids=table_file_list)
+def table_file(request):
+    return request.param
+
+
+def test_load_md_table(table_file):
+    values = np.loadtxt(table_file, ndmin=2)
+    np.testing.assert_array_equal(load_md_table(table_file), values)
+    np.testing.assert_array_equal(load_md_table(table_file, usecols=(4, 2)), values[:, [4, 2]])
+    with open(table_file, "r") as fp:
+        text = fp.read()
+    # the decoder used when np.loadtxt is not implemented in C
+    np.testing.assert_array_equal(split_md_table(text, usecols=(4, 2)), values[:, [4, 2]])
+    np.testing.assert_array_equal(split_md_table(text + text), np.concatenate([values, values]))
+
+
+def test_parse_vertical_gap():
+    ener_file = "tests/test_dpdata/v7.1/aimd_virial/water-1.ener"
+    values = np.loadtxt(ener_file)
+    np.testing.assert_array_equal(parse_vertical_gap(ener_file), values[:, 4] - values[:, 3])
+
+
+def test_md_stress_list():
+    md_path = "tests/test_dpdata/v7.1/aimd_virial"
+    cp2k_output = Cp2kOutput("output", run_type="MD", path_prefix=md_path)
+    md_stress_list = cp2k_output.get_md_stress_list()
+    stresses = np.loadtxt(f"{md_path}/water-1.stress", usecols=range(2, 11)).reshape(-1, 3, 3)
+    np.testing.assert_allclose(md_stress_list, stresses * 1e-4)
+    np.testing.assert_array_equal(parse_md_stress(f"{md_path}/water-1.stress"), stresses)
+    # the stress tensors in the output are not replaced
+    assert cp2k_output.get_stress_tensor_list() is None
@@ -0,0 +1,54 @@
+from cp2kdata.block_parser.md_xyz import parse_pos_xyz, parse_frc_xyz
+import numpy as np
+import pytest
+
+
+POS_XYZ = (
+    "       2\n"
+    " i =        0, time =        0.000, E =       -34.3125471337\n"
+    "  O         1.0000000000        2.0000000000        3.0000000000\n"
+    "  H         4.0000000000        5.0000000000        6.0000000000\n"
+    "       2\n"
+    " i =        1, time =        0.500, E =       -34.3125000000\n"
+    "  O         1.5000000000        2.5000000000        3.5000000000\n"
+    "  H         4.5000000000        5.5000000000        6.5000000000\n"
+)
+
+
+@pytest.fixture
+def pos_xyz_file(tmp_path):
+    pos_xyz_file = tmp_path/"test-pos-1.xyz"
+    pos_xyz_file.write_text(POS_XYZ)
+    return str(pos_xyz_file)
+
+
+def test_parse_pos_xyz(pos_xyz_file):
+    pos_list, energies_list, chemical_symbols = parse_pos_xyz(pos_xyz_file)
+    assert pos_list.shape == (2, 2, 3)
+    assert np.array_equal(pos_list[1, 1], [4.5, 5.5, 6.5])
+    assert np.array_equal(energies_list, [-34.3125471337, -34.3125])
+    assert chemical_symbols == ["O", "H"]
+
+
+def test_parse_incomplete_xyz(pos_xyz_file):
+    # the last frame of a running md is not complete
+    with open(pos_xyz_file, "a") as fp:
+        fp.write("       2\n i =        2, time =        1.000, E =       -34.3\n  O    1.0")
+    assert parse_frc_xyz(pos_xyz_file).shape == (2, 2, 3)
+
+
+def test_parse_xyz_in_parallel(pos_xyz_file):
+    pos_list, energies_list, chemical_symbols = parse_pos_xyz(pos_xyz_file)
+    parallel_pos_list, parallel_energies_list, parallel_chemical_symbols = \
+        parse_pos_xyz(pos_xyz_file, n_workers=2)
+    assert np.array_equal(parallel_pos_list, pos_list)
+    assert np.array_equal(parallel_energies_list, energies_list)
+    assert parallel_chemical_symbols == chemical_symbols
+
+
+def test_parse_xyz_without_c_loadtxt(pos_xyz_file, monkeypatch):
+    # the atom rows are split at once on numpy versions without a C loadtxt
+    from cp2kdata.block_parser import text_rows
+    pos_list = parse_pos_xyz(pos_xyz_file)[0]
+    monkeypatch.setattr(text_rows, "C_LOADTXT", False)
+    np.testing.assert_array_equal(parse_pos_xyz(pos_xyz_file)[0], pos_list)
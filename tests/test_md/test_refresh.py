@@ -0,0 +1,62 @@
+from cp2kdata import Cp2kOutput
+import numpy as np
+import os
+import pytest
+
+
+md_path_list = [
+    "tests/test_dpdata/v7.1/aimd_npt_f",
+    "tests/test_dpdata/v2023.2/aimd_nvt_restart"
+]
+
+
+def write_md_files(src, dst, fraction):
+    # the files of a running md, each one written up to a fraction of its size
+    for name in os.listdir(src):
+        src_file = os.path.join(src, name)
+        if not os.path.isfile(src_file):
+            continue
+        with open(src_file, "rb") as fp:
+            data = fp.read()
+        size = int(len(data) * fraction)
+        if name == "output":
+            # Cp2kOutput requires the header
+            size = max(size, data.find(b"SCF WAVEFUNCTION OPTIMIZATION"))
+        with open(os.path.join(dst, name), "wb") as fp:
+            fp.write(data[:size])
+
+
+@pytest.fixture(params=md_path_list, ids=md_path_list)
+def md_path(request):
+    return request.param
+
+
+def test_refresh(md_path, tmp_path):
+    full_output = Cp2kOutput("output", run_type="MD", path_prefix=md_path)
+    write_md_files(md_path, tmp_path, 0.5)
+    md_output = Cp2kOutput("output", run_type="MD", path_prefix=str(tmp_path))
+
+    num_frames = md_output.refresh()
+    assert 0 < num_frames < len(full_output.atomic_frames_list)
+    assert np.array_equal(md_output.atomic_frames_list,
+                          full_output.atomic_frames_list[:len(md_output.atomic_frames_list)])
+
+    write_md_files(md_path, tmp_path, 1.0)
+    num_frames += md_output.refresh()
+    assert num_frames == len(full_output.atomic_frames_list)
+    assert md_output.refresh() == 0
+    assert np.array_equal(md_output.atomic_frames_list, full_output.atomic_frames_list)
+    assert np.array_equal(md_output.atomic_forces_list, full_output.atomic_forces_list)
+    assert np.array_equal(md_output.energies_list, full_output.energies_list)
+    assert np.allclose(md_output.all_cells, full_output.all_cells)
+
+
+def test_follow(md_path, tmp_path):
+    full_output = Cp2kOutput("output", run_type="MD", path_prefix=md_path)
+    write_md_files(md_path, tmp_path, 1.0)
+    md_output = Cp2kOutput("output", run_type="MD", path_prefix=str(tmp_path))
+    # the output reports the end of the program, follow stops by itself
+    frames = list(md_output.follow(interval=0))
+    assert len(frames) == len(full_output.atomic_frames_list)
+    assert np.array_equal(frames[-1].positions, full_output.atomic_frames_list[-1])
+    assert frames[-1].energy == full_output.energies_list[-1]
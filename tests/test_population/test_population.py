@@ -0,0 +1,71 @@
+import pytest
+import numpy as np
+
+from cp2kdata import Cp2kOutput
+from cp2kdata.block_parser.hirshfeld import parse_hirshfeld_pop_list
+
+
+def read_tables(output_path, title, ncols):
+    # reference populations split from the table lines
+    with open(output_path, 'r') as fp:
+        lines = fp.readlines()
+    tables = []
+    for idx, line in enumerate(lines):
+        if line.strip() == title:
+            rows = []
+            for row in lines[idx+3:]:
+                if (len(row.split()) != ncols) or not row.split()[0].isdigit():
+                    break
+                rows.append(row.split())
+            tables.append(rows)
+    return tables
+
+
+@pytest.mark.parametrize(
+    "output_path, ks_type",
+    [
+        ("tests/test_energy_force/v6.1/normal/output", "UKS"),
+        ("tests/test_dpdata/v2023.1/aimd_nvt/output", "RKS")
+    ]
+)
+def test_mulliken(output_path, ks_type):
+    cp2k_output = Cp2kOutput(output_path)
+    assert cp2k_output.dft_info.ks_type == ks_type
+    mulliken = cp2k_output.get_mulliken_pop_list()
+    ncols = 7 if ks_type == "UKS" else 5
+    tables = np.array(read_tables(output_path, "Mulliken Population Analysis", ncols))
+    assert mulliken.alpha.shape == tables.shape[:2]
+    assert mulliken.element.tolist() == tables[0, :, 1].tolist()
+    np.testing.assert_array_equal(mulliken.kind, tables[0, :, 2].astype(int))
+    np.testing.assert_array_equal(mulliken.alpha, tables[:, :, 3].astype(float))
+    if ks_type == "UKS":
+        np.testing.assert_array_equal(mulliken.beta, tables[:, :, 4].astype(float))
+        np.testing.assert_array_equal(mulliken.net_charge, tables[:, :, 5].astype(float))
+        np.testing.assert_array_equal(cp2k_output.get_spin_moment_list(), tables[:, :, 6].astype(float))
+    else:
+        assert mulliken.beta is None
+        np.testing.assert_array_equal(mulliken.net_charge, tables[:, :, 4].astype(float))
+        np.testing.assert_array_equal(cp2k_output.get_spin_moment_list(), np.zeros(tables.shape[:2]))
+    assert len(mulliken[0]) == tables.shape[1]
+    assert mulliken[-1][0]["net_charge"] == mulliken.net_charge[-1, 0]
+
+
+@pytest.mark.parametrize(
+    "output_path, ncols",
+    [
+        ("tests/test_energy_force/v6.1/normal/output", 8),
+        ("tests/test_dpdata/v2023.1/aimd_nvt/output", 6)
+    ]
+)
+def test_hirshfeld(output_path, ncols):
+    with open(output_path, 'r') as fp:
+        hirshfeld = parse_hirshfeld_pop_list(fp.read())
+    tables = np.array(read_tables(output_path, "Hirshfeld Charges", ncols))
+    assert hirshfeld.alpha.shape == tables.shape[:2]
+    np.testing.assert_array_equal(hirshfeld.ref_charge, tables[:, :, 3].astype(float))
+    np.testing.assert_array_equal(hirshfeld.alpha, tables[:, :, 4].astype(float))
+    np.testing.assert_array_equal(hirshfeld.net_charge, tables[:, :, -1].astype(float))
+    if ncols == 8:
+        np.testing.assert_array_equal(hirshfeld.spin_moment, tables[:, :, 6].astype(float))
+    else:
+        assert hirshfeld.spin_moment is None
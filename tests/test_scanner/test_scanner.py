@@ -0,0 +1,338 @@
+import os
+import shutil
+
+import pytest
+import numpy as np
+import regex as re
+
+from cp2kdata.block_parser.scanner import scan_blocks, open_output_mmap
+from cp2kdata.block_parser.output_index import OutputIndex, load_or_build_output_index
+from cp2kdata.block_parser.output_index import get_index_file, get_index_key
+from cp2kdata.block_parser.energies import parse_energies_list, ENERGIES_HANDLER
+from cp2kdata.block_parser.forces import parse_atomic_forces_list, ATOMIC_FORCES_HANDLER
+from cp2kdata.block_parser.stress import parse_stress_tensor_list, STRESS_TENSOR_HANDLER
+from cp2kdata.block_parser.cells import parse_all_cells, ALL_CELLS_HANDLER
+from cp2kdata.block_parser.atomic_kind import parse_atomic_kinds, ATOMIC_KINDS_HANDLER
+from cp2kdata.block_parser.header_info import scan_header, parse_cp2k_info
+from cp2kdata.block_parser.coordinates import parse_init_atomic_coordinates
+
+
+output_path_list = [
+    "tests/test_energy_force/v6.1/duplicate_header/output",
+    "tests/test_energy_force/v8.1/normal/output",
+    "tests/test_dpdata/v7.1/aimd_virial_in_output/output",
+    "tests/test_dpdata/v2022.2/aimd_npt_i/output",
+]
+
+
+# independent references, the per-quantity regexes which ran one full
+# finditer pass over the output for every quantity before the scanner
+REF_ENERGIES_RE = re.compile(
+    r"""
+    \sENERGY\|\sTotal\sFORCE_EVAL\s\(\sQS\s\)\senergy\s\S{6}:\s+(?P<energy>[\s-]\d+\.\d+)
+    """,
+    re.VERBOSE
+)
+REF_ATOMIC_FORCES_RE = re.compile(
+    r"""
+    \sATOMIC\sFORCES\sin\s\[a\.u\.\]\s*\n
+    \n
+    \s\#.+\n
+    (
+        \s+(?P<atom>\d+)
+        \s+(?P<kind>\d+)
+        \s+(?P<element>\w+)
+        \s+(?P<x>[\s-]\d+\.\d+)
+        \s+(?P<y>[\s-]\d+\.\d+)
+        \s+(?P<z>[\s-]\d+\.\d+)
+        \n
+    )+
+    """,
+    re.VERBOSE
+)
+REF_STRESS_RE = re.compile(
+    r"""
+    (\sSTRESS\sTENSOR\s\[GPa\]
+    \n
+    \s+X\s+Y\s+Z\s*\n
+    \s+X
+    \s+(?P<xx>[\s-]\d+\.\d+)
+    \s+(?P<xy>[\s-]\d+\.\d+)
+    \s+(?P<xz>[\s-]\d+\.\d+)\n
+    \s+Y
+    \s+(?P<yx>[\s-]\d+\.\d+)
+    \s+(?P<yy>[\s-]\d+\.\d+)
+    \s+(?P<yz>[\s-]\d+\.\d+)\n
+    \s+Z
+    \s+(?P<zx>[\s-]\d+\.\d+)
+    \s+(?P<zy>[\s-]\d+\.\d+)
+    \s+(?P<zz>[\s-]\d+\.\d+)\n
+    |
+    \s+STRESS\|\sAnalytical\sstress\stensor\s\[GPa\]\s*\n
+    \s+STRESS\|\s+x\s+y\s+z\s*\n
+    \s+STRESS\|\s+x
+    \s+(?P<xx>[\s-]\d+\.\d+E[\+\-]\d\d)
+    \s+(?P<xy>[\s-]\d+\.\d+E[\+\-]\d\d)
+    \s+(?P<xz>[\s-]\d+\.\d+E[\+\-]\d\d)\n
+    \s+STRESS\|\s+y
+    \s+(?P<yx>[\s-]\d+\.\d+E[\+\-]\d\d)
+    \s+(?P<yy>[\s-]\d+\.\d+E[\+\-]\d\d)
+    \s+(?P<yz>[\s-]\d+\.\d+E[\+\-]\d\d)\n
+    \s+STRESS\|\s+z
+    \s+(?P<zx>[\s-]\d+\.\d+E[\+\-]\d\d)
+    \s+(?P<zy>[\s-]\d+\.\d+E[\+\-]\d\d)
+    \s+(?P<zz>[\s-]\d+\.\d+E[\+\-]\d\d)\n
+    )
+    """,
+    re.VERBOSE
+)
+REF_ALL_CELL_RE = re.compile(
+    r"""
+    \s+CELL\|\sVector\sa\s\[angstrom\]:
+    \s+(?P<xx>[\s-]\d+\.\d+)
+    \s+(?P<xy>[\s-]\d+\.\d+)
+    \s+(?P<xz>[\s-]\d+\.\d+)
+    \s+\|a\|\s+=\s+\S+
+    \n
+    \s+CELL\|\sVector\sb\s\[angstrom\]:
+    \s+(?P<yx>[\s-]\d+\.\d+)
+    \s+(?P<yy>[\s-]\d+\.\d+)
+    \s+(?P<yz>[\s-]\d+\.\d+)
+    \s+\|b\|\s+=\s+\S+
+    \n
+    \s+CELL\|\sVector\sc\s\[angstrom\]:
+    \s+(?P<zx>[\s-]\d+\.\d+)
+    \s+(?P<zy>[\s-]\d+\.\d+)
+    \s+(?P<zz>[\s-]\d+\.\d+)
+    \s+\|c\|\s+=\s+\S+
+    \n
+    """,
+    re.VERBOSE
+)
+REF_NUM_ATOMIC_KINDS_RE = re.compile(r"\s+-\sAtomic\skinds:\s+(?P<num_atomic_kind>\d+)")
+REF_ATOMIC_KINDS_RE = re.compile(r"\s{2}\d+\.\sAtomic\skind:\s+(?P<atomic_kind>\S+)")
+TENSOR_GROUPS = ["xx", "xy", "xz", "yx", "yy", "yz", "zx", "zy", "zz"]
+
+
+def ref_array(values, shape):
+    if not values:
+        return None
+    return np.array(values, dtype=float).reshape(shape)
+
+
+def ref_parse(output_file):
+    energies = [match["energy"] for match in REF_ENERGIES_RE.finditer(output_file)]
+    forces = [list(zip(*match.captures("x", "y", "z")))
+              for match in REF_ATOMIC_FORCES_RE.finditer(output_file)]
+    stresses = [match.group(*TENSOR_GROUPS) for match in REF_STRESS_RE.finditer(output_file)]
+    cells = [match.group(*TENSOR_GROUPS) for match in REF_ALL_CELL_RE.finditer(output_file)]
+    num_atomic_kinds = [int(match["num_atomic_kind"])
+                        for match in REF_NUM_ATOMIC_KINDS_RE.finditer(output_file)]
+    atomic_kinds = [match["atomic_kind"] for match in REF_ATOMIC_KINDS_RE.finditer(output_file)]
+    return {
+        "energies_list": ref_array(energies, (-1,)),
+        "atomic_forces_list": np.array(forces, dtype=float) if forces else None,
+        "stress_tensor_list": ref_array(stresses, (-1, 3, 3)),
+        "all_cells": ref_array(cells, (-1, 3, 3)),
+        # only the last atomic kinds
+        "atomic_kinds": np.array(atomic_kinds[-num_atomic_kinds[-1]:], dtype=str) if atomic_kinds else None
+    }
+
+
+def assert_same(result, answer):
+    if answer is None:
+        assert result is None
+    else:
+        np.testing.assert_array_equal(result, answer)
+
+
+@pytest.fixture(params=output_path_list, scope='class', ids=output_path_list)
+def output_path(request):
+    return request.param
+
+
+@pytest.fixture
+def output_file(output_path):
+    with open(output_path, 'r') as fp:
+        return fp.read()
+
+
+class TestBlockScanner():
+    def test_single_pass_equals_separate_parsers(self, output_file):
+        blocks = scan_blocks(output_file, [
+            ENERGIES_HANDLER,
+            ATOMIC_FORCES_HANDLER,
+            STRESS_TENSOR_HANDLER,
+            ALL_CELLS_HANDLER,
+            ATOMIC_KINDS_HANDLER
+        ])
+        answers = ref_parse(output_file)
+        for name, answer in answers.items():
+            assert_same(blocks[name], answer)
+        # the scanner wrappers give the same results
+        assert_same(parse_energies_list(output_file), answers["energies_list"])
+        assert_same(parse_atomic_forces_list(output_file), answers["atomic_forces_list"])
+        assert_same(parse_stress_tensor_list(output_file), answers["stress_tensor_list"])
+        assert_same(parse_all_cells(output_file), answers["all_cells"])
+        assert_same(parse_atomic_kinds(output_file), answers["atomic_kinds"])
+
+    def test_no_handlers(self, output_file):
+        assert scan_blocks(output_file, []) == {}
+
+    def test_mmap_equals_str(self, output_path, output_file):
+        handlers = [
+            ENERGIES_HANDLER,
+            ATOMIC_FORCES_HANDLER,
+            STRESS_TENSOR_HANDLER,
+            ALL_CELLS_HANDLER,
+            ATOMIC_KINDS_HANDLER
+        ]
+        blocks_mmap = scan_blocks(open_output_mmap(output_path), handlers)
+        blocks_str = scan_blocks(output_file, handlers)
+        for name in blocks_str:
+            assert_same(blocks_mmap[name], blocks_str[name])
+
+
+class TestBulkDecode():
+    def test_forces_and_coordinates_rows(self, output_file):
+        # reference decoded line by line from the tables
+        lines = output_file.splitlines()
+        forces = []
+        for idx, line in enumerate(lines):
+            if line.startswith(" ATOMIC FORCES in [a.u.]"):
+                rows = []
+                for row in lines[idx+3:]:
+                    if not row.strip() or not row.split()[0].isdigit():
+                        break
+                    rows.append([float(value) for value in row.split()[3:6]])
+                forces.append(rows)
+        assert_same(parse_atomic_forces_list(output_file), np.array(forces))
+
+        coordinates, kinds, symbols = parse_init_atomic_coordinates(output_file)
+        start = [idx for idx, line in enumerate(lines) if "ATOMIC COORDINATES IN angstrom" in line][0]
+        rows = [line.split() for line in lines[start+3:start+3+len(symbols)+1] if line.strip()]
+        rows = rows[:len(symbols)]
+        assert symbols == [row[2] for row in rows]
+        assert all(isinstance(symbol, str) for symbol in symbols)
+        assert_same(kinds, np.array([int(row[1]) for row in rows]))
+        assert_same(coordinates, np.array([[float(value) for value in row[4:7]] for row in rows]))
+
+
+class TestOutputIndex():
+    def test_index_equals_full_scan(self, output_path, output_file, tmp_path):
+        filename = str(tmp_path / "output")
+        shutil.copy(output_path, filename)
+        handlers = [
+            ENERGIES_HANDLER,
+            ATOMIC_FORCES_HANDLER,
+            STRESS_TENSOR_HANDLER,
+            ALL_CELLS_HANDLER,
+            ATOMIC_KINDS_HANDLER
+        ]
+        index = load_or_build_output_index(filename)
+        assert os.path.isfile(get_index_file(filename))
+        blocks_index = scan_blocks(open_output_mmap(filename), handlers, index=index)
+        blocks_str = scan_blocks(output_file, handlers)
+        for name in blocks_str:
+            assert_same(blocks_index[name], blocks_str[name])
+
+    def test_reuse_and_invalidate(self, output_path, tmp_path):
+        filename = str(tmp_path / "output")
+        shutil.copy(output_path, filename)
+        index = load_or_build_output_index(filename)
+        reloaded = OutputIndex.load(get_index_file(filename), key=get_index_key(filename))
+        assert reloaded is not None
+        for header in index.offsets:
+            np.testing.assert_array_equal(reloaded.get_offsets(header), index.get_offsets(header))
+
+        with open(filename, 'a') as fp:
+            fp.write(" ENERGY| Total FORCE_EVAL ( QS ) energy [a.u.]:            -1.0\n")
+        assert OutputIndex.load(get_index_file(filename), key=get_index_key(filename)) is None
+        index = load_or_build_output_index(filename)
+        assert index.get_num_blocks("ENERGY| Total FORCE_EVAL") == \
+            reloaded.get_num_blocks("ENERGY| Total FORCE_EVAL") + 1
+
+
+class TestHeader():
+    def test_header_stops_at_first_scf_step(self, tmp_path):
+        output_path = "tests/test_dpdata/v2022.1/aimd_exit/output"
+        header = scan_header(output_path)
+        assert header["run_type"] == ("MD",)
+        assert header["ensemble_type"] == ("NVT",)
+        # everything after the first SCF step is not read
+        with open(output_path, "r") as fp:
+            lines = fp.readlines()
+        header_end = [idx for idx, line in enumerate(lines)
+                      if "SCF WAVEFUNCTION OPTIMIZATION" in line][0]
+        ensemble_lines = [line for line in lines[:header_end] if "Ensemble" in line]
+        assert ensemble_lines
+        moved_output_path = tmp_path/"output"
+        moved_output_path.write_text(
+            "".join(line for line in lines[:header_end] if "Ensemble" not in line)
+            + "".join(lines[header_end:header_end+1] + ensemble_lines + lines[header_end+1:]))
+        moved_header = scan_header(moved_output_path)
+        assert "ensemble_type" not in moved_header
+        assert moved_header["run_type"] == ("MD",)
+
+    def test_terminated_by_request_in_tail(self):
+        cp2k_info = parse_cp2k_info("tests/test_dpdata/v2022.1/aimd_exit/output")
+        assert cp2k_info.terminated_by_request
+        assert cp2k_info.version == "2022.1"
+        cp2k_info = parse_cp2k_info("tests/test_dpdata/v2022.1/aimd/output")
+        assert not cp2k_info.terminated_by_request
+
+
+@pytest.mark.parametrize("output_file", output_path_list + [
+    "tests/test_energy_force/v6.1/normal/output",
+    "tests/test_dpdata/v2023.1/aimd_nvt/output"
+])
+def test_rows_without_c_loadtxt(output_file, monkeypatch):
+    # the rows are split at once on numpy versions without a C loadtxt
+    from cp2kdata.block_parser import text_rows
+    from cp2kdata.block_parser.mulliken import get_mulliken_pop_handler
+    from cp2kdata.block_parser.hirshfeld import HIRSHFELD_POP_HANDLER
+    from cp2kdata.block_parser.coordinates import INIT_ATOMIC_COORDINATES_HANDLER
+
+    from cp2kdata import Cp2kOutput
+
+    with open(output_file, "r") as fp:
+        output = fp.read()
+    handlers = [ATOMIC_FORCES_HANDLER, INIT_ATOMIC_COORDINATES_HANDLER,
+                get_mulliken_pop_handler(Cp2kOutput(output_file).dft_info), HIRSHFELD_POP_HANDLER]
+    blocks = scan_blocks(output, handlers)
+    monkeypatch.setattr(text_rows, "C_LOADTXT", False)
+    split_blocks = scan_blocks(output, handlers)
+    np.testing.assert_array_equal(split_blocks["atomic_forces_list"], blocks["atomic_forces_list"])
+    for ref, value in zip(blocks["init_atomic_coordinates"], split_blocks["init_atomic_coordinates"]):
+        np.testing.assert_array_equal(value, ref)
+    for name in ["mulliken_pop_list", "hirshfeld_pop_list"]:
+        if blocks[name] is None:
+            assert split_blocks[name] is None
+            continue
+        for column in ["element", "kind", "alpha", "beta", "net_charge", "spin_moment", "ref_charge"]:
+            ref = getattr(blocks[name], column)
+            if ref is None:
+                assert getattr(split_blocks[name], column) is None
+            else:
+                np.testing.assert_array_equal(getattr(split_blocks[name], column), ref)
+
+
+def test_close_output_mmap():
+    from cp2kdata import Cp2kOutput
+    from cp2kdata.batch import parse_e_f_output, STATUS_OK
+    import mmap
+
+    output_path = "tests/test_energy_force/v8.1/normal/output"
+    with Cp2kOutput(output_path, use_mmap=True) as cp2k_output:
+        output_file = cp2k_output.output_file
+        assert isinstance(output_file, mmap.mmap)
+        energies_list = cp2k_output.energies_list
+    assert output_file.closed
+    # the parsed quantities stay available, the output is mapped again on demand
+    np.testing.assert_array_equal(cp2k_output.energies_list, energies_list)
+    with open(output_path, "r") as fp:
+        atomic_forces_list = parse_atomic_forces_list(fp.read())
+    np.testing.assert_array_equal(cp2k_output.get_block(ATOMIC_FORCES_HANDLER), atomic_forces_list)
+    assert not cp2k_output.output_file.closed
+    cp2k_output.close()
+    assert parse_e_f_output(output_path)["status"] == STATUS_OK
@@ -0,0 +1,53 @@
+from cp2kdata import Cp2kXYZTrajectory
+from cp2kdata.block_parser.md_xyz import parse_pos_xyz, parse_frc_xyz
+import numpy as np
+import pytest
+
+
+xyz_path_list = [
+    "tests/test_dpdata/v7.1/aimd/DPGEN-pos-1.xyz",
+    "tests/test_dpdata/v7.1/aimd/DPGEN-frc-1.xyz",
+    "tests/test_dpdata/v2023.2/aimd_nvt_restart/H2O_restart-vel-1.xyz"
+]
+
+
+@pytest.fixture(params=xyz_path_list, scope='class', ids=xyz_path_list)
+def xyz_path(request):
+    return request.param
+
+
+class TestCp2kXYZTrajectory():
+    def test_frames(self, xyz_path):
+        traj = Cp2kXYZTrajectory(xyz_path)
+        frames = parse_frc_xyz(xyz_path)
+        assert len(traj) == len(frames)
+        assert np.array_equal(traj[0], frames[0])
+        assert np.array_equal(traj[-1], frames[-1])
+        assert np.array_equal(traj[1::3], frames[1::3])
+        assert np.array_equal(traj[[2, 0]], frames[[2, 0]])
+        with pytest.raises(IndexError):
+            traj[len(frames)]
+
+    def test_comment(self):
+        xyz_path = "tests/test_dpdata/v7.1/aimd/DPGEN-pos-1.xyz"
+        traj = Cp2kXYZTrajectory(xyz_path)
+        _, energies_list, chemical_symbols = parse_pos_xyz(xyz_path)
+        assert traj.get_step(0) == 1
+        assert traj.get_energy(5) == energies_list[5]
+        assert traj.chemical_symbols == chemical_symbols
+
+
+def test_frames_of_different_size(tmp_path):
+    # frames do not have the same number of bytes, the offsets are scanned
+    xyz_file = tmp_path/"test-pos-1.xyz"
+    frames = np.arange(18, dtype=float).reshape(3, 2, 3)
+    with open(xyz_file, "w") as fp:
+        for idx, frame in enumerate(frames):
+            fp.write(f"2\n i = {idx*1000}, E = -1.0\n")
+            for xyz in frame:
+                fp.write("H {} {} {}\n".format(*xyz))
+        fp.write("2\n i = 3000, E = -1.0\nH 1.0")
+    traj = Cp2kXYZTrajectory(str(xyz_file))
+    assert len(traj) == 3
+    assert np.array_equal(traj[:], frames)
+    assert traj.get_step(2) == 2000